@@ -0,0 +1,165 @@
+import json
+import os
+import sys
+import threading
+import time
+from generation_worker import CancelToken, stream_chat
+from model_registry import ModelRegistry
+from response_cache import create_response_cache
+from telemetry import GenerationMetrics
+from utility import Utility
+
+
+def read_prompts(path):
+    # One JSON object per line: {"prompt": ..., "id": optional, "system_prompt": optional name, "model": optional}.
+    # A bare JSON string is taken as the prompt. Lines without an id are numbered from 1.
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {'prompt': item}
+            item.setdefault('id', str(line_number))
+            yield item
+
+
+def completed_ids(path):
+    # Prompts that already have a successful result; anything that failed is run again
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by a crash
+            if record.get('status') == "ok":
+                done.add(str(record['id']))
+    return done
+
+
+class BatchRunner:
+    """Runs a file of prompts through the chat pipeline with bounded concurrency, without the GUI.
+
+    Each host gets `concurrency` worker threads, so throughput follows what the Ollama servers allow.
+    Results are appended to the output JSONL as each prompt completes; prompts already recorded as ok
+    are skipped, so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, config_manager, hosts=None, concurrency=4, model=None, system_prompt=None, use_cache=True,
+                 progress=None):
+        self.config_manager = config_manager
+        self.hosts = list(hosts or [None])  # None is the default host (OLLAMA_HOST)
+        self.concurrency = concurrency
+        self.registry = ModelRegistry(config_manager, keep_alive_interval=0)
+        self.model = model
+        self.system_prompt = system_prompt
+        self.cache = create_response_cache(config_manager.get("response_cache", {})) if use_cache else None
+        self.progress = progress  # progress(record, completed, total)
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.stopped = False
+        self.completed = 0
+        self.failed = 0
+
+    def system_prompt_text(self, name):
+        prompts = self.config_manager.get("system_prompts")
+        name = name or self.system_prompt or self.config_manager.get("default_prompt")
+        if name not in prompts:
+            raise KeyError(f"Unknown system prompt '{name}'")
+        return prompts[name]
+
+    def run(self, prompts_path, output_path):
+        done = completed_ids(output_path)
+        pending = [item for item in read_prompts(prompts_path) if str(item['id']) not in done]
+        items = iter(pending)
+        start = time.monotonic()
+        with open(output_path, "a", encoding="utf-8") as output:
+            threads = [threading.Thread(target=self.run_worker, args=(host, items, output, len(pending)),
+                                        name=f"batch-{index}", daemon=True)
+                       for index, host in enumerate(self.hosts * self.concurrency)]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(0.2)  # Short joins keep Ctrl+C responsive
+            except KeyboardInterrupt:
+                self.stop()
+                for thread in threads:
+                    thread.join()
+        return {'skipped': len(done), 'completed': self.completed, 'failed': self.failed,
+                'pending': len(pending) - self.completed - self.failed, 'elapsed': time.monotonic() - start}
+
+    def run_worker(self, host, items, output, total):
+        while not self.stopped:
+            with self.lock:
+                item = next(items, None)
+            if item is None:
+                return
+            record = self.run_prompt(item, host)
+            if record is None:
+                return  # Stopped mid-prompt; left for the next run
+            with self.lock:
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                if record['status'] == "ok":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                if self.progress:
+                    self.progress(record, self.completed + self.failed, total)
+
+    def run_prompt(self, item, host):
+        profile = self.registry.profile("chat")
+        model = item.get('model') or self.model or profile.name
+        metrics = GenerationMetrics("batch", model)
+        token = CancelToken()
+        with self.lock:
+            self.tokens.add(token)
+        record = {'id': item['id'], 'model': model, 'host': host, 'prompt': item['prompt']}
+        try:
+            messages = [{'role': 'system', 'content': self.system_prompt_text(item.get('system_prompt'))},
+                        {'role': 'user', 'content': item['prompt']}]
+            reply = "".join(stream_chat(model, messages, profile.options, token, self.cache,
+                                        keep_alive=profile.keep_alive, metrics=metrics, host=host))
+            record.update({'status': "ok", 'reply': reply, 'code_blocks': Utility.extract_code_blocks(reply)})
+        except Exception as e:
+            if token.cancelled:
+                return None
+            record.update({'status': "error", 'error': f"{type(e).__name__}: {e}"})
+        finally:
+            with self.lock:
+                self.tokens.discard(token)
+        if token.cancelled:
+            return None
+        record.update({'ttft': metrics.first_chunk, 'total': metrics.total,
+                       'tokens_per_second': metrics.tokens_per_second(), 'eval_count': metrics.eval_count,
+                       'cached': metrics.cached, 'completed_at': time.time()})
+        return record
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            tokens = list(self.tokens)
+        for token in tokens:
+            token.cancel()
+
+
+def print_progress(record, completed, total):
+    status = record['status'] if record['status'] == "ok" else f"error: {record['error']}"
+    total_time = f"{record['total']:.1f}s" if record.get('total') is not None else "-"
+    print(f"[{completed}/{total}] {record['id']} {status} {total_time}", file=sys.stderr, flush=True)
+
+
+def run_batch(config_manager, args):
+    runner = BatchRunner(config_manager, hosts=args.host, concurrency=args.concurrency, model=args.model,
+                         system_prompt=args.system_prompt, use_cache=not args.no_cache, progress=print_progress)
+    summary = runner.run(args.batch, args.output)
+    rate = summary['completed'] / summary['elapsed'] if summary['elapsed'] else 0.0
+    print(f"{summary['completed']} ok, {summary['failed']} failed, {summary['skipped']} already done, "
+          f"{summary['pending']} left in {summary['elapsed']:.1f}s ({rate:.2f} prompts/s)", file=sys.stderr)
+    return 0 if summary['failed'] == 0 and summary['pending'] == 0 else 1
@@ -0,0 +1,132 @@
+import argparse
+import heapq
+import threading
+import time
+from token_renderer import TokenRenderer
+
+
+class FakeRoot:
+    """Minimal stand-in for tk.Tk that runs after() callbacks on its own thread."""
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.scheduled = []
+        self.sequence = 0
+        self.callbacks = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.mainloop, daemon=True)
+        self.thread.start()
+
+    def after(self, ms, func, *args):
+        with self.lock:
+            self.sequence += 1
+            heapq.heappush(self.scheduled, (time.perf_counter() + ms / 1000.0, self.sequence, func, args))
+            self.lock.notify()
+            return self.sequence
+
+    def after_cancel(self, after_id):
+        with self.lock:
+            self.scheduled = [entry for entry in self.scheduled if entry[1] != after_id]
+            heapq.heapify(self.scheduled)
+
+    def mainloop(self):
+        while True:
+            with self.lock:
+                while self.running and (not self.scheduled or self.scheduled[0][0] > time.perf_counter()):
+                    timeout = self.scheduled[0][0] - time.perf_counter() if self.scheduled else None
+                    self.lock.wait(timeout)
+                if not self.running:
+                    return
+                _, _, func, args = heapq.heappop(self.scheduled)
+            self.callbacks += 1
+            func(*args)
+
+    def quit(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        self.thread.join()
+
+
+class FakeText:
+    def __init__(self):
+        self.chars = 0
+        self.inserts = 0
+
+    def configure(self, **kwargs):
+        pass
+
+    def insert(self, index, text, tag=None):
+        self.inserts += 1
+        self.chars += len(text)
+
+    def yview(self, *args):
+        pass
+
+
+def fake_stream(reply_chars, token_chars):
+    text = ("lorem ipsum dolor sit amet " * (reply_chars // 27 + 1))[:reply_chars]
+    for i in range(0, len(text), token_chars):
+        yield text[i:i + token_chars]
+
+
+def wait_for(widget, total):
+    while widget.chars < total:
+        time.sleep(0.001)
+
+
+def bench_legacy(reply_chars, token_chars):
+    # The original fetch_response: one after() per character plus a 10 ms sleep
+    root, widget = FakeRoot(), FakeText()
+
+    def update_chat_history(text):
+        widget.configure(state="normal")
+        widget.insert("end", text, "ollama")
+        widget.configure(state="disabled")
+        widget.yview("end")
+
+    start = time.perf_counter()
+    for token in fake_stream(reply_chars, token_chars):
+        for char in token:
+            root.after(0, update_chat_history, char)
+            time.sleep(0.01)
+    wait_for(widget, reply_chars)
+    elapsed = time.perf_counter() - start
+    root.quit()
+    return elapsed, root.callbacks, widget.inserts
+
+
+def bench_renderer(reply_chars, token_chars, fps, typewriter):
+    root, widget = FakeRoot(), FakeText()
+    renderer = TokenRenderer(root, widget, fps=fps, typewriter=typewriter)
+    renderer.start()
+    start = time.perf_counter()
+    for token in fake_stream(reply_chars, token_chars):
+        renderer.push(token)
+    wait_for(widget, reply_chars)
+    elapsed = time.perf_counter() - start
+    renderer.stop()
+    root.quit()
+    return elapsed, renderer.callbacks, widget.inserts
+
+
+def report(label, reply_chars, result):
+    elapsed, callbacks, inserts = result
+    print(f"{label:<22} {reply_chars / elapsed:>12.0f} chars/s {callbacks:>8} callbacks {inserts:>8} inserts {elapsed:>8.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless chat render benchmark")
+    parser.add_argument("--chars", type=int, default=4000, help="Length of the simulated reply")
+    parser.add_argument("--legacy-chars", type=int, default=400, help="Reply length for the slow legacy path")
+    parser.add_argument("--token-chars", type=int, default=4, help="Characters per streamed chunk")
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    report("legacy per-char", args.legacy_chars, bench_legacy(args.legacy_chars, args.token_chars))
+    report("renderer", args.chars, bench_renderer(args.chars, args.token_chars, args.fps, False))
+    report("renderer typewriter", args.chars, bench_renderer(args.chars, args.token_chars, args.fps, True))
+
+
+if __name__ == "__main__":
+    main()
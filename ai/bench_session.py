@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from fake_ollama import FakeOllamaServer, canned_responder, CORRECTED_REPLY
+from telemetry import percentile
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+BROKEN_REPLY = "Try this:\n\n```python\nvalues = [1, 2, 3]\nprint(values[10])\n```\n"
+
+
+def rss_mb():
+    # Current resident set size where /proc is available, otherwise the peak
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else 0.0
+
+
+class Transcript:
+    """on_output sink that counts what the session writes and when the first reply text arrived."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.chars = 0
+        self.first_reply = None
+
+    def write(self, text, tag):
+        with self.lock:
+            self.chars += len(text)
+            if tag == "ollama" and text.strip() and self.first_reply is None:
+                self.first_reply = time.perf_counter()
+
+    def reset(self):
+        with self.lock:
+            self.chars = 0
+            self.first_reply = None
+
+
+INCREMENTAL = {"enabled": True}
+
+
+def make_session(workdir, transcript, on_code=None):
+    # Imported here so ollama's module-level client picks up OLLAMA_HOST pointing at the fake server
+    from config_manager import ConfigManager
+    from chat_session import ChatSession
+    config_manager = ConfigManager(os.path.join(workdir, "config.json"), debounce=60)
+    config_manager.set("response_cache", {"enabled": False})
+    config_manager.set("metrics", {"enabled": True, "file": os.path.join(workdir, "metrics.jsonl")})
+    config_manager.set("model_summaries", False)
+    config_manager.set("session_store", {"enabled": True, "path": os.path.join(workdir, "sessions.db")})
+    config_manager.set("keep_alive_interval", 0)
+    config_manager.set("incremental_context", INCREMENTAL)
+    config_manager.set("code_execution", {"workers": 2, "timeout": 10, "memory_mb": 1024, "cpu_seconds": 10})
+    session = ChatSession(config_manager, on_output=transcript.write, on_code=on_code)
+    # One untimed turn, so worker process start-up and the first connection are not part of the numbers
+    session.send("Hello.").wait()
+    session.conversation_history.clear()
+    transcript.reset()
+    return session
+
+
+def bench_long_session(fake, workdir, turns):
+    transcript = Transcript()
+    session = make_session(workdir, transcript)
+    fake.respond = canned_responder()
+    latencies = []
+    with fake.lock:
+        fake.prompt_chars = fake.evaluated_chars = 0
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    for turn in range(turns):
+        sent = time.perf_counter()
+        session.send(f"Question {turn}: tell me something about Python.").wait()
+        latencies.append(time.perf_counter() - sent)
+    elapsed = time.perf_counter() - start
+    result = {
+        'turns': turns,
+        'turns_per_second': turns / elapsed,
+        'chars_per_second': transcript.chars / elapsed,
+        'latency_p50': percentile(sorted(latencies), 0.5),
+        'latency_p95': percentile(sorted(latencies), 0.95),
+        'history_messages': len(session.conversation_history.messages),
+        'prefill_share': fake.evaluated_chars / max(1, fake.prompt_chars),  # Of the prompts sent, the part evaluated
+        'rss_growth_mb': rss_mb() - rss_start,
+    }
+    session.shutdown()
+    return result
+
+
+def bench_large_reply(fake, workdir, tokens):
+    transcript = Transcript()
+    session = make_session(workdir, transcript)
+    reply = " ".join(f"word{index}" for index in range(tokens))
+    fake.respond = lambda model, messages: reply
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    session.send("Write a very long answer.").wait()
+    elapsed = time.perf_counter() - start
+    result = {
+        'tokens': tokens,
+        'first_token': transcript.first_reply - start if transcript.first_reply else None,
+        'tokens_per_second': tokens / elapsed,
+        'total': elapsed,
+        'rss_growth_mb': rss_mb() - rss_start,
+    }
+    session.shutdown()
+    return result
+
+
+def bench_correction_loop(fake, workdir, rounds):
+    # Each round: a reply with failing code, a run, a parallel correction round, and a run of the fix
+    transcript = Transcript()
+    fixed = threading.Event()
+
+    def on_code(code, attempt):
+        if session.execute_code(code, attempt).ok:
+            fixed.set()
+
+    session = make_session(workdir, transcript, on_code)
+
+    def respond(model, messages):
+        last = messages[-1]['content']
+        return CORRECTED_REPLY if "produced an error" in last else BROKEN_REPLY
+    fake.respond = respond
+    durations = []
+    for round_number in range(rounds):
+        fixed.clear()
+        start = time.perf_counter()
+        session.send(f"Show me list indexing ({round_number}).")
+        if not fixed.wait(60):
+            break
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    result = {
+        'rounds': len(durations),
+        'time_to_fix_p50': percentile(durations, 0.5),
+        'time_to_fix_max': durations[-1] if durations else None,
+    }
+    session.shutdown()
+    return result
+
+
+def report(name, result):
+    values = ", ".join(f"{key} {value:.3f}" if isinstance(value, float) else f"{key} {value}" for key, value in result.items())
+    print(f"{name:<16} {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless end-to-end chat benchmarks against a local fake Ollama server")
+    parser.add_argument("--rate", type=float, default=2000, help="Fake server tokens per second")
+    parser.add_argument("--latency", type=float, default=0.01, help="Fake server seconds before the first token")
+    parser.add_argument("--prefill-rate", type=float, default=20000, help="Fake server prompt tokens evaluated per second")
+    parser.add_argument("--no-incremental", action="store_true", help="Turn off incremental_context, for comparison")
+    parser.add_argument("--turns", type=int, default=200, help="Turns in the long session")
+    parser.add_argument("--tokens", type=int, default=20000, help="Tokens in the large reply")
+    parser.add_argument("--rounds", type=int, default=5, help="Correction loop rounds")
+    parser.add_argument("--json", help="Also write the results to this file, for comparing runs")
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+    INCREMENTAL["enabled"] = not args.no_incremental
+
+    fake = FakeOllamaServer(tokens_per_second=args.rate, latency=args.latency, prefill_rate=args.prefill_rate).start()
+    os.environ["OLLAMA_HOST"] = fake.url
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # errors/, tool_env/ and similar directories stay out of the source tree
+        results['long_session'] = bench_long_session(fake, workdir, args.turns)
+        results['large_reply'] = bench_large_reply(fake, workdir, args.tokens)
+        results['correction_loop'] = bench_correction_loop(fake, workdir, args.rounds)
+    fake.stop()
+    for name, result in results.items():
+        report(name, result)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+import queue
+import threading
+from utility import Utility
+from code_fences import FenceParser
+from generation_worker import GenerationPool, GenerationRequest, CancelToken
+from correction_engine import CorrectionEngine
+from response_cache import create_response_cache
+from context_window import ContextWindow
+from model_registry import ModelRegistry
+from telemetry import Telemetry
+from code_runner import ExecutionPool
+from output_stream import OutputThrottle, DirectOutput
+from session_store import create_session_store
+from tool_environment import create_tool_environment
+from error_journal import create_error_journal
+from tool_runtime import create_tool_runtime
+
+REPLY_TAGS = {"text": "ollama", "code": "code", "fence": "fence"}  # FenceParser kinds -> transcript tags
+
+
+def message_parts(role, content):
+    # A stored message as the (text, tag) runs it was shown with
+    if role == 'user':
+        return [(f"You: {content}\n", "user")]
+    parser = FenceParser()
+    segments = parser.feed(content) + parser.finish()
+    return [(text, REPLY_TAGS[kind]) for text, kind in segments] + [("\n", "ollama")]
+
+
+class SessionServices:
+    """Everything chat sessions share: models, telemetry, caches, storage, the code pool and the generation pool."""
+
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+        self.model_registry = ModelRegistry(self.config_manager, self.config_manager.get("keep_alive_interval", 240))
+        self.telemetry = self.create_telemetry()
+        self.response_cache = create_response_cache(self.config_manager.get("response_cache", {}))
+        self.store = create_session_store(self.config_manager.get("session_store", {}))
+        self.retriever = self.create_retriever()  # None unless enabled
+        self.error_journal = create_error_journal(self.config_manager.get("error_journal", {}))  # None when disabled
+        self.tool_environment = create_tool_environment(self.config_manager.get("dependencies", {}))  # None when disabled
+        self.tool_runtime = create_tool_runtime(self.config_manager.get("tool_runtime", {}))  # HTTP shared by executed code
+        execution_config = self.config_manager.get("code_execution", {})
+        self.execution_pool = ExecutionPool(size=execution_config.get("workers", 2),
+                                            timeout=execution_config.get("timeout", 30),
+                                            memory_mb=execution_config.get("memory_mb", 2048),
+                                            cpu_seconds=execution_config.get("cpu_seconds", 30),
+                                            site_packages=self.site_packages(), runtime=self.tool_runtime)
+        correction_config = self.config_manager.get("correction", {})
+        self.correction_engine = CorrectionEngine(registry=self.model_registry,
+                                                  cache=self.response_cache, telemetry=self.telemetry,
+                                                  candidates=correction_config.get("candidates", 3),
+                                                  temperatures=correction_config.get("temperatures", [0.2, 0.6, 1.0]),
+                                                  dry_run=correction_config.get("dry_run", True),
+                                                  dry_run_timeout=correction_config.get("dry_run_timeout", 5),
+                                                  memory_mb=execution_config.get("memory_mb", 2048),
+                                                  site_packages=self.site_packages())
+        # Concurrent generations across all sessions; each session still gets its replies one at a time
+        self.generation_pool = GenerationPool(workers=self.config_manager.get("generation_workers", 2),
+                                              cache=self.response_cache, telemetry=self.telemetry)
+
+    def create_retriever(self):
+        retrieval_config = self.config_manager.get("retrieval", {})
+        if not retrieval_config.get("enabled", False):
+            return None
+        from embedding_index import create_retriever  # Brings in NumPy, so only when retrieval is on
+        return create_retriever(retrieval_config)
+
+    def site_packages(self):
+        return self.tool_environment.site_packages if self.tool_environment is not None else None
+
+    def create_telemetry(self):
+        metrics_config = self.config_manager.get("metrics", {})
+        path = metrics_config.get("file", "metrics/metrics.jsonl") if metrics_config.get("enabled", True) else None
+        return Telemetry(path, max_bytes=metrics_config.get("max_mb", 5) * 1024 * 1024,
+                         backups=metrics_config.get("backups", 3))
+
+    def warm_up(self):
+        self.model_registry.warm_up()
+        self.model_registry.start_keep_alive()
+
+    def shutdown(self):
+        self.model_registry.stop()
+        self.generation_pool.shutdown()
+        self.execution_pool.shutdown()
+        self.correction_engine.shutdown()
+        if self.tool_runtime is not None:
+            self.tool_runtime.close()
+        self.telemetry.close()
+        if self.store is not None:
+            self.store.close()
+        if self.retriever is not None:
+            self.retriever.close()
+        if self.error_journal is not None:
+            self.error_journal.close()
+
+
+class ChatSession:
+    """The conversation engine behind one chat: history, generation, code runs and corrections.
+
+    Nothing here touches Tk. A front end supplies callbacks, all of which may be called from worker threads:
+    on_output(text, tag) receives transcript text, with reply code tagged "code" and its fences "fence";
+    on_code(code, attempt) is told about each Python block as soon as it closes; on_source(source) receives each code run's output stream (an OutputThrottle with
+    take()). Without on_source, code output goes straight to on_output. Sessions created with the same
+    services share models, caches and pools; without services a session gets its own.
+    """
+
+    def __init__(self, config_manager, on_output=None, on_code=None, on_source=None, services=None, prompt_name=None):
+        self.config_manager = config_manager
+        self.on_output = on_output or (lambda text, tag: None)
+        self.on_code = on_code
+        self.on_source = on_source
+        self.owns_services = services is None
+        self.services = services or SessionServices(config_manager)
+        self.prompt_name = prompt_name  # This session's system prompt; None follows the configured default
+        self.correction_tokens = set()
+        self.run_ids = set()  # This session's runs in the shared execution pool
+        self.runs_lock = threading.Lock()
+        self.fences = None  # FenceParser for the reply being generated
+        self.model_registry = self.services.model_registry
+        self.telemetry = self.services.telemetry
+        self.response_cache = self.services.response_cache
+        self.store = self.services.store
+        self.retriever = self.services.retriever
+        self.execution_pool = self.services.execution_pool
+        self.tool_environment = self.services.tool_environment
+        self.error_journal = self.services.error_journal
+        self.proposed_fixes = {}  # Fixed code offered to run -> (error signature, failing code, whether it was a known fix)
+        self.correction_engine = self.services.correction_engine
+        refiner = self.model_registry.summary_refiner if self.config_manager.get("model_summaries", True) else None
+        incremental_config = self.config_manager.get("incremental_context", {})
+        self.incremental = incremental_config.get("enabled", True)  # Keep the prompt's start stable between turns
+        self.conversation_history = ContextWindow(summary_tokens=self.config_manager.get("summary_tokens", 512),
+                                                  refiner=refiner,
+                                                  fold_target=incremental_config.get("fold_target", 0.75) if self.incremental else 1.0,
+                                                  hold_refinements=self.incremental)
+        self.session_id = None  # Stored session the conversation is saved to; started by the first message
+        self.record_lock = threading.Lock()
+        self.generation_worker = self.services.generation_pool.lane(
+            max_pending=self.config_manager.get("generation_queue_size", 4),
+            supersede=self.config_manager.get("supersede_generation", False))
+
+    def warm_up(self):
+        self.services.warm_up()
+
+    def system_prompt(self):
+        prompts = self.config_manager.get("system_prompts")
+        return prompts.get(self.prompt_name or self.config_manager.get("default_prompt"), "Default")
+
+    def send(self, user_message, use_cache=True):
+        # Raises queue.Full when too many messages are already waiting for a reply
+        profile = self.model_registry.profile("chat")
+        # The message is embedded for recall while the request waits its turn, off the generation thread
+        query = self.retriever.prepare(user_message) if self.retriever is not None else None
+        request = GenerationRequest(lambda: self.build_messages(user_message, query), model=profile.name,
+                                    options=profile.options,
+                                    on_chunk=self.on_reply_chunk,
+                                    on_done=self.on_reply_done,
+                                    on_error=self.on_reply_error,
+                                    use_cache=use_cache,
+                                    keep_alive=profile.keep_alive)
+        if not self.generation_worker.has_room():
+            raise queue.Full
+        # Shown and saved before the request can start, so the reply (a cache replay can finish at once)
+        # always comes after it, and the session is started by the user's message on this thread
+        self.on_output(f"You: {user_message}\n", "user")
+        self.record_message('user', user_message)
+        self.generation_worker.submit(request)
+        return request
+
+    def record_message(self, role, content):
+        # Called from the sending thread and the generation thread
+        with self.record_lock:
+            if self.store is not None:
+                if self.session_id is None:
+                    self.session_id = self.store.start_session(content.strip().split("\n")[0])
+                self.store.add_message(self.session_id, role, content)
+            if self.retriever is not None:
+                self.retriever.add(self.session_id, role, content)
+
+    def new_session(self):
+        self.stop()
+        self.conversation_history.clear()
+        self.session_id = None
+
+    def open_session(self, session_id, limit=50):
+        # Only the newest messages are loaded; earlier_messages() pages back through the rest
+        self.stop()
+        self.store.flush()
+        messages = self.store.messages(session_id, limit=limit)
+        self.conversation_history.clear()
+        for _, role, content, _ in messages:
+            self.conversation_history.append(role, content)
+        self.session_id = session_id
+        return messages
+
+    def earlier_messages(self, before_id, limit=50):
+        if self.store is None or self.session_id is None:
+            return []
+        return self.store.messages(self.session_id, before_id, limit)
+
+    # The build_messages/on_reply_* callbacks run on the generation worker thread, one request at a time,
+    # so conversation_history is never touched by two generations at once
+    def build_messages(self, user_message, query=None):
+        # The user message is part of the history, so it is sent exactly once. query is the Future of its
+        # embedding from Retriever.prepare(); recall is skipped for this turn if it is not done yet.
+        self.conversation_history.append('user', user_message)
+        self.fences = FenceParser(on_block=self.on_code_block)
+        system_prompt = self.system_prompt()
+        recalled = self.retriever.context_for(user_message, self.session_id, query) if self.retriever is not None else ""
+        if recalled and not self.incremental:
+            system_prompt = f"{system_prompt}\n\n{recalled}"
+        budget = self.model_registry.context_budget("chat")
+        if self.incremental and self.retriever is not None:
+            budget -= self.retriever.token_budget  # Room for recalled messages, which are outside the history
+        messages = self.conversation_history.build(system_prompt, budget)
+        if recalled and self.incremental:
+            # Next to the new message rather than in the system prompt, so the rest of the prompt is unchanged
+            # from the last turn and the model only has to evaluate what follows it
+            messages.insert(len(messages) - 1, {'role': 'system', 'content': recalled})
+        return messages
+
+    def on_reply_chunk(self, text):
+        for segment, kind in self.fences.feed(text):
+            self.on_output(segment, REPLY_TAGS[kind])
+
+    def on_code_block(self, block):
+        # Offered as soon as the closing fence arrives, while the rest of the reply is still streaming
+        if block.is_python and block.code.strip() and self.on_code:
+            self.on_code(block.code.strip(), 1)
+
+    def on_reply_done(self, full_reply, cancelled):
+        if self.fences is not None:
+            # Text held back at the end, and a block left open by a reply that was not stopped
+            for segment, kind in self.fences.finish(emit_open_block=not cancelled):
+                self.on_output(segment, REPLY_TAGS[kind])
+            self.fences = None
+        if cancelled:
+            self.on_output("\n[stopped]\n", "error")
+            if not full_reply:
+                return
+        else:
+            self.on_output("\n", "ollama")
+
+        self.conversation_history.append('assistant', full_reply)
+        self.record_message('assistant', full_reply)
+
+    def on_reply_error(self, error):
+        self.on_output(f"Error: {str(error)}\n", "error")
+
+    def track_error(self, result, code, attempt):
+        # Returns the error's signature, or None without a journal
+        if self.error_journal is None:
+            return None
+        return self.error_journal.record(result, code, attempt, self.session_id)
+
+    def apply_known_fix(self, signature, code, attempt):
+        # A recurring error gets the fix that resolved it last time, without another round of corrections
+        if self.error_journal is None or signature is None:
+            return False
+        fixed = self.error_journal.known_fix(signature, code)
+        if fixed is None:
+            return False
+        self.propose_fix(fixed, signature, code, known=True)
+        self.on_output(f"Applying the fix that resolved this error before (Attempt {attempt}):\n", "ollama")
+        if self.on_code:
+            self.on_code(fixed, attempt)
+        return True
+
+    def propose_fix(self, fixed, signature, code, known=False):
+        # Remembered until the fixed code runs: if it succeeds, it becomes the known fix for signature
+        self.proposed_fixes.pop(fixed, None)
+        self.proposed_fixes[fixed] = (signature, code, known)
+        while len(self.proposed_fixes) > 50:
+            del self.proposed_fixes[next(iter(self.proposed_fixes))]
+
+    def execute_code(self, code, attempt=1):
+        # Blocks the calling thread. Runs in a pool worker process with its own namespace, so a runaway
+        # snippet cannot take the app down; stdout/stderr stream out line by line as it runs.
+        # Every missing import is installed before the run, rather than one per failed run
+        if self.tool_environment is not None:
+            self.tool_environment.resolve(code, log=lambda text: self.on_output(text, "result"))
+        output = self.start_output_stream()
+        run_ids = []
+
+        def started(run_id):
+            with self.runs_lock:
+                self.run_ids.add(run_id)
+            run_ids.append(run_id)
+        try:
+            result = self.execution_pool.run(code, on_output=output.feed, on_start=started)
+        finally:
+            with self.runs_lock:
+                self.run_ids.difference_update(run_ids)
+        if self.store is not None and self.session_id is not None:
+            self.store.add_code_run(self.session_id, code, attempt, result)
+        proposal = self.proposed_fixes.pop(code, None)
+        if result.ok:
+            output.close()
+            if proposal is not None and proposal[0] is not None:
+                self.error_journal.record_fix(proposal[0], proposal[1], code)
+        elif result.error_type == 'ModuleNotFoundError' and result.module_name:
+            # Imports the scan could not see, such as ones built at runtime
+            package_name = result.module_name.split(".")[0]
+            output.write(f"Package '{package_name}' not found. Attempting to install...\n", "error")
+            output.close()
+            if self.install_package(package_name):
+                return self.execute_code(code, attempt)  # Retry executing the code after installation
+            self.handle_missing_package(package_name, code)
+        elif result.killed or result.timed_out or result.error_type in ('CPULimitExceeded', 'WorkerCrashed'):
+            output.write(f"{result.error_message}\n", "error")
+            output.close()
+        else:
+            output.write(f"Error executing code: {result.error_message}\n", "error")
+            output.close()
+            signature = self.track_error(result, code, attempt)
+            if proposal is not None and proposal[2] and proposal[0] == signature:
+                self.error_journal.forget_fix(signature)  # The known fix no longer resolves it
+            if attempt < self.max_correction_attempts():
+                if not self.apply_known_fix(signature, code, attempt + 1):
+                    self.correct_code(code, result.error_message, result.line_number, attempt + 1, (signature, code))
+            else:
+                self.on_output("Maximum attempts reached. Could not correct the code.\n", "error")
+        return result
+
+    def start_output_stream(self, header="Result:\n", lazy_header=False):
+        if self.on_source is None:
+            return DirectOutput(self.on_output, header, lazy_header)
+        output_config = self.config_manager.get("code_output", {})
+        output = OutputThrottle(lines_per_second=output_config.get("lines_per_second", 200),
+                                max_pending=output_config.get("max_pending_lines", 500),
+                                max_lines=output_config.get("max_lines", 2000),
+                                header=header if lazy_header else None)
+        if not lazy_header:
+            self.on_output(header, "result")
+        self.on_source(output)
+        return output
+
+    def correct_code(self, code, error_message, line_number, attempt, origin=None):
+        # origin is (signature, code) of the run that first failed, which a winning fix is recorded against
+        correction_prompt = f"The following code produced an error on line {line_number}:\n\n```python\n{code}\n```\nError message: {error_message}\n\nPlease provide a corrected version of the code."
+        self.fetch_corrected_code(correction_prompt, attempt, origin)
+
+    def fetch_corrected_code(self, correction_prompt, attempt, origin=None):
+        # Several candidate fixes are generated in parallel; the first that compiles and survives a sandboxed dry run wins
+        system_message = {'role': 'system', 'content': self.system_prompt()}
+        messages = [system_message, {'role': 'user', 'content': correction_prompt}]
+        token = CancelToken()
+        self.correction_tokens.add(token)
+        try:
+            winner, candidates = self.correction_engine.correct(messages, token, attempt)
+        except Exception as e:
+            self.on_output(f"Error: {str(e)}\n", "error")
+            return
+        finally:
+            self.correction_tokens.discard(token)
+        if token.cancelled:
+            return
+        if winner:
+            checked = f"{winner.reason}" if winner.unverified else f"checked in {winner.duration:.1f}s"
+            self.on_output(f"AI provided a corrected code (Attempt {attempt}, candidate {winner.index + 1} of {len(candidates)}, {checked}):\n", "ollama")
+            if origin is not None:
+                self.propose_fix(winner.code, *origin)
+            if self.on_code:
+                self.on_code(winner.code, attempt)
+            return
+        reasons = "\n".join(f"  Candidate {candidate.index + 1}: {candidate.reason}" for candidate in candidates)
+        self.on_output(f"AI failed to provide a corrected code that passes checks (Attempt {attempt}):\n{reasons}\n", "error")
+        # A candidate that failed its dry run seeds the next round with its own error
+        retry = next((candidate for candidate in candidates if candidate.error is not None), None)
+        if retry and attempt < self.max_correction_attempts():
+            self.correct_code(retry.code, retry.error.error_message, retry.error.line_number, attempt + 1, origin)
+
+    def max_correction_attempts(self):
+        return self.config_manager.get("correction", {}).get("max_attempts", 5)
+
+    def install_package(self, module):
+        if self.tool_environment is None:
+            return Utility.install_package(module)
+        installed, _ = self.tool_environment.install([self.tool_environment.package_for(module)])
+        return bool(installed)
+
+    def handle_missing_package(self, package_name, code):
+        correction_prompt = f"The package '{package_name}' could not be found. Please provide an alternative package or a different approach to achieve the same functionality.\n\nHere is the code that requires the package:\n\n```python\n{code}\n```"
+        self.fetch_corrected_code(correction_prompt, attempt=1)
+
+    def kill_running_code(self):
+        # Only this session's runs: the pool is shared with every other tab
+        with self.runs_lock:
+            run_ids = list(self.run_ids)
+        return sum(1 for run_id in run_ids if self.execution_pool.kill(run_id))
+
+    def stop(self):
+        # Stops the reply in progress, every queued message and any correction round
+        self.generation_worker.cancel_all()
+        for token in list(self.correction_tokens):
+            token.cancel()
+
+    def shutdown(self):
+        # Closes this session; shared services are shut down by whoever created them
+        self.stop()
+        self.generation_worker.shutdown()
+        if self.owns_services:
+            self.services.shutdown()
@@ -0,0 +1,111 @@
+import tkinter as tk
+from tkinter import scrolledtext
+from token_renderer import TokenRenderer
+from syntax_highlight import CodeHighlighter
+from transcript import Transcript, TranscriptView
+from chat_session import ChatSession, message_parts
+
+
+class ChatTab:
+    """One chat in the window's notebook: its transcript widget, renderer and ChatSession.
+
+    Sessions of all tabs share the app's SessionServices, so their replies take turns on one generation
+    pool. Only the visible tab's renderer runs; a hidden tab keeps buffering text off the Tk thread and
+    draws the backlog, max_frame_chars per frame, once it is shown again.
+    """
+
+    def __init__(self, app, services, title="Chat", prompt_name=None):
+        self.root = app.root
+        self.config_manager = app.config_manager
+        self.title = self.default_title = title
+        self.named = False  # Whether the title has been taken from the first message
+        self.earliest_message_id = None  # Oldest stored message shown from a reopened session
+        self.frame = tk.Frame(app.notebook, bg=self.config_manager.get("background_color"))
+        self.chat_history = scrolledtext.ScrolledText(self.frame, wrap=tk.WORD, state=tk.DISABLED, font=('Courier', self.config_manager.get("font_size")),
+                                                      bg=self.config_manager.get("background_color"), fg=self.config_manager.get("foreground_color"))
+        self.chat_history.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
+        self.chat_history.tag_configure("user", foreground="#7289DA")
+        self.chat_history.tag_configure("ollama", foreground="#99AAB5")
+        self.chat_history.tag_configure("error", foreground="#FF5555")
+        self.chat_history.tag_configure("result", foreground="#00FF00")
+        self.chat_history.tag_configure("code", foreground="#F8F8F2", background="#1E2124")
+        self.chat_history.tag_configure("fence", foreground="#72767D", background="#1E2124")
+        self.chat_history.tag_configure("search_match", background="#7289DA")
+
+        self.highlighter = CodeHighlighter(self.chat_history) if self.config_manager.get("highlight_code", True) else None
+        self.transcript = Transcript(self.config_manager.get("transcript_max_entries", 10000))
+        self.transcript_view = TranscriptView(self.root, self.chat_history, self.transcript,
+                                              max_lines=self.config_manager.get("transcript_max_lines", 3000),
+                                              highlighter=self.highlighter, on_top=self.load_earlier_messages)
+        self.renderer = TokenRenderer(self.root, self.chat_history,
+                                      fps=self.config_manager.get("render_fps", 30),
+                                      typewriter=self.config_manager.get("typewriter", False),
+                                      typewriter_cps=self.config_manager.get("typewriter_cps", 400),
+                                      on_insert=self.transcript_view.on_insert,
+                                      max_frame_chars=self.config_manager.get("render_max_frame_chars", 20000))
+        # Everything except the widgets lives in the session; its callbacks arrive on worker threads
+        self.session = ChatSession(self.config_manager, on_output=self.renderer.push,
+                                   on_code=lambda code, attempt: self.root.after(0, app.prompt_code_execution, self, code, attempt),
+                                   on_source=self.renderer.add_source,
+                                   services=services, prompt_name=prompt_name)
+
+    def show(self):
+        self.renderer.start()
+
+    def hide(self):
+        self.renderer.stop()
+
+    def name_after(self, message):
+        # The first message names the tab, as it names the stored session
+        if self.named:
+            return False
+        self.named = True
+        self.title = " ".join(message.split())[:24] or self.title
+        return True
+
+    def clear(self):
+        self.renderer.clear()
+        self.transcript_view.clear()
+        self.earliest_message_id = None
+        self.chat_history.configure(state=tk.NORMAL)
+        self.chat_history.delete("1.0", tk.END)
+        self.chat_history.configure(state=tk.DISABLED)
+
+    def new_session(self):
+        self.session.new_session()
+        self.title, self.named = self.default_title, False
+        self.clear()
+
+    def open_stored_session(self, session_id, title):
+        self.clear()
+        self.title, self.named = title[:24], True
+        messages = self.session.open_session(session_id, limit=self.config_manager.get("session_store", {}).get("page_size", 50))
+        self.show_stored_messages(messages)
+
+    def load_earlier_messages(self):
+        # Scrolled to the top of a reopened session: page in the stored messages before the oldest one shown
+        if self.earliest_message_id is None:
+            return
+        messages = self.session.earlier_messages(self.earliest_message_id,
+                                                 self.config_manager.get("session_store", {}).get("page_size", 50))
+        if not messages:
+            self.earliest_message_id = None
+            return
+        self.show_stored_messages(messages)
+
+    def show_stored_messages(self, messages):
+        if not messages:
+            return
+        self.earliest_message_id = messages[0][0]
+        self.transcript.prepend([message_parts(role, content) for _, role, content, _ in messages])
+        while self.transcript_view.has_older():
+            self.transcript_view.load_older()
+
+    def update_styles(self):
+        self.frame.configure(bg=self.config_manager.get("background_color"))
+        self.chat_history.configure(font=('Courier', self.config_manager.get("font_size")), fg=self.config_manager.get("foreground_color"), bg=self.config_manager.get("background_color"))
+
+    def close(self):
+        self.renderer.stop()
+        self.session.shutdown()
+        self.frame.destroy()
@@ -0,0 +1,146 @@
+import ast
+
+PYTHON_LANGUAGES = ("python", "py", "python3")
+
+
+class CodeBlock:
+    def __init__(self, index, language, code, closed=True):
+        self.index = index  # Position among the blocks of one reply, from 0
+        self.language = language  # The fence's info string, lower-cased; "" for an untagged block
+        self.code = code
+        self.closed = closed  # False for a block the reply ended inside of
+
+    @property
+    def is_python(self):
+        # Untagged blocks count when they parse, so shell transcripts and plain output are left alone
+        if self.language in PYTHON_LANGUAGES:
+            return True
+        if self.language or not self.code.strip():
+            return False
+        try:
+            ast.parse(self.code)
+        except SyntaxError:
+            return False
+        return True
+
+
+class FenceParser:
+    """Splits streamed Markdown into prose, fence lines and code as chunks arrive.
+
+    feed(chunk) returns [(text, kind)] with kind "text", "fence" or "code", in order, and calls
+    on_block(CodeBlock) as soon as a block's closing fence arrives. Work per chunk is proportional to the
+    chunk: only a line that might still turn out to be a fence (up to three spaces and backticks) is
+    held back until enough of it has arrived to decide.
+    """
+
+    def __init__(self, on_block=None):
+        self.on_block = on_block
+        self.in_code = False
+        self.fence = ""  # The opening fence's backticks; the closing fence must be at least as long
+        self.language = ""
+        self.code_parts = []
+        self.held = ""  # Start of a line that may be a fence
+        self.fence_line = False  # held is a fence line waiting for its newline
+        self.line_start = True
+        self.blocks = []
+
+    def feed(self, chunk):
+        segments = []
+        position = 0
+        while position < len(chunk):
+            if self.fence_line:
+                newline = chunk.find("\n", position)
+                if newline < 0:
+                    self.held += chunk[position:]
+                    break
+                self.held += chunk[position:newline + 1]
+                position = newline + 1
+                self.finish_fence_line(segments)
+            elif self.line_start or self.held:
+                position = self.feed_line_start(chunk, position, segments)
+            else:
+                newline = chunk.find("\n", position)
+                end = len(chunk) if newline < 0 else newline + 1
+                self.emit(chunk[position:end], segments)
+                self.line_start = newline >= 0
+                position = end
+        return segments
+
+    def feed_line_start(self, chunk, position, segments):
+        # Look at one character at a time only while the line could still be a fence
+        while position < len(chunk):
+            self.held += chunk[position]
+            position += 1
+            stripped = self.held.lstrip(" ")
+            indent = len(self.held) - len(stripped)
+            if indent > 3 or (stripped and not "```".startswith(stripped[:3])):
+                text, self.held = self.held, ""
+                self.emit(text, segments)
+                self.line_start = text.endswith("\n")
+                return position
+            if stripped.startswith("```"):
+                self.fence_line = True
+                return position
+        return position
+
+    def finish_fence_line(self, segments):
+        line, self.held = self.held, ""
+        self.fence_line = False
+        self.line_start = True
+        stripped = line.strip()
+        backticks = len(stripped) - len(stripped.lstrip("`"))
+        info = stripped[backticks:].strip()
+        if not self.in_code:
+            self.in_code = True
+            self.fence = "`" * backticks
+            self.language = info.split()[0].lower() if info else ""
+            self.code_parts = []
+            segments.append((line, "fence"))
+        elif backticks >= len(self.fence) and not info:
+            self.in_code = False
+            segments.append((line, "fence"))
+            self.close_block(True)
+        else:
+            self.emit(line, segments)  # A shorter fence or one with text after it is part of the code
+
+    def emit(self, text, segments):
+        if not text:
+            return
+        kind = "code" if self.in_code else "text"
+        if self.in_code:
+            self.code_parts.append(text)
+        if segments and segments[-1][1] == kind:
+            segments[-1] = (segments[-1][0] + text, kind)
+        else:
+            segments.append((text, kind))
+
+    def close_block(self, closed):
+        code = "".join(self.code_parts)
+        if code.endswith("\n"):
+            code = code[:-1]
+        block = CodeBlock(len(self.blocks), self.language, code, closed)
+        self.blocks.append(block)
+        self.code_parts = []
+        if self.on_block:
+            self.on_block(block)
+
+    def finish(self, emit_open_block=True):
+        # End of the reply: releases held text and, optionally, reports a block that was never closed
+        segments = []
+        if self.fence_line:
+            self.finish_fence_line(segments)  # A closing fence at the very end has no newline
+        elif self.held:
+            held, self.held = self.held, ""
+            self.emit(held, segments)
+        if self.in_code:
+            self.in_code = False
+            if emit_open_block:
+                self.close_block(False)
+        return segments
+
+    @classmethod
+    def parse(cls, text):
+        parser = cls()
+        parser.feed(text)
+        parser.finish()
+        return parser.blocks
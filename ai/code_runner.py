@@ -0,0 +1,457 @@
+import contextlib
+import importlib
+import io
+import os
+import itertools
+import multiprocessing
+import queue
+import shutil
+import signal
+import site
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from tool_runtime import RuntimeClient
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; runs there only get the wall-clock timeout
+    resource = None
+
+
+SNIPPET_FILENAME = "<snippet>"
+
+
+def apply_memory_limit(memory_mb):
+    if resource is None or not memory_mb:
+        return
+    limit = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def apply_cpu_limit(cpu_seconds):
+    # RLIMIT_CPU counts the whole life of the process, so each run gets its budget on top of what is used
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if not cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    soft = used + int(cpu_seconds)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def describe_error(error):
+    frames = [frame for frame in traceback.extract_tb(error.__traceback__) if frame.filename == SNIPPET_FILENAME]
+    line_number = frames[-1].lineno if frames else getattr(error, "lineno", None)
+    return {
+        'type': type(error).__name__,
+        'message': str(error),
+        'module': getattr(error, "name", None) if isinstance(error, ModuleNotFoundError) else None,
+        'line': line_number,
+        'traceback': "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+    }
+
+
+class SandboxBlocked(PermissionError):
+    """Raised in a sandboxed run by anything the sandbox does not allow: network access and new processes."""
+
+
+sandbox_state = {'blocked': 0}  # Times the sandbox refused something in this worker, wrapped errors included
+
+
+def apply_sandbox():
+    # For dry runs of generated code nobody has read yet. This catches what such code does by accident,
+    # like fetching a URL or shelling out; it does not hold back code written to get around it.
+    import socket
+    import subprocess
+
+    def no_network(*args, **kwargs):
+        sandbox_state['blocked'] += 1
+        raise SandboxBlocked("Network access is not available in a sandboxed run")
+
+    def no_processes(*args, **kwargs):
+        sandbox_state['blocked'] += 1
+        raise SandboxBlocked("Starting processes is not available in a sandboxed run")
+    for name in ("connect", "connect_ex", "bind", "sendto"):
+        setattr(socket.socket, name, no_network)
+    socket.getaddrinfo = socket.create_connection = no_network
+    subprocess.Popen._execute_child = no_processes
+    os.system = no_processes
+    for name in ("execv", "execve", "execvp", "execvpe", "fork", "forkpty", "posix_spawn", "posix_spawnp",
+                 "spawnv", "spawnve", "spawnvp", "spawnvpe"):
+        if hasattr(os, name):
+            setattr(os, name, no_processes)
+
+
+@contextlib.contextmanager
+def scratch_directory():
+    # A sandboxed run works in an empty directory of its own, removed afterwards
+    previous = os.getcwd()
+    directory = tempfile.mkdtemp(prefix="sandbox-")
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class ConnectionSender:
+    """Serialises messages from the snippet's threads and the flusher onto the worker pipe."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+
+    def send(self, message):
+        # Blocks when the parent falls behind, which throttles a chatty snippet at the pipe
+        with self.lock:
+            self.conn.send(message)
+
+
+class LineSender(io.TextIOBase):
+    """stdout/stderr replacement that ships complete lines to the parent in small batches."""
+
+    max_batch = 64
+    max_partial = 4096
+
+    def __init__(self, sender, stream):
+        self.sender = sender
+        self.stream = stream
+        self.lock = threading.Lock()
+        self.partial = ""
+        self.lines = []
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        written = len(text)
+        with self.lock:
+            *complete, self.partial = (self.partial + text).split("\n")
+            self.lines.extend(line + "\n" for line in complete)
+            if len(self.partial) > self.max_partial:
+                self.lines.append(self.partial)
+                self.partial = ""
+            if len(self.lines) >= self.max_batch:
+                self.send_lines()
+        return written
+
+    def flush(self, partial=False):
+        with self.lock:
+            if partial and self.partial:
+                self.lines.append(self.partial)
+                self.partial = ""
+            self.send_lines()
+
+    def send_lines(self):
+        if self.lines:
+            lines, self.lines = self.lines, []
+            self.sender.send({'kind': 'output', 'stream': self.stream, 'lines': lines})
+
+
+def flush_periodically(streams, stop, interval=0.05):
+    # Lines printed right before a long sleep still reach the chat promptly
+    while not stop.wait(interval):
+        for stream in streams:
+            stream.flush()
+
+
+def run_snippet(code, sender, runtime=None):
+    namespace = {'__name__': '__main__', '__builtins__': __builtins__}
+    if runtime is not None:
+        namespace['runtime'] = runtime
+    stdout = LineSender(sender, 'stdout')
+    stderr = LineSender(sender, 'stderr')
+    stop = threading.Event()
+    flusher = threading.Thread(target=flush_periodically, args=((stdout, stderr), stop), daemon=True)
+    flusher.start()
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(compile(code, SNIPPET_FILENAME, "exec"), namespace)
+        reply = {'ok': True, 'error': None}
+    except BaseException as e:
+        reply = {'ok': False, 'error': describe_error(e)}
+    finally:
+        stop.set()
+        flusher.join()
+    stdout.flush(partial=True)
+    stderr.flush(partial=True)
+    return reply
+
+
+def refresh_site_packages(site_packages, last_modified):
+    # Picks up packages installed into the tool environment since the worker started, .pth files included
+    try:
+        modified = os.stat(site_packages).st_mtime
+    except OSError:
+        return last_modified
+    if modified != last_modified:
+        if site_packages not in sys.path:
+            sys.path.insert(0, site_packages)
+        importlib.invalidate_caches()
+        site.addsitedir(site_packages)
+    return modified
+
+
+def read_messages(conn, jobs, runtime):
+    # The only reader of the pipe: jobs go to the main loop, replies to runtime calls go to the caller
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            message = None
+        if isinstance(message, dict) and message.get('kind') == 'reply':
+            runtime.deliver(message)
+            continue
+        jobs.put(message)
+        if message is None:
+            runtime.close()
+            return
+
+
+def worker_main(conn, memory_mb, site_packages=None, sandbox=False, call_timeout=None):
+    apply_memory_limit(memory_mb)
+    if sandbox:
+        apply_sandbox()
+    sender = ConnectionSender(conn)
+    runtime = RuntimeClient(sender, call_timeout)
+    jobs = queue.Queue()
+    threading.Thread(target=read_messages, args=(conn, jobs, runtime), daemon=True).start()
+    site_modified = None
+    while True:
+        job = jobs.get()
+        if job is None:
+            return
+        if site_packages:
+            site_modified = refresh_site_packages(site_packages, site_modified)
+        apply_cpu_limit(job.get('cpu_seconds'))
+        if sandbox:
+            # No `runtime` either: it would reach the network through the app
+            blocked = sandbox_state['blocked']
+            with scratch_directory():
+                reply = run_snippet(job['code'], sender)
+            reply['sandbox_blocked'] = sandbox_state['blocked'] > blocked
+        else:
+            reply = run_snippet(job['code'], sender, runtime)
+        reply['kind'] = 'result'
+        reply['id'] = job['id']
+        sender.send(reply)
+
+
+class ExecutionResult:
+    def __init__(self, ok, output="", error=None, duration=0.0, timed_out=False, killed=False, stderr="",
+                 sandbox_blocked=False):
+        self.ok = ok
+        self.output = output
+        self.stderr = stderr
+        self.error = error or {}
+        self.duration = duration
+        self.timed_out = timed_out
+        self.killed = killed
+        self.sandbox_blocked = sandbox_blocked  # A sandboxed run tried something the sandbox does not allow
+
+    @property
+    def error_type(self):
+        return self.error.get('type')
+
+    @property
+    def error_message(self):
+        return self.error.get('message', "")
+
+    @property
+    def module_name(self):
+        return self.error.get('module')
+
+    @property
+    def line_number(self):
+        return self.error.get('line')
+
+    @property
+    def traceback(self):
+        return self.error.get('traceback', "")
+
+
+class PoolWorker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()  # Jobs and runtime replies are sent from different threads
+        self.killed = False
+
+    def send(self, message):
+        with self.send_lock:
+            self.conn.send(message)
+
+    def kill(self):
+        self.killed = True
+        if self.process.is_alive():
+            self.process.kill()
+
+    def close(self):
+        try:
+            self.send(None)
+        except (OSError, EOFError):
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+        self.conn.close()
+
+
+class ExecutionPool:
+    """Warm worker processes that run code snippets in a fresh namespace under time and resource limits.
+
+    A sandboxed pool's runs have no network, cannot start processes, get no `runtime` and work in a
+    scratch directory of their own; SandboxBlocked is raised for what they are not allowed to do.
+    """
+
+    max_collected_lines = 10000
+
+    def __init__(self, size=2, timeout=30, memory_mb=1024, cpu_seconds=30, site_packages=None, runtime=None,
+                 sandbox=False):
+        self.context = multiprocessing.get_context("spawn")
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.cpu_seconds = cpu_seconds
+        self.site_packages = site_packages  # The tool environment's packages, put ahead of the app's on sys.path
+        self.sandbox = sandbox
+        self.runtime = None if sandbox else runtime  # ToolRuntime answering the `runtime` calls of code run here
+        self.idle = queue.Queue()
+        self.active = {}  # run id -> PoolWorker running it
+        self.lock = threading.Lock()
+        self.run_ids = itertools.count(1)
+        self.closed = False
+        for _ in range(size):
+            self.idle.put(self.spawn_worker())
+
+    def spawn_worker(self):
+        parent_conn, child_conn = self.context.Pipe()
+        call_timeout = self.runtime.call_timeout if self.runtime is not None else None
+        process = self.context.Process(target=worker_main, daemon=True,
+                                       args=(child_conn, self.memory_mb, self.site_packages, self.sandbox, call_timeout))
+        process.start()
+        child_conn.close()
+        return PoolWorker(process, parent_conn)
+
+    def run(self, code, timeout=None, cpu_seconds=None, on_output=None, on_start=None):
+        # Blocks the calling thread (never the Tk thread) until the snippet finishes, fails or is killed.
+        # Output lines are passed to on_output(stream, lines) as they arrive; without it they are
+        # collected (up to max_collected_lines per stream) into the result.
+        # A timeout or cpu_seconds of 0 disables that limit, for long-lived tools.
+        # on_start(run_id) is called once the run has a worker, so the caller can kill(run_id) it later.
+        timeout = timeout if timeout is not None else self.timeout
+        cpu_seconds = cpu_seconds if cpu_seconds is not None else self.cpu_seconds
+        worker = self.idle.get()
+        run_id = next(self.run_ids)
+        with self.lock:
+            self.active[run_id] = worker
+        if on_start is not None:
+            on_start(run_id)
+        start = time.monotonic()
+        deadline = start + timeout if timeout else None
+        collected = {'stdout': [], 'stderr': []}
+        reply = None
+        timed_out = False
+        try:
+            worker.send({'id': run_id, 'code': code, 'cpu_seconds': cpu_seconds})
+            while True:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if (remaining is not None and remaining <= 0) or not worker.conn.poll(remaining):
+                    timed_out = True
+                    break
+                message = worker.conn.recv()
+                if message['kind'] == 'result':
+                    reply = message
+                    break
+                if message['kind'] == 'call':
+                    self.serve_call(worker, message)
+                    continue
+                if on_output is not None:
+                    on_output(message['stream'], message['lines'])
+                else:
+                    lines = collected[message['stream']]
+                    lines.extend(message['lines'][:max(0, self.max_collected_lines - len(lines))])
+        except (EOFError, OSError):
+            reply = None
+        finally:
+            with self.lock:
+                self.active.pop(run_id, None)
+        duration = time.monotonic() - start
+        output, stderr = "".join(collected['stdout']), "".join(collected['stderr'])
+        if reply is not None:
+            if worker.killed:
+                # Killed just as it finished: the result stands, but the process is gone
+                worker.process.join(1)
+                self.replace(worker)
+            else:
+                self.release(worker)
+            return ExecutionResult(reply['ok'], output, reply['error'], duration, stderr=stderr,
+                                   sandbox_blocked=reply.get('sandbox_blocked', False))
+        killed = worker.killed
+        worker.kill()
+        worker.process.join(1)
+        exitcode = worker.process.exitcode
+        self.replace(worker)
+        if timed_out:
+            error = {'type': 'TimeoutError', 'message': f"Execution timed out after {timeout} seconds"}
+        elif killed:
+            error = {'type': 'Killed', 'message': "Execution was stopped"}
+        elif exitcode == -getattr(signal, "SIGXCPU", 0):
+            error = {'type': 'CPULimitExceeded', 'message': "Execution exceeded its CPU time limit"}
+        else:
+            error = {'type': 'WorkerCrashed', 'message': f"Execution process exited unexpectedly (exit code {exitcode})"}
+        return ExecutionResult(False, output, error, duration, timed_out=timed_out, killed=killed, stderr=stderr)
+
+    def serve_call(self, worker, call):
+        if self.runtime is None:
+            worker.send({'kind': 'reply', 'id': call['id'], 'ok': False, 'error': "No tool runtime in this app"})
+        else:
+            self.runtime.serve(call, worker.send)
+
+    def release(self, worker):
+        if self.closed:
+            worker.close()
+        else:
+            self.idle.put(worker)
+
+    def replace(self, worker):
+        worker.conn.close()
+        if not self.closed:
+            self.idle.put(self.spawn_worker())
+
+    def kill(self, run_id):
+        # Stops one run; returns whether it was still going. Killing under the lock that run() takes to
+        # let go of the worker means a finished run's worker, idle or running something else, is never hit.
+        with self.lock:
+            worker = self.active.get(run_id)
+            if worker is not None:
+                worker.kill()
+        return worker is not None
+
+    def kill_all(self):
+        with self.lock:
+            workers = list(self.active.values())
+            for worker in workers:
+                worker.kill()
+        return len(workers)
+
+    def running(self):
+        with self.lock:
+            return len(self.active)
+
+    def shutdown(self):
+        self.closed = True
+        self.kill_all()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
@@ -0,0 +1,42 @@
+import requests
+import time
+from playsound import playsound
+import os
+import sys
+
+# Public API: Coinbase Exchange (https://api.exchange.coinbase.com/)
+coin_base_url = "https://api.exchange.coinbase.com/products/sol-usd/ticker"
+
+def fetch_solana_price():
+    """Fetch Solana's current price"""
+    try:
+        response = requests.get(coin_base_url)
+        response.raise_for_status()
+        data = response.json()
+        if 'price' in data:
+            return float(data['price'])
+        else:
+            print("Failed to retrieve Solana price.")
+            return None
+    except requests.exceptions.RequestException as e:
+        print(f"An error occurred while fetching Solana price: {e}")
+        return None
+
+def sound_notification(price):
+    if price is not None and (price < 144 or price > 148):
+        desktop_dir = os.path.join(os.path.expanduser('~'), 'Desktop')
+        alert_file_path = os.path.join(desktop_dir, 'alert.wav')
+        playsound(alert_file_path)
+        while True:
+            print(f"Price: {price}")
+            time.sleep(1)
+            sys.stdout.flush()
+    
+while True:
+    solana_price = fetch_solana_price()
+    if solana_price is not None:
+        print(f"Current Solana Price: ${solana_price:.2f}")
+        
+        sound_notification(solana_price)
+    
+    time.sleep(60)  # Check every minute
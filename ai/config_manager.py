@@ -1,9 +1,158 @@
+import atexit
+import hashlib
 import json
 import os
+import re
+import threading
+from collections.abc import MutableMapping
+
+
+def write_atomic(path, data):
+    # Write to a temp file, fsync and rename, so a crash leaves either the old file or the new one
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    try:
+        dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:  # Directories cannot be opened on Windows; the rename is still atomic there
+        return
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class ExternalSection(MutableMapping):
+    """A name -> text config section stored one entry per file and read only when an entry is used."""
+
+    def __init__(self, manager, key, directory, extension):
+        self.manager = manager
+        self.key = key
+        self.directory = directory
+        self.extension = extension
+        self.files = {}  # name -> file name, from the section index
+        self.values = {}  # name -> text, for entries read or changed so far
+        self.dirty = set()
+        self.removed = set()
+        self.index_dirty = False
+        self.loaded = False
+
+    def index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def load_index(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        if os.path.exists(self.index_path()):
+            with open(self.index_path(), "r", encoding="utf-8") as f:
+                self.files = json.load(f)
+            # Entries whose file has gone are dropped, so iterating never meets a name that cannot be read
+            missing = [name for name, file_name in self.files.items()
+                       if not os.path.exists(os.path.join(self.directory, file_name))]
+            for name in missing:
+                del self.files[name]
+            if missing:
+                self.index_dirty = True
+                self.manager.mark_dirty(self.key)
+
+    def file_name(self, name):
+        slug = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_")[:40] or "entry"
+        return f"{slug}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}{self.extension}"
+
+    def __getitem__(self, name):
+        with self.manager.lock:
+            self.load_index()
+            if name not in self.values:
+                if name not in self.files:
+                    raise KeyError(name)
+                try:
+                    with open(os.path.join(self.directory, self.files[name]), "r", encoding="utf-8") as f:
+                        self.values[name] = f.read()
+                except FileNotFoundError:
+                    raise KeyError(name) from None  # Removed since the index was read; get() falls back to its default
+            return self.values[name]
+
+    def __setitem__(self, name, value):
+        with self.manager.lock:
+            self.load_index()
+            if name not in self.files:
+                self.files[name] = self.file_name(name)
+                self.index_dirty = True
+            self.removed.discard(self.files[name])
+            self.values[name] = value
+            self.dirty.add(name)
+        self.manager.mark_dirty(self.key)
+
+    def __delitem__(self, name):
+        with self.manager.lock:
+            self.load_index()
+            file_name = self.files.pop(name)
+            self.values.pop(name, None)
+            self.dirty.discard(name)
+            self.removed.add(file_name)
+            self.index_dirty = True
+        self.manager.mark_dirty(self.key)
+
+    def __iter__(self):
+        with self.manager.lock:
+            self.load_index()
+            return iter(list(self.files))
+
+    def __len__(self):
+        with self.manager.lock:
+            self.load_index()
+            return len(self.files)
+
+    def merge_from(self, values):
+        # Adds and updates entries without removing any; returns how many changed
+        changed = [name for name, value in values.items() if self.get(name) != value]
+        for name in changed:
+            self[name] = values[name]
+        return len(changed)
+
+    def update_from(self, values):
+        # Used when an inline section from an older config.json, or a plain dict passed to set(), replaces this one
+        for name in [name for name in self if name not in values]:
+            del self[name]
+        for name, value in values.items():
+            if name not in self.files or self.values.get(name) != value:
+                self[name] = value
+
+    def save(self):
+        # Called with the manager lock held; only entries that changed are rewritten
+        if not (self.dirty or self.removed or self.index_dirty):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for name in self.dirty:
+            write_atomic(os.path.join(self.directory, self.files[name]), self.values[name])
+        if self.index_dirty:
+            write_atomic(self.index_path(), json.dumps(self.files, indent=4))
+        for file_name in self.removed:
+            try:
+                os.remove(os.path.join(self.directory, file_name))
+            except OSError:
+                pass
+        self.dirty.clear()
+        self.removed.clear()
+        self.index_dirty = False
+
 
 class ConfigManager:
-    def __init__(self, config_file_path="config.json"):
+    # Large sections live in config.d/<section>/, one file per entry, and are loaded on first use
+    external_sections = {"system_prompts": ".txt", "utility_tools": ".py"}
+
+    def __init__(self, config_file_path="config.json", debounce=0.5):
         self.config_file_path = config_file_path
+        self.external_dir = os.path.join(os.path.dirname(config_file_path) or ".", "config.d")
+        self.debounce = debounce  # Changes within this many seconds are written together
+        self.lock = threading.RLock()
+        self.dirty = set()
+        self.rewrite_main = False  # Set when inline sections still have to be replaced by $external markers
+        self.flush_timer = None
         self.default_config = {
             "system_prompts": {
                 "Default": "You are an expert Python programmer and mentor. Always provide correct and efficient code."
@@ -12,24 +161,135 @@ class ConfigManager:
             "font_size": 12,
             "foreground_color": "#FFFFFF",
             "background_color": "#23272A",
-            "utility_tools": {}  # Add default empty dictionary for utility tools
+            "utility_tools": {},  # Add default empty dictionary for utility tools
+            "utility_tool_schedules": {},  # Tool name -> {"mode": "once" | "interval" | "daemon", "interval": seconds}
+            "render_fps": 30,  # Chat redraws per second while streaming
+            "typewriter": False,  # Cosmetic character-by-character reveal
+            "typewriter_cps": 400,
+            "render_max_frame_chars": 20000,  # Characters drawn per frame and tab when catching up, e.g. on switching tabs
+            "highlight_code": True,  # Colour Python code in replies as it streams in
+            "transcript_max_lines": 3000,  # Lines kept in the chat widget; older messages load back when scrolled to
+            "transcript_max_entries": 10000,  # Messages kept in memory for search, copy and export
+            "generation_workers": 2,  # Replies generated at once across all tabs
+            "generation_queue_size": 4,  # Messages allowed to wait behind the reply being generated
+            "supersede_generation": False,  # A new message cancels the reply in progress
+            "models": {  # Model, options and keep_alive per role; context budget defaults to 3/4 of num_ctx
+                "chat": {"name": "llama3.1", "options": {"num_ctx": 8192}, "keep_alive": "30m"},
+                "correction": {"name": "llama3.1", "options": {"num_ctx": 4096}, "keep_alive": "10m"},
+                "summary": {"name": "llama3.1", "options": {"num_ctx": 4096, "temperature": 0.2}, "keep_alive": "5m"}
+            },
+            "keep_alive_interval": 240,  # Seconds between pings that keep the chat model loaded; 0 disables
+            "model_summaries": True,  # Let the summary model rewrite the summary of folded turns in the background
+            "context_budgets": {"default": 4096},  # Prompt token budget per model name, overriding num_ctx
+            "summary_tokens": 512,  # Share of the budget kept for the summary of older turns
+            "incremental_context": {"enabled": True, "fold_target": 0.75},  # Keep the prompt's start stable so Ollama reuses its state
+            "session_store": {"enabled": True, "path": "sessions/sessions.db", "batch_interval": 0.2},  # Saved conversations
+            "retrieval": {"enabled": False, "embedder": "ollama", "model": "nomic-embed-text", "directory": "sessions/embeddings",
+                          "top_k": 4, "token_budget": 512, "min_score": 0.3, "batch_size": 32,
+                          "keep_alive": "30m"},  # Recall earlier sessions; needs NumPy
+            "response_cache": {"enabled": True, "directory": "response_cache", "max_mb": 64, "max_age_days": 7},
+            "code_execution": {"workers": 2, "timeout": 30, "memory_mb": 2048, "cpu_seconds": 30, "tool_workers": 2, "tool_timeout": 60},
+            "dependencies": {"enabled": True, "environment": "tool_env", "wheel_cache": "tool_env/wheels", "index_url": None,
+                             "offline": False, "install_workers": 4, "package_names": {},
+                             "retry_after": 60},  # Packages for executed code
+            "error_journal": {"enabled": True, "file": "errors/errors.jsonl", "fixes_file": "errors/fixes.json",
+                              "max_mb": 5, "backups": 3, "max_fixes": 1000},  # Failed runs and the fixes that resolved them
+            "tool_runtime": {"enabled": True, "ttl": 10, "rate": 5.0, "burst": 5, "host_rates": {}, "timeout": 20,
+                             "call_timeout": 60},  # `runtime` HTTP for executed code
+            "code_output": {"lines_per_second": 200, "max_pending_lines": 500, "max_lines": 2000},
+            "status_bar": False,  # Show generation and UI lag metrics under the chat
+            "metrics": {"enabled": True, "file": "metrics/metrics.jsonl", "max_mb": 5, "backups": 3},
+            "correction": {"candidates": 3, "temperatures": [0.2, 0.6, 1.0], "dry_run": True, "dry_run_timeout": 5, "max_attempts": 5}
         }
         self.config = self.load_config()
+        if self.rewrite_main:
+            self.schedule_flush()
+        atexit.register(self.flush)
 
     def load_config(self):
         if os.path.exists(self.config_file_path):
             with open(self.config_file_path, "r") as f:
-                return json.load(f)
+                config = json.load(f)
+            saved_keys = set(config)
+            # Keys added in newer versions fall back to their defaults
+            for key, value in self.default_config.items():
+                config.setdefault(key, value)
         else:
-            return self.default_config
+            config = json.loads(json.dumps(self.default_config))
+            saved_keys = set()
+        for key, extension in self.external_sections.items():
+            section = ExternalSection(self, key, os.path.join(self.external_dir, key), extension)
+            value = config.get(key)
+            if isinstance(value, dict) and "$external" not in value:
+                # Inline section from an older config.json (or the defaults): moved out by the flush scheduled
+                # below. When config.d already has the section, the inline entries were edited into
+                # config.json by hand (or written by an older version), so they are merged in, not dropped.
+                if not os.path.exists(section.index_path()):
+                    section.update_from(value)
+                elif key in saved_keys:
+                    changed = section.merge_from(value)
+                    if changed:
+                        print(f"Merged {changed} {key} entries from {self.config_file_path} into {section.directory}")
+                self.rewrite_main = True
+            config[key] = section
+        return config
+
+    def serializable_config(self):
+        config = {}
+        for key, value in self.config.items():
+            if isinstance(value, ExternalSection):
+                value = {"$external": os.path.relpath(value.directory, os.path.dirname(self.config_file_path) or ".")}
+            config[key] = value
+        return config
+
+    def mark_dirty(self, key):
+        with self.lock:
+            self.dirty.add(key)
+            self.schedule_flush()
+
+    def schedule_flush(self):
+        with self.lock:
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(self.debounce, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            if not (self.dirty or self.rewrite_main):
+                return
+            dirty, self.dirty = self.dirty, set()
+            try:
+                for key in dirty:
+                    value = self.config.get(key)
+                    if isinstance(value, ExternalSection):
+                        value.save()
+                # config.json itself only holds small settings, so it is rewritten whole
+                if self.rewrite_main or dirty - set(self.external_sections):
+                    write_atomic(self.config_file_path, json.dumps(self.serializable_config(), indent=4))
+                    self.rewrite_main = False
+            except OSError:
+                self.dirty |= dirty
+                raise
 
     def save_config(self):
-        with open(self.config_file_path, "w") as f:
-            json.dump(self.config, f, indent=4)
+        # Callers that changed nested values in place still get their change written behind
+        for key in self.config:
+            if not isinstance(self.config[key], ExternalSection):
+                self.mark_dirty(key)
 
     def get(self, key, default=None):
         return self.config.get(key, default)
 
     def set(self, key, value):
-        self.config[key] = value
-        self.save_config()
+        with self.lock:
+            current = self.config.get(key)
+            if isinstance(current, ExternalSection):
+                if value is not current:
+                    current.update_from(value)
+            else:
+                self.config[key] = value
+        self.mark_dirty(key)
@@ -0,0 +1,139 @@
+import re
+import threading
+from collections import deque
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text and code; close enough for budgeting
+    return max(1, (len(text) + 3) // 4)
+
+
+def message_tokens(messages):
+    return sum(estimate_tokens(message['content']) for message in messages)
+
+
+def shared_prefix_tokens(previous, messages):
+    # Tokens in the leading messages that are unchanged since the previous prompt, which a model that
+    # still holds its state from that prompt does not need to evaluate again
+    shared = 0
+    for old, new in zip(previous, messages):
+        if old != new:
+            break
+        shared += estimate_tokens(new['content'])
+    return shared
+
+
+def first_sentence(text, limit=200):
+    text = " ".join(text.split())
+    match = re.match(r"(.+?[.!?])(\s|$)", text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= limit else sentence[:limit - 3] + "..."
+
+
+def extractive_summary(previous_summary, folded_messages, max_tokens):
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in folded_messages:
+        speaker = "User" if message['role'] == 'user' else "Assistant"
+        lines.append(f"- {speaker}: {first_sentence(message['content'])}")
+    # Oldest summary lines go first once the summary itself outgrows its share of the budget
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ContextWindow:
+    """Conversation history that fits itself to a token budget by folding old turns into a summary.
+
+    The summarizer runs inline and must be cheap. An optional refiner(context, version, previous_summary,
+    folded) is told about every fold and may later replace the summary through apply_summary().
+    With fold_target below 1, a fold goes down to that share of the budget rather than just under it, so
+    the start of the prompt stays the same for the next several turns and the model can reuse its state.
+    With hold_refinements, a refined summary is kept back until the next fold changes the prompt's start
+    anyway, instead of changing it again between folds.
+    """
+
+    def __init__(self, token_budget=4096, summary_tokens=512, summarizer=None, refiner=None, fold_target=1.0,
+                 hold_refinements=False):
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.fold_target = fold_target
+        self.hold_refinements = hold_refinements
+        self.summarizer = summarizer or extractive_summary
+        self.refiner = refiner
+        self.messages = deque()  # (message, tokens) pairs, oldest first
+        self.history_tokens = 0
+        self.summary = ""
+        self.pending_summary = None  # Refined summary held back until the next fold
+        self.summary_version = 0  # Bumped whenever the summary changes, so stale refinements are dropped
+        self.lock = threading.Lock()
+
+    def append(self, role, content):
+        message = {'role': role, 'content': content}
+        tokens = estimate_tokens(content)
+        self.messages.append((message, tokens))
+        self.history_tokens += tokens
+        return message
+
+    def clear(self):
+        self.messages.clear()
+        self.history_tokens = 0
+        with self.lock:
+            self.summary = ""
+            self.pending_summary = None
+            self.summary_version += 1
+
+    def apply_summary(self, summary, version):
+        # Returns False when more turns were folded (or the history cleared) since the refinement started
+        with self.lock:
+            if version != self.summary_version:
+                return False
+            if self.hold_refinements:
+                self.pending_summary = summary
+                return True
+            self.summary = summary
+            self.summary_version += 1
+            return True
+
+    def summary_message(self):
+        if not self.summary:
+            return None
+        return {'role': 'system', 'content': f"Summary of the earlier conversation:\n{self.summary}"}
+
+    def fit(self, system_prompt="", token_budget=None):
+        budget = token_budget or self.token_budget
+        fixed = estimate_tokens(system_prompt) if system_prompt else 0
+        folded = []
+        if fixed + self.summary_budget(folded) + self.history_tokens > budget:
+            budget = int(budget * self.fold_target)
+        # Always keep the newest message, even if it alone exceeds the budget
+        while len(self.messages) > 1 and fixed + self.summary_budget(folded) + self.history_tokens > budget:
+            message, tokens = self.messages.popleft()
+            self.history_tokens -= tokens
+            folded.append(message)
+        if folded:
+            with self.lock:
+                # A refinement held back since the last fold takes over from the summary it refined
+                previous = self.pending_summary if self.pending_summary is not None else self.summary
+                self.pending_summary = None
+                self.summary = self.summarizer(previous, folded, self.summary_tokens)
+                self.summary_version += 1
+                version = self.summary_version
+            if self.refiner is not None:
+                self.refiner(self, version, previous, folded)
+        return folded
+
+    def summary_budget(self, folded):
+        return self.summary_tokens if (self.summary or folded) else 0
+
+    def build(self, system_prompt, token_budget=None):
+        self.fit(system_prompt, token_budget)
+        messages = [{'role': 'system', 'content': system_prompt}]
+        summary = self.summary_message()
+        if summary:
+            messages.append(summary)
+        messages.extend(message for message, _ in self.messages)
+        return messages
+
+    def prompt_tokens(self, system_prompt=""):
+        summary_tokens = estimate_tokens(self.summary) if self.summary else 0
+        return (estimate_tokens(system_prompt) if system_prompt else 0) + summary_tokens + self.history_tokens
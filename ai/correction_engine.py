@@ -0,0 +1,149 @@
+import ast
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from code_runner import ExecutionPool
+from generation_worker import CancelToken, stream_chat
+from utility import Utility
+
+
+class CorrectionCandidate:
+    def __init__(self, index, options):
+        self.index = index
+        self.options = options
+        self.reply = ""
+        self.code = None
+        self.passed = False
+        self.unverified = False  # Passed by still running when its dry run was cut off, without an error
+        self.reason = None  # Why the candidate was rejected
+        self.error = None  # ExecutionResult of a failed dry run, fed into the next round
+        self.duration = 0.0
+
+
+class CorrectionEngine:
+    """Requests several candidate fixes at once and returns the first one that survives checking.
+
+    Candidates differ by temperature and seed, and seeds change with each attempt, so a retry explores
+    new fixes rather than replaying cached ones. Each is compiled, parsed and, if enabled, dry-run in a
+    sandboxed pool of its own (no network, no new processes, no `runtime`, a scratch directory). A dry
+    run that hits the sandbox has not failed on its own account and passes. One still running when
+    dry_run_timeout is up, without having raised, passes unverified: long-running and polling code
+    never finishes. The first verified pass wins, else the first unverified one; the remaining
+    generations and dry runs are cancelled.
+    """
+
+    def __init__(self, model="llama3.1", cache=None, candidates=3, temperatures=(0.2, 0.6, 1.0), dry_run=True,
+                 dry_run_timeout=5, memory_mb=1024, site_packages=None, registry=None, telemetry=None):
+        self.model = model
+        self.registry = registry  # When set, the "correction" model profile overrides model
+        self.telemetry = telemetry
+        self.cache = cache
+        self.candidates = candidates
+        self.temperatures = list(temperatures) or [0.7]
+        self.dry_run = dry_run
+        self.dry_run_timeout = dry_run_timeout
+        self.memory_mb = memory_mb
+        self.site_packages = site_packages
+        self.pool = None
+        self.pool_lock = threading.Lock()
+
+    def dry_run_pool(self):
+        # Created on the first dry run, with a worker per candidate so no dry run waits for another's
+        with self.pool_lock:
+            if self.pool is None:
+                self.pool = ExecutionPool(size=self.candidates, timeout=self.dry_run_timeout, memory_mb=self.memory_mb,
+                                          cpu_seconds=self.dry_run_timeout, site_packages=self.site_packages, sandbox=True)
+            return self.pool
+
+    def candidate_options(self, index, base_options=None, attempt=1):
+        options = dict(base_options or {})
+        options.update({'temperature': self.temperatures[index % len(self.temperatures)],
+                        'seed': 1000 + attempt * self.candidates + index})
+        return options
+
+    def correct(self, messages, token=None, attempt=1):
+        # Returns (winning candidate or None, all candidates); blocks the calling thread
+        profile = self.registry.profile("correction") if self.registry is not None else None
+        model = profile.name if profile else self.model
+        keep_alive = profile.keep_alive if profile else None
+        candidates = [CorrectionCandidate(index, self.candidate_options(index, profile.options if profile else None, attempt))
+                      for index in range(self.candidates)]
+        tokens = [CancelToken() for _ in candidates]
+        futures = []
+
+        def cancel_unfinished():
+            # Candidates that have finished are left alone; their streams are over
+            for child, future in zip(tokens, futures):
+                if not future.done():
+                    child.cancel()
+        if token is not None:
+            token.add_closer(cancel_unfinished)
+        winner = None
+        executor = ThreadPoolExecutor(max_workers=len(candidates), thread_name_prefix="correction")
+        try:
+            futures.extend(executor.submit(self.try_candidate, candidate, model, messages, child, keep_alive)
+                           for candidate, child in zip(candidates, tokens))
+            for future in as_completed(futures):
+                candidate = future.result()
+                if candidate.passed and not candidate.unverified:
+                    winner = candidate
+                    break
+                if candidate.passed and winner is None:
+                    winner = candidate  # Kept unless a verified candidate turns up
+        finally:
+            # Losers still generating or dry-running are cancelled, which kills their dry runs
+            cancel_unfinished()
+            if token is not None:
+                token.remove_closer(cancel_unfinished)
+            executor.shutdown(wait=False)
+        return winner, candidates
+
+    def try_candidate(self, candidate, model, messages, token, keep_alive=None):
+        start = time.monotonic()
+        metrics = self.telemetry.start("correction", model) if self.telemetry is not None else None
+        try:
+            candidate.reply = "".join(stream_chat(model, messages, candidate.options, token, self.cache,
+                                                  keep_alive=keep_alive, metrics=metrics))
+            if token.cancelled:
+                candidate.reason = "cancelled"
+            else:
+                self.check(candidate, token)
+        except Exception as e:
+            candidate.reason = "cancelled" if token.cancelled else f"generation failed: {e}"
+        candidate.duration = time.monotonic() - start
+        return candidate
+
+    def check(self, candidate, token):
+        candidate.code = Utility.extract_code_block(candidate.reply)
+        if not candidate.code:
+            candidate.reason = "no code block in reply"
+            return
+        try:
+            tree = ast.parse(candidate.code)
+            compile(tree, "<candidate>", "exec")
+        except SyntaxError as e:
+            candidate.reason = f"syntax error on line {e.lineno}: {e.msg}"
+            return
+        if not tree.body:
+            candidate.reason = "empty code block"
+            return
+        if self.dry_run and not token.cancelled:
+            pool = self.dry_run_pool()
+            result = pool.run(candidate.code, on_start=lambda run_id: token.add_closer(lambda: pool.kill(run_id)))
+            if result.killed or token.cancelled:
+                candidate.reason = "cancelled"
+                return
+            if result.timed_out:
+                candidate.unverified = True
+                candidate.reason = f"still running after {self.dry_run_timeout}s, not verified"
+            elif not result.ok and not result.sandbox_blocked:
+                candidate.error = result
+                candidate.reason = f"dry run failed: {result.error_type}: {result.error_message}"
+                return
+        candidate.passed = True
+
+    def shutdown(self):
+        with self.pool_lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown()
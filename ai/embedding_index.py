@@ -0,0 +1,290 @@
+import json
+import os
+import queue
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from context_window import estimate_tokens
+
+try:
+    import numpy as np
+except ImportError:  # Retrieval is optional; without NumPy it is simply turned off
+    np = None
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def hashing_embedder(dimensions=512):
+    # A local stand-in for an embedding model: words and word pairs hashed into a fixed-size vector.
+    # It only matches shared vocabulary, but needs no model and costs microseconds per message.
+    def embed(texts):
+        vectors = np.zeros((len(texts), dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = WORD_PATTERN.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                digest = zlib.crc32(feature.encode("utf-8"))  # Stable across runs, unlike hash()
+                vectors[row, digest % dimensions] += 1.0 if digest & 0x80000000 else -1.0
+        return vectors
+    embed.name = f"hashing-{dimensions}"
+    return embed
+
+
+def ollama_embedder(model, host=None, keep_alive=None):
+    from generation_worker import create_client
+
+    def embed(texts):
+        response = create_client(host).embed(model=model, input=texts, keep_alive=keep_alive)
+        return np.asarray(response['embeddings'], dtype=np.float32)
+    embed.name = model
+    return embed
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class EmbeddingIndex:
+    """Unit-length message vectors in a memory-mapped float32 file, with the messages alongside.
+
+    vectors.f32 holds one row per message and grows by doubling; entries.jsonl holds the session id,
+    role and text of each row, and only the byte offset of each line is kept in memory. index.json
+    records how many rows are valid and which embedder wrote them; switching embedders starts a new index.
+    """
+
+    def __init__(self, directory, embedder_name):
+        self.directory = directory
+        self.embedder_name = embedder_name
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.dimensions = None
+        self.count = 0
+        self.offsets = []
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self.entries_path = os.path.join(directory, "entries.jsonl")
+        self.meta_path = os.path.join(directory, "index.json")
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if meta.get('embedder') != self.embedder_name or not meta.get('count'):
+            self.reset()
+            return
+        try:
+            with open(self.entries_path, "rb") as f:
+                offset = 0
+                for line in f:
+                    if len(self.offsets) == meta['count']:
+                        break
+                    self.offsets.append(offset)
+                    offset += len(line)
+            capacity = os.path.getsize(self.vectors_path) // (4 * meta['dimensions'])
+        except OSError:
+            # index.json without the files it describes: start over rather than fail start-up
+            self.reset()
+            return
+        self.dimensions = meta['dimensions']
+        self.count = min(meta['count'], len(self.offsets), capacity)
+        del self.offsets[self.count:]  # Rows added from here on must line up with their entries
+        if not capacity:
+            return
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def reset(self):
+        self.dimensions = None
+        self.count = 0
+        self.offsets = []
+        for path in (self.vectors_path, self.entries_path, self.meta_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def grow(self, needed):
+        capacity = self.vectors.shape[0] if self.vectors is not None else 0
+        if needed <= capacity:
+            return
+        capacity = max(1024, capacity)
+        while capacity < needed:
+            capacity *= 2
+        if self.vectors is not None:
+            self.vectors.flush()
+            del self.vectors
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(capacity * self.dimensions * 4)
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.dimensions))
+
+    def add(self, vectors, entries):
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        with self.lock:
+            if self.dimensions is None:
+                self.dimensions = vectors.shape[1]
+            self.grow(self.count + len(vectors))
+            self.vectors[self.count:self.count + len(vectors)] = vectors
+            self.vectors.flush()
+            with open(self.entries_path, "ab") as f:
+                offset = f.tell()
+                for entry in entries:
+                    line = (json.dumps(entry) + "\n").encode("utf-8")
+                    self.offsets.append(offset)
+                    f.write(line)
+                    offset += len(line)
+            self.count += len(vectors)
+            temp_path = f"{self.meta_path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({'embedder': self.embedder_name, 'dimensions': self.dimensions, 'count': self.count}, f)
+            os.replace(temp_path, self.meta_path)
+
+    def search(self, vector, k=4, exclude_session=None, block_rows=65536):
+        # Top-k rows by cosine similarity, best first: [(score, entry)]. Scored a block at a time,
+        # so a large index never needs more than block_rows scores in memory at once.
+        with self.lock:
+            if self.vectors is None or not self.count:
+                return []
+            vectors, count = self.vectors, self.count  # grow() may swap in a larger map meanwhile
+        query = normalize(np.asarray(vector, dtype=np.float32).reshape(1, -1))[0]
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        wanted = k * 4 if exclude_session else k  # Room for rows from the excluded session
+        for start in range(0, count, block_rows):
+            scores = vectors[start:min(count, start + block_rows)] @ query
+            if len(scores) > wanted:
+                top = np.argpartition(scores, -wanted)[-wanted:]
+            else:
+                top = np.arange(len(scores))
+            best_scores = np.concatenate([best_scores, scores[top]])
+            best_rows = np.concatenate([best_rows, top + start])
+            if len(best_scores) > wanted:
+                keep = np.argpartition(best_scores, -wanted)[-wanted:]
+                best_scores, best_rows = best_scores[keep], best_rows[keep]
+        results = []
+        with open(self.entries_path, "rb") as f:
+            for position in np.argsort(-best_scores):
+                f.seek(self.offsets[best_rows[position]])
+                entry = json.loads(f.readline())
+                if exclude_session and entry.get('session_id') == exclude_session:
+                    continue
+                results.append((float(best_scores[position]), entry))
+                if len(results) == k:
+                    break
+        return results
+
+    def close(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+
+
+class Retriever:
+    """Embeds stored messages in the background and finds earlier ones relevant to a new message.
+
+    add() only queues; a worker thread embeds queued messages in batches of up to batch_size, so storing
+    a message never waits on the embedding model. prepare() starts embedding a new message as soon as it
+    is sent; context_for() uses that vector only if it is already done and otherwise skips recall for the
+    turn (a cold embedding model, say) rather than wait, then returns snippets that fit in token_budget.
+    """
+
+    def __init__(self, index, embed, top_k=4, token_budget=512, min_score=0.3, batch_size=32, max_chars=2000):
+        self.index = index
+        self.embed = embed
+        self.top_k = top_k
+        self.token_budget = token_budget
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self.max_chars = max_chars
+        self.skipped = 0  # Turns recall was skipped for because the query vector was not ready yet
+        self.pending = queue.Queue()
+        self.queries = ThreadPoolExecutor(max_workers=2, thread_name_prefix="embedding-query")
+        self.worker = threading.Thread(target=self.run, name="embedding-index", daemon=True)
+        self.worker.start()
+
+    def prepare(self, text):
+        # Returns a Future of text's vector, for context_for()
+        return self.queries.submit(lambda: self.embed([text[:self.max_chars]])[0])
+
+    def add(self, session_id, role, content):
+        if content.strip():
+            self.pending.put({'session_id': session_id, 'role': role, 'text': content[:self.max_chars],
+                              'created': time.time()})
+
+    def run(self):
+        while True:
+            entry = self.pending.get()
+            batch = [entry]
+            while entry is not None and len(batch) < self.batch_size:
+                try:
+                    entry = self.pending.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                batch.append(entry)
+            entries = [entry for entry in batch if entry is not None]
+            try:
+                if entries:
+                    self.index.add(self.embed([entry['text'] for entry in entries]), entries)
+            except Exception as e:
+                print(f"Embedding failed: {e}")
+            finally:
+                for _ in batch:
+                    self.pending.task_done()
+            if len(entries) < len(batch):
+                return
+
+    def flush(self):
+        self.pending.join()
+
+    def context_for(self, text, exclude_session=None, query=None):
+        # Earlier messages relevant to text, as a block for the system prompt; "" when nothing qualifies.
+        # query is prepare(text)'s Future when the caller started it earlier; it is never waited for. Without
+        # one, text is embedded here, which blocks, so the generation thread always passes one.
+        if query is not None and not query.done():
+            self.skipped += 1
+            return ""
+        try:
+            vector = query.result() if query is not None else self.embed([text[:self.max_chars]])[0]
+        except Exception as e:
+            print(f"Embedding failed: {e}")
+            return ""
+        lines = []
+        used = 0
+        for score, entry in self.index.search(vector, self.top_k, exclude_session):
+            if score < self.min_score:
+                break
+            speaker = "User" if entry['role'] == 'user' else "Assistant"
+            line = f"- {speaker}: {' '.join(entry['text'].split())}"
+            room = (self.token_budget - used) * 4
+            if room < 40:
+                break
+            if len(line) > room:
+                line = line[:room - 3] + "..."
+            lines.append(line)
+            used += estimate_tokens(line)
+        if not lines:
+            return ""
+        return "Possibly relevant messages from earlier conversations:\n" + "\n".join(lines)
+
+    def close(self):
+        self.pending.put(None)
+        self.queries.shutdown(wait=False)
+        self.worker.join(timeout=10)
+        self.index.close()
+
+
+def create_retriever(retrieval_config):
+    # retrieval_config is the "retrieval" config section; returns None when retrieval is off or NumPy is missing
+    if not retrieval_config.get("enabled", False) or np is None:
+        return None
+    if retrieval_config.get("embedder", "ollama") == "hashing":
+        embed = hashing_embedder()
+    else:
+        embed = ollama_embedder(retrieval_config.get("model", "nomic-embed-text"), retrieval_config.get("host"),
+                                retrieval_config.get("keep_alive"))
+    index = EmbeddingIndex(retrieval_config.get("directory", "sessions/embeddings"), embed.name)
+    return Retriever(index, embed, top_k=retrieval_config.get("top_k", 4),
+                     token_budget=retrieval_config.get("token_budget", 512),
+                     min_score=retrieval_config.get("min_score", 0.3),
+                     batch_size=retrieval_config.get("batch_size", 32))
@@ -0,0 +1,193 @@
+import difflib
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from logging.handlers import RotatingFileHandler
+
+# Parts of an error message that differ between occurrences of the same mistake
+MESSAGE_PATTERNS = [
+    (re.compile(r"0x[0-9a-fA-F]+"), "<addr>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\b\d+(\.\d+)?\b"), "<num>"),
+]
+
+
+def message_template(message):
+    for pattern, placeholder in MESSAGE_PATTERNS:
+        message = pattern.sub(placeholder, message)
+    return " ".join(message.split())[:300]
+
+
+def error_signature(error_type, message, line_text):
+    # The same exception, with the same message apart from values, raised by the same line of code
+    key = "\n".join([error_type or "", message_template(message or ""), " ".join((line_text or "").split())])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def line_at(code, line_number):
+    lines = code.splitlines()
+    if line_number and 0 < line_number <= len(lines):
+        return lines[line_number - 1]
+    return None
+
+
+def fix_hunks(code, fixed):
+    # The changes that turned code into fixed, as [start line, old lines, new lines] with 0-based starts
+    old, new = code.splitlines(), fixed.splitlines()
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    return [[i1, old[i1:i2], new[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def apply_hunks(code, hunks):
+    # Replays a fix on different code that contains the same broken lines. Each hunk's old lines must
+    # occur in the code exactly once; insertions without old lines go in at the same line number.
+    # Returns None when the fix does not fit.
+    lines = code.splitlines()
+    edits = []
+    for start, old, new in hunks:
+        if old:
+            positions = [index for index in range(len(lines) - len(old) + 1) if lines[index:index + len(old)] == old]
+            if len(positions) != 1:
+                return None
+            start = positions[0]
+        elif start > len(lines):
+            return None
+        edits.append((start, len(old), new))
+    edits.sort(key=lambda edit: edit[0])
+    for (start, length, _), (next_start, _, _) in zip(edits, edits[1:]):
+        if start + length > next_start:
+            return None
+    for start, length, new in reversed(edits):
+        lines[start:start + length] = new
+    return "\n".join(lines) + ("\n" if code.endswith("\n") else "")
+
+
+class ErrorJournal:
+    """Failed code runs as JSONL, grouped by error signature, plus the fix that last resolved each signature.
+
+    A signature covers the exception type, the message with its values blanked out and the offending line,
+    so the same mistake in a later snippet matches. The first occurrence of a signature is written in full,
+    with code and traceback; repeats only add a line with the count. Writes happen on a background thread
+    and the file rotates at max_bytes, keeping `backups` older files. Fixes are kept in fixes_path, at most
+    max_fixes, least recently used dropped first.
+    """
+
+    def __init__(self, path="errors/errors.jsonl", fixes_path="errors/fixes.json", max_bytes=5 * 1024 * 1024,
+                 backups=3, max_fixes=1000):
+        self.fixes_path = fixes_path
+        self.max_fixes = max_fixes
+        self.lock = threading.Lock()
+        self.counts = {}  # Signature -> occurrences since start-up
+        self.fixes = self.load_fixes()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.logger = logging.getLogger(f"error_journal.{os.path.abspath(path)}")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.logger.addHandler(handler)
+        self.writes = queue.Queue()
+        self.writer = threading.Thread(target=self.write_loop, name="error-journal", daemon=True)
+        self.writer.start()
+
+    def load_fixes(self):
+        try:
+            with open(self.fixes_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, result, code, attempt=1, session_id=None):
+        # Returns the error's signature
+        line_number = result.line_number
+        line_text = line_at(code, line_number)
+        signature = error_signature(result.error_type, result.error_message, line_text)
+        with self.lock:
+            count = self.counts[signature] = self.counts.get(signature, 0) + 1
+        record = {'time': time.time(), 'signature': signature, 'count': count, 'session_id': session_id, 'attempt': attempt}
+        if count == 1:
+            record.update({'type': result.error_type, 'message': result.error_message, 'line': line_number,
+                           'line_text': line_text, 'traceback': result.traceback, 'code': code})
+        self.writes.put(('record', record))
+        return signature
+
+    def known_fix(self, signature, code):
+        # The fix last recorded for signature, replayed on code; None when there is none or it does not fit
+        with self.lock:
+            fix = self.fixes.get(signature)
+            if fix is None:
+                return None
+            fix['used'] = time.time()
+            fix['uses'] = fix.get('uses', 0) + 1
+        fixed = apply_hunks(code, fix['hunks'])
+        return fixed if fixed is not None and fixed != code else None
+
+    def record_fix(self, signature, code, fixed):
+        hunks = fix_hunks(code, fixed)
+        if not hunks:
+            return
+        with self.lock:
+            self.fixes.pop(signature, None)
+            self.fixes[signature] = {'hunks': hunks, 'updated': time.time(), 'used': time.time(), 'uses': 0}
+            if len(self.fixes) > self.max_fixes:
+                for stale in sorted(self.fixes, key=lambda key: self.fixes[key]['used'])[:len(self.fixes) - self.max_fixes]:
+                    del self.fixes[stale]
+        self.writes.put(('fixes', None))
+
+    def forget_fix(self, signature):
+        # For a known fix that did not resolve its error after all
+        with self.lock:
+            if self.fixes.pop(signature, None) is None:
+                return
+        self.writes.put(('fixes', None))
+
+    def write_loop(self):
+        while True:
+            item = self.writes.get()
+            try:
+                if item is None:
+                    return
+                kind, record = item
+                if kind == 'record':
+                    self.logger.info(json.dumps(record))
+                else:
+                    self.save_fixes()
+            except Exception as e:
+                print(f"Error journal write failed: {e}")
+            finally:
+                self.writes.task_done()
+
+    def save_fixes(self):
+        with self.lock:
+            data = json.dumps(self.fixes)
+        os.makedirs(os.path.dirname(os.path.abspath(self.fixes_path)), exist_ok=True)
+        temp_path = f"{self.fixes_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temp_path, self.fixes_path)
+
+    def flush(self):
+        self.writes.join()
+
+    def close(self):
+        self.writes.put(None)
+        self.writer.join(timeout=5)
+        for handler in list(self.logger.handlers):
+            handler.close()
+            self.logger.removeHandler(handler)
+
+
+def create_error_journal(journal_config):
+    # journal_config is the "error_journal" config section; returns None when the journal is off
+    if not journal_config.get("enabled", True):
+        return None
+    return ErrorJournal(journal_config.get("file", "errors/errors.jsonl"),
+                        fixes_path=journal_config.get("fixes_file", "errors/fixes.json"),
+                        max_bytes=journal_config.get("max_mb", 5) * 1024 * 1024,
+                        backups=journal_config.get("backups", 3),
+                        max_fixes=journal_config.get("max_fixes", 1000))
@@ -0,0 +1,271 @@
+import argparse
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CANNED_REPLIES = [
+    "Sure. Here is a short explanation of list comprehensions: they build a list from an iterable in a single "
+    "expression, optionally filtering items with an if clause.",
+    "Here is a small example:\n\n```python\nsquares = [n * n for n in range(10)]\nprint(squares)\n```\n\n"
+    "It prints the squares of the numbers from 0 to 9.",
+    "Generators produce values lazily, one at a time, which keeps memory use flat for long sequences.",
+]
+
+CORRECTED_REPLY = "Here is the corrected code:\n\n```python\nprint('fixed')\n```\n"
+
+
+def split_tokens(text):
+    # Word-sized pieces with their trailing whitespace; joined back together they give the original text
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+def prompt_text(messages):
+    return "".join(f"<{message.get('role')}>{message.get('content', '')}" for message in messages)
+
+
+def shared_prefix(a, b):
+    length = min(len(a), len(b))
+    for index in range(length):
+        if a[index] != b[index]:
+            return index
+    return length
+
+
+def fake_embedding(text, dimensions=64):
+    # Deterministic vectors from hashed words, so texts sharing words come out similar
+    vector = [0.0] * dimensions
+    for word in re.findall(r"\w+", text.lower()):
+        vector[zlib.crc32(word.encode("utf-8")) % dimensions] += 1.0
+    return vector
+
+
+def canned_responder(replies=None):
+    replies = itertools.cycle(replies or CANNED_REPLIES)
+    lock = threading.Lock()
+
+    def respond(model, messages):
+        last = messages[-1]['content'] if messages else ""
+        if "produced an error" in last or "could not be found" in last:
+            return CORRECTED_REPLY
+        with lock:
+            return next(replies)
+    return respond
+
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-reply are cancelled generations, not server errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self.send_json({'models': [{'name': name, 'model': name} for name in self.server.fake.models]})
+        elif self.path == "/api/version":
+            self.send_json({'version': "0.0.0-fake"})
+        else:
+            self.send_json({'error': "not found"}, 404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        fake = self.server.fake
+        fake.count_request(self.path)
+        if self.path == "/api/chat":
+            messages = body.get('messages', [])
+            self.reply(body, fake.respond(body.get('model'), messages), chat=True, prompt=prompt_text(messages))
+        elif self.path == "/api/generate":
+            prompt = body.get('prompt', "")
+            if not prompt:
+                # An empty prompt only loads the model, as the real server does
+                self.send_json(self.final_part(body, chat=False, done_reason="load"))
+                return
+            messages = [{'role': 'user', 'content': prompt}]
+            self.reply(body, fake.respond(body.get('model'), messages), chat=False, prompt=prompt_text(messages))
+        elif self.path == "/api/embed":
+            texts = body.get('input', [])
+            texts = [texts] if isinstance(texts, str) else texts
+            self.send_json({'model': body.get('model'), 'embeddings': [fake_embedding(text) for text in texts]})
+        else:
+            self.send_json({'error': "not found"}, 404)
+
+    def final_part(self, body, chat, done_reason="stop", tokens=0, prompt_chars=0, duration=0.0):
+        part = {
+            'model': body.get('model'),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'done': True,
+            'done_reason': done_reason,
+            'eval_count': tokens,
+            'eval_duration': int(duration * 1e9),
+            'prompt_eval_count': prompt_chars // 4,
+            'load_duration': 0,
+        }
+        if chat:
+            part['message'] = {'role': 'assistant', 'content': ""}
+        else:
+            part['response'] = ""
+        return part
+
+    def text_part(self, body, chat, text):
+        part = {'model': body.get('model'), 'created_at': datetime.now(timezone.utc).isoformat(), 'done': False}
+        if chat:
+            part['message'] = {'role': 'assistant', 'content': text}
+        else:
+            part['response'] = text
+        return part
+
+    def reply(self, body, text, chat, prompt):
+        fake = self.server.fake
+        tokens = split_tokens(text)
+        start = time.monotonic()
+        prompt_chars = fake.evaluate_prompt(body.get('model'), prompt, text)
+        latency = fake.latency + (prompt_chars / 4 / fake.prefill_rate if fake.prefill_rate else 0.0)
+        with fake.lock:
+            fake.active += 1
+            fake.max_active = max(fake.max_active, fake.active)
+        try:
+            if not body.get('stream', True):
+                fake.wait_until(start + latency + len(tokens) / fake.tokens_per_second)
+                part = self.final_part(body, chat, tokens=len(tokens), prompt_chars=prompt_chars,
+                                       duration=time.monotonic() - start)
+                if chat:
+                    part['message']['content'] = text
+                else:
+                    part['response'] = text
+                self.send_json(part)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for index, token in enumerate(tokens):
+                # Paced against the start time, so slow writes do not push the whole reply later
+                fake.wait_until(start + latency + index / fake.tokens_per_second)
+                self.send_chunk(self.text_part(body, chat, token))
+            self.send_chunk(self.final_part(body, chat, tokens=len(tokens), prompt_chars=prompt_chars,
+                                            duration=time.monotonic() - start))
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client cancelled the generation
+        finally:
+            with fake.lock:
+                fake.active -= 1
+
+    def send_chunk(self, part):
+        data = (json.dumps(part) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def send_json(self, obj, status=200):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOllamaServer:
+    """A stand-in for the Ollama HTTP API that streams canned replies at a fixed token rate.
+
+    Supports /api/chat and /api/generate (streamed or not), /api/embed, /api/tags and /api/version, which
+    is all the app uses. responder(model, messages) picks each reply; the default cycles through CANNED_REPLIES and
+    answers correction prompts with working code. Point clients at it through OLLAMA_HOST=fake.url.
+    Like the real server, it keeps the last prompt and reply of each model and only evaluates the part of
+    a new prompt that differs from it; with prefill_rate set, that part adds to the time to first token.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, tokens_per_second=200, latency=0.05, responder=None, models=("llama3.1",),
+                 prefill_rate=0):
+        self.tokens_per_second = tokens_per_second
+        self.latency = latency  # Seconds before the first token, on top of prompt evaluation
+        self.prefill_rate = prefill_rate  # Prompt tokens evaluated per second; 0 makes evaluation free
+        self.kept = {}  # model -> text of the last prompt and reply, standing in for the model's cached state
+        self.prompt_chars = 0
+        self.evaluated_chars = 0
+        self.respond = responder or canned_responder()
+        self.models = list(models)
+        self.lock = threading.Lock()
+        self.requests = {}  # path -> count
+        self.active = 0
+        self.max_active = 0
+        self.server = FakeHTTPServer((host, port), FakeOllamaHandler)
+        self.server.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def evaluate_prompt(self, model, prompt, reply):
+        # Returns the characters of prompt that had to be evaluated
+        with self.lock:
+            evaluated = len(prompt) - shared_prefix(self.kept.get(model, ""), prompt)
+            self.kept[model] = prompt + f"<assistant>{reply}"
+            self.prompt_chars += len(prompt)
+            self.evaluated_chars += evaluated
+        return evaluated
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def wait_until(self, deadline):
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-ollama", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve canned replies over the Ollama API for testing and benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--rate", type=float, default=50, help="tokens per second")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--reply-file", help="text file with replies separated by lines containing only ---")
+    args = parser.parse_args()
+    replies = None
+    if args.reply_file:
+        with open(args.reply_file, "r", encoding="utf-8") as f:
+            replies = [reply.strip() for reply in re.split(r"^---$", f.read(), flags=re.M) if reply.strip()]
+    fake = FakeOllamaServer(args.host, args.port, args.rate, args.latency, canned_responder(replies))
+    print(f"Fake Ollama listening on {fake.url} ({args.rate} tokens/s, {args.latency}s latency)")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
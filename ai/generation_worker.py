@@ -0,0 +1,373 @@
+import queue
+import socket
+import threading
+import time
+from collections import deque
+from context_window import message_tokens, shared_prefix_tokens
+
+
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.closers = []
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def add_closer(self, closer):
+        # Closers tear down whatever the request is blocked on (e.g. the HTTP stream)
+        with self.lock:
+            if not self.event.is_set():
+                self.closers.append(closer)
+                return
+        closer()
+
+    def remove_closer(self, closer):
+        # For a stream that has ended: its connection goes back to a shared pool and must not be torn
+        # down by a later cancel. Waits for a cancel that is running closers right now.
+        with self.lock:
+            if closer in self.closers:
+                self.closers.remove(closer)
+
+    def cancel(self):
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            # Closers run under the lock, so remove_closer() returning means none of them is still running
+            for closer in self.closers:
+                try:
+                    closer()
+                except Exception:
+                    pass
+            self.closers = []
+
+
+def abort_response(response):
+    # Shutting the socket down wakes a thread blocked reading the stream; a plain close() does not.
+    # A closed response has handed its connection back to the client's pool, so it is left alone.
+    if response.is_closed:
+        return
+    network_stream = response.extensions.get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is not None:
+        sock.shutdown(socket.SHUT_RDWR)
+    else:
+        response.close()
+
+
+stream_state = threading.local()  # The CancelToken of the stream being read on this thread, and its closers
+clients = {}
+clients_lock = threading.Lock()
+
+
+def register_response(response):
+    # httpx runs response hooks on the thread that sent the request, which is the one reading the stream
+    token = getattr(stream_state, "token", None)
+    if token is not None:
+        def closer():
+            abort_response(response)
+        stream_state.closers.append(closer)
+        token.add_closer(closer)
+
+
+def create_client(host=None):
+    # Building an ollama.Client costs tens of milliseconds (TLS setup), so one is shared per host; it also
+    # keeps connections alive between requests. ollama.Client forwards extra keyword arguments to httpx,
+    # so the response hook hands us each live response.
+    with clients_lock:
+        if host not in clients:
+            import ollama  # Deferred: the client and its HTTP stack are the slowest part of starting the app
+            clients[host] = ollama.Client(host=host, event_hooks={"response": [register_response]})
+        return clients[host]
+
+
+def open_chat_stream(model, messages, options=None, token=None, host=None, **kwargs):
+    stream = create_client(host).chat(model=model, messages=messages, stream=True, options=options, **kwargs)
+    return read_with_token(stream, token)
+
+
+def release_closers(token, closers):
+    if token is not None:
+        for closer in closers:
+            token.remove_closer(closer)
+    del closers[:]
+
+
+def read_with_token(stream, token):
+    # The request is only sent on the first read, so the token is made visible to the hook while reading.
+    # The stream's closers are dropped as soon as its last part arrives: reading on from there closes the
+    # response and returns its connection to the client's pool, where a late cancel would cut off
+    # whichever request uses it next.
+    previous = getattr(stream_state, "token", None), getattr(stream_state, "closers", None)
+    closers = []
+    stream_state.token, stream_state.closers = token, closers
+    try:
+        for part in stream:
+            if part.get('done'):
+                release_closers(token, closers)
+            yield part
+    finally:
+        release_closers(token, closers)
+        stream_state.token, stream_state.closers = previous
+
+
+def stream_chat(model, messages, options=None, token=None, cache=None, use_cache=True, keep_alive=None, metrics=None,
+                host=None):
+    # Yields reply text chunks; cache hits are replayed chunk by chunk so callers cannot tell the difference.
+    # metrics (a telemetry.GenerationMetrics) is finished however the stream ends
+    error = None
+    try:
+        key = None
+        if cache is not None and use_cache:
+            key = cache.make_key(model, messages, options)
+            chunks = cache.get(key)
+            if chunks is not None:
+                if metrics is not None:
+                    metrics.cached = True
+                for chunk in chunks:
+                    if token is not None and token.cancelled:
+                        return
+                    if metrics is not None:
+                        metrics.chunk(chunk)
+                    yield chunk
+                return
+        parts = []
+        stream = open_chat_stream(model, messages, options, token, host, keep_alive=keep_alive)
+        try:
+            for part in stream:
+                if token is not None and token.cancelled:
+                    return
+                text = part['message']['content']
+                if metrics is not None:
+                    if part.get('done'):
+                        metrics.final(part)
+                    if text:
+                        metrics.chunk(text)
+                parts.append(text)
+                yield text
+        finally:
+            if hasattr(stream, "close"):
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+        # Only complete replies are cached; cache=None or use_cache=False bypasses both lookup and store
+        if key is not None:
+            cache.put(key, parts, model)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if metrics is not None:
+            metrics.finish(token is not None and token.cancelled, error)
+
+
+class GenerationRequest:
+    def __init__(self, messages, model="llama3.1", options=None, on_chunk=None, on_done=None, on_error=None, use_cache=True,
+                 keep_alive=None):
+        # messages may be a callable so the prompt is built when the request starts, not when it is queued
+        self.messages = messages
+        self.model = model
+        self.options = options
+        self.keep_alive = keep_alive
+        self.on_chunk = on_chunk
+        self.on_done = on_done
+        self.on_error = on_error
+        self.use_cache = use_cache
+        self.token = CancelToken()
+        self.submitted = time.monotonic()
+        self.done = threading.Event()  # Set once on_done or on_error has been called
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def resolve_messages(self):
+        return self.messages() if callable(self.messages) else self.messages
+
+    def cancel(self):
+        self.token.cancel()
+
+
+class GenerationLane:
+    """One conversation's queue in a GenerationPool; its requests run one at a time, in order.
+
+    Has the interface of a single-conversation worker: submit(), busy(), cancel_current(), cancel_all().
+    """
+
+    def __init__(self, pool, max_pending=4, supersede=False):
+        self.pool = pool
+        self.max_pending = max_pending
+        self.supersede = supersede
+        self.pending = deque()
+        self.current = None
+        self.last_prompt = None  # (model, options, messages) of the last generation, its reply included
+        self.prompt_scale = None  # telemetry.GenerationMetrics.prompt_scale, per (model, options)
+
+    def reusable_tokens(self, request, messages):
+        # Prompt tokens the server can take from the state it kept after this lane's previous generation
+        if self.last_prompt is None or self.last_prompt[:2] != (request.model, request.options):
+            return 0
+        return shared_prefix_tokens(self.last_prompt[2], messages)
+
+    def submit(self, request):
+        # Raises queue.Full when max_pending requests are already waiting
+        if self.supersede:
+            self.cancel_all()
+        with self.pool.condition:
+            if len(self.pending) >= self.max_pending:
+                raise queue.Full
+            self.pending.append(request)
+            self.pool.condition.notify()
+        return request
+
+    def has_room(self):
+        # Whether submit() would take another request now
+        return self.supersede or len(self.pending) < self.max_pending
+
+    def busy(self):
+        return self.current is not None or bool(self.pending)
+
+    def queue_depth(self):
+        return len(self.pending)
+
+    def cancel_current(self):
+        with self.pool.condition:
+            current = self.current
+        if current is not None:
+            current.cancel()
+
+    def cancel_all(self):
+        with self.pool.condition:
+            pending, self.pending = list(self.pending), deque()
+        for request in pending:
+            request.cancel()
+            self.pool.finish(request, "")
+        self.cancel_current()
+
+    def shutdown(self):
+        self.cancel_all()
+        self.pool.remove_lane(self)
+
+
+class GenerationPool:
+    """A fixed number of generation threads shared by every conversation.
+
+    Each conversation gets a lane. Idle threads take the next request round-robin across lanes that have
+    one waiting and nothing in flight, so a long reply in one chat delays the others by at most a turn,
+    and the Ollama server never sees more than `workers` generations at once.
+    """
+
+    def __init__(self, workers=2, cache=None, telemetry=None):
+        self.cache = cache
+        self.telemetry = telemetry
+        self.condition = threading.Condition()
+        self.lanes = []
+        self.next_lane = 0  # Where the round-robin scan starts
+        self.running = True
+        self.threads = [threading.Thread(target=self.run, name=f"generation-{index}", daemon=True)
+                        for index in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def lane(self, max_pending=4, supersede=False):
+        lane = GenerationLane(self, max_pending, supersede)
+        with self.condition:
+            self.lanes.append(lane)
+        return lane
+
+    def remove_lane(self, lane):
+        with self.condition:
+            if lane in self.lanes:
+                index = self.lanes.index(lane)
+                self.lanes.remove(lane)
+                if index < self.next_lane:
+                    self.next_lane -= 1
+
+    def next_request(self):
+        # Returns (lane, request), or None once the pool is shut down
+        with self.condition:
+            while self.running:
+                count = len(self.lanes)
+                for offset in range(count):
+                    index = (self.next_lane + offset) % count
+                    lane = self.lanes[index]
+                    if lane.pending and lane.current is None:
+                        lane.current = lane.pending.popleft()
+                        self.next_lane = (index + 1) % count
+                        return lane, lane.current
+                self.condition.wait()
+        return None
+
+    def run(self):
+        while True:
+            task = self.next_request()
+            if task is None:
+                break
+            lane, request = task
+            try:
+                self.process(request, lane)
+            finally:
+                with self.condition:
+                    lane.current = None
+                    self.condition.notify()  # The lane may have more waiting
+
+    def queue_depth(self):
+        with self.condition:
+            return sum(len(lane.pending) for lane in self.lanes)
+
+    def shutdown(self):
+        with self.condition:
+            self.running = False
+            lanes = list(self.lanes)
+            self.condition.notify_all()
+        for lane in lanes:
+            lane.cancel_all()
+
+    def process(self, request, lane=None):
+        if request.token.cancelled:
+            self.finish(request, "")
+            return
+        parts = []
+        metrics = None
+        if self.telemetry is not None:
+            metrics = self.telemetry.start("chat", request.model, time.monotonic() - request.submitted)
+        messages = []
+        try:
+            messages = request.resolve_messages()
+            if metrics is not None:
+                metrics.prompt_tokens = message_tokens(messages)
+                if lane is not None:
+                    metrics.reused_tokens = lane.reusable_tokens(request, messages)
+                    if lane.prompt_scale is not None and lane.prompt_scale[0] == (request.model, request.options):
+                        metrics.prompt_scale = lane.prompt_scale[1]
+            for text in stream_chat(request.model, messages, request.options, request.token,
+                                    self.cache, request.use_cache, request.keep_alive, metrics):
+                parts.append(text)
+                if request.on_chunk:
+                    request.on_chunk(text)
+        except Exception as e:
+            # Errors raised by closing the stream underneath us are just the cancellation
+            if not request.token.cancelled:
+                if lane is not None:
+                    lane.last_prompt = None
+                if request.on_error:
+                    request.on_error(e)
+                request.done.set()
+                return
+        full_reply = "".join(parts)
+        if lane is not None and metrics is not None and not metrics.cached and metrics.reused_tokens == 0 \
+                and metrics.prompt_eval_count and metrics.prompt_tokens:
+            # Nothing could be reused, so the server's count is the whole prompt: calibrates later estimates
+            lane.prompt_scale = ((request.model, request.options), metrics.prompt_eval_count / metrics.prompt_tokens)
+        if lane is not None and not (metrics is not None and metrics.cached):
+            # What the server evaluated for this generation, which the next prompt of the conversation extends
+            lane.last_prompt = (request.model, request.options, messages + [{'role': 'assistant', 'content': full_reply}])
+        self.finish(request, full_reply)
+
+    def finish(self, request, full_reply):
+        if request.on_done:
+            request.on_done(full_reply, request.token.cancelled)
+        request.done.set()
@@ -1,11 +1,39 @@
-import tkinter as tk
+import time
+STARTED = time.perf_counter()  # Before any other import, so --profile-startup covers them
+import argparse
+import sys
 from config_manager import ConfigManager
-from ollama_chat_app import OllamaChatApp
+from telemetry import StartupProfile
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ollama Chat. Without --batch the chat window opens.")
+    parser.add_argument("--batch", metavar="PROMPTS_JSONL", help="Run a JSONL file of prompts without the GUI")
+    parser.add_argument("--output", default="batch_results.jsonl", help="Results JSONL; existing ok results are skipped")
+    parser.add_argument("--host", action="append", help="Ollama host to use; repeat for several (default: OLLAMA_HOST)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts in flight per host")
+    parser.add_argument("--model", help="Model for every prompt (default: the configured chat model)")
+    parser.add_argument("--system-prompt", help="System prompt name (default: the configured default prompt)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use or fill the response cache")
+    parser.add_argument("--profile-startup", action="store_true", help="Print the time of each start-up phase once the window is drawn")
+    return parser.parse_args(argv)
 
 def main():
-    root = tk.Tk()
+    startup = StartupProfile(STARTED)
+    args = parse_args()
+    startup.mark("imports")
     config_manager = ConfigManager()
-    app = OllamaChatApp(root, config_manager)
+    startup.mark("config")
+    if args.batch:
+        from batch_runner import run_batch
+        sys.exit(run_batch(config_manager, args))
+    # Tk is only needed for the window, so batch runs work on machines without a display
+    import tkinter as tk
+    startup.mark("import tkinter")
+    from ollama_chat_app import OllamaChatApp
+    startup.mark("import app")
+    root = tk.Tk()
+    startup.mark("create window")
+    app = OllamaChatApp(root, config_manager, startup, print_startup=args.profile_startup)
     root.mainloop()
 
 if __name__ == "__main__":
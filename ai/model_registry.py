@@ -0,0 +1,139 @@
+import threading
+from context_window import estimate_tokens
+from generation_worker import create_client
+
+
+DEFAULT_MODELS = {
+    "chat": {"name": "llama3.1", "options": {"num_ctx": 8192}, "keep_alive": "30m"},
+    "correction": {"name": "llama3.1", "options": {"num_ctx": 4096}, "keep_alive": "10m"},
+    "summary": {"name": "llama3.1", "options": {"num_ctx": 4096, "temperature": 0.2}, "keep_alive": "5m"},
+}
+
+SUMMARY_PROMPT = ("Summarize the conversation below for your own future reference. Keep names, numbers, decisions, "
+                  "code identifiers and open questions. Use short bullet points and no preamble.")
+
+
+class ModelProfile:
+    def __init__(self, role, name, options=None, keep_alive=None):
+        self.role = role
+        self.name = name
+        self.options = dict(options or {})
+        self.keep_alive = keep_alive
+
+
+class ModelRegistry:
+    """Which model, options and keep_alive to use for chat, correction and summarisation.
+
+    Also loads the models in the background at startup, including the embedding model when recall uses
+    Ollama, and keeps the chat and embedding models resident with periodic empty requests, so neither the
+    first message after idle nor its recall pays the model load time.
+    """
+
+    def __init__(self, config_manager, keep_alive_interval=240):
+        self.config_manager = config_manager
+        self.keep_alive_interval = keep_alive_interval
+        self.server_models = []  # Names reported by the Ollama server, filled in by refresh_models()
+        self.stop_event = threading.Event()
+        self.keep_alive_thread = None
+
+    def models_config(self):
+        configured = self.config_manager.get("models", {})
+        return {role: dict(DEFAULT_MODELS[role], **configured.get(role, {})) for role in DEFAULT_MODELS}
+
+    def profile(self, role):
+        settings = self.models_config()[role]
+        return ModelProfile(role, settings["name"], settings.get("options"), settings.get("keep_alive"))
+
+    def set_model(self, role, name):
+        configured = self.config_manager.get("models", {})
+        configured[role] = dict(configured.get(role, {}), name=name)
+        self.config_manager.set("models", configured)
+        threading.Thread(target=self.load, args=(self.profile(role),), daemon=True).start()
+
+    def known_models(self):
+        names = [settings["name"] for settings in self.models_config().values()] + self.server_models
+        return sorted(set(names))
+
+    def refresh_models(self):
+        try:
+            listing = create_client().list()
+        except Exception:
+            return self.server_models
+        self.server_models = [model.get('model') or model.get('name') for model in listing['models']]
+        return self.server_models
+
+    def context_budget(self, role="chat"):
+        # An explicit context_budgets entry wins; otherwise leave a quarter of num_ctx for the reply
+        profile = self.profile(role)
+        budgets = self.config_manager.get("context_budgets", {})
+        if profile.name in budgets:
+            return budgets[profile.name]
+        if profile.options.get("num_ctx"):
+            return profile.options["num_ctx"] * 3 // 4
+        return budgets.get("default", 4096)
+
+    def load(self, profile):
+        # An empty prompt makes Ollama load the model and keep it for keep_alive without generating anything
+        try:
+            create_client().generate(model=profile.name, prompt="", keep_alive=profile.keep_alive)
+            return True
+        except Exception:
+            return False
+
+    def load_embedding_model(self):
+        # The embedding model behind recall, if it is on and served by Ollama; an empty input loads it
+        retrieval_config = self.config_manager.get("retrieval", {})
+        if not retrieval_config.get("enabled", False) or retrieval_config.get("embedder", "ollama") != "ollama":
+            return False
+        try:
+            create_client(retrieval_config.get("host")).embed(model=retrieval_config.get("model", "nomic-embed-text"),
+                                                              input="", keep_alive=retrieval_config.get("keep_alive"))
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self):
+        def run():
+            self.refresh_models()
+            loaded = set()
+            for role in ("chat", "correction", "summary"):
+                profile = self.profile(role)
+                if profile.name not in loaded:
+                    loaded.add(profile.name)
+                    self.load(profile)
+            self.load_embedding_model()
+        threading.Thread(target=run, name="model-warm-up", daemon=True).start()
+
+    def start_keep_alive(self):
+        if self.keep_alive_thread is None and self.keep_alive_interval:
+            self.keep_alive_thread = threading.Thread(target=self.run_keep_alive, name="model-keep-alive", daemon=True)
+            self.keep_alive_thread.start()
+
+    def run_keep_alive(self):
+        while not self.stop_event.wait(self.keep_alive_interval):
+            self.load(self.profile("chat"))
+            self.load_embedding_model()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def summary_refiner(self, context, version, previous_summary, folded_messages):
+        # ContextWindow keeps its instant extractive summary; this replaces it with a model-written one
+        # in the background, as long as no further turns were folded in the meantime
+        def run():
+            profile = self.profile("summary")
+            transcript = "\n".join(f"{message['role']}: {message['content']}" for message in folded_messages)
+            if previous_summary:
+                transcript = f"Earlier summary:\n{previous_summary}\n\nNew turns:\n{transcript}"
+            try:
+                response = create_client().chat(model=profile.name, options=profile.options, keep_alive=profile.keep_alive,
+                                       messages=[{'role': 'system', 'content': SUMMARY_PROMPT},
+                                                 {'role': 'user', 'content': transcript}])
+            except Exception:
+                return
+            summary = response['message']['content'].strip()
+            if estimate_tokens(summary) > context.summary_tokens:
+                summary = summary[:context.summary_tokens * 4]
+            if summary:
+                context.apply_summary(summary, version)
+        threading.Thread(target=run, name="summary", daemon=True).start()
@@ -1,27 +1,65 @@
 import tkinter as tk
-from tkinter import scrolledtext, Menu, messagebox, simpledialog, colorchooser, Listbox, Toplevel
+from tkinter import ttk, Menu, messagebox, simpledialog, colorchooser, filedialog, Listbox, Toplevel
 import threading
-import time
-import ollama
 from config_manager import ConfigManager
-from utility import Utility
-import os
-import gc
-import pyperclip  # Needed for copy to clipboard functionality
+from chat_session import SessionServices
+from chat_tab import ChatTab
+from telemetry import EventLoopMonitor
+from tool_scheduler import ToolScheduler, MODES
+import queue
+import time
 
 class OllamaChatApp:
-    def __init__(self, root, config_manager):
+    def __init__(self, root, config_manager, startup=None, print_startup=False):
         self.root = root
         self.config_manager = config_manager
-        self.typing = True
+        self.startup = startup  # telemetry.StartupProfile, finished once the window is drawn
+        self.print_startup = print_startup
         self.current_canvas = None
         self.history_index = -1
         self.input_history = []
-        self.output_lock = threading.Lock()
-        self.conversation_history = []  # For context history
-        self.max_history_length =50  # Maximum number of history entries to retain
+        self.last_search = ""
+        self.search_position = 0
         self.utility_tools = self.config_manager.get("utility_tools", {})  # Load utility tools from config
+        self.services = SessionServices(self.config_manager)  # Shared by the sessions of all tabs
+        self.mark_startup("services")
+        self.tabs = {}  # Notebook tab id -> ChatTab
+        self.tab_count = 0
+        self.shown_tab = None
+        self.tool_tabs = {}  # Tool name -> ChatTab its output goes to; only changed on the Tk thread
+        execution_config = self.config_manager.get("code_execution", {})
+        self.tool_scheduler = ToolScheduler(workers=execution_config.get("tool_workers", 2),
+                                            timeout=execution_config.get("tool_timeout", 60),
+                                            output_factory=self.tool_output,
+                                            environment=self.services.tool_environment,
+                                            runtime=self.services.tool_runtime)
+        if self.services.store is not None:
+            self.input_history = self.services.store.recent_inputs()  # Up/Down reaches messages from earlier runs
         self.setup_ui()
+        self.mark_startup("widgets")
+        self.root.after_idle(self.finish_startup)
+
+    def mark_startup(self, phase):
+        if self.startup is not None:
+            self.startup.mark(phase)
+
+    def finish_startup(self):
+        # Runs once the window is up; loading models and everything else that can wait starts only now
+        self.root.update_idletasks()
+        if self.startup is not None:
+            self.startup.mark("first draw")
+            self.services.telemetry.write(self.startup.as_record())
+            if self.print_startup:
+                print(self.startup.report())
+        self.services.warm_up()
+
+    @property
+    def current_tab(self):
+        return self.tabs[self.notebook.select()]
+
+    @property
+    def session(self):
+        return self.current_tab.session
 
     def setup_ui(self):
         self.root.title("Ollama Chat")
@@ -32,24 +70,70 @@ class OllamaChatApp:
         self.create_chat_widgets()
         self.create_buttons()
 
+        self.new_tab()
+
+        self.status_bar = tk.Label(self.root, anchor=tk.W, bg='#2C2F33', fg='#99AAB5', font=('Courier', 9))
+        if self.status_bar_var.get():
+            self.status_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.notebook)
+        self.ui_samples = 0
+        self.event_loop_monitor = EventLoopMonitor(self.root, self.on_ui_sample)
+        self.event_loop_monitor.start()
+
         self.update_text_widget_styles()
 
+    def new_tab(self, prompt_name=None):
+        self.tab_count += 1
+        tab = ChatTab(self, self.services, f"Chat {self.tab_count}", prompt_name)
+        self.notebook.add(tab.frame, text=tab.title)
+        self.tabs[str(tab.frame)] = tab
+        self.notebook.select(tab.frame)
+        self.on_tab_changed()
+        return tab
+
+    def close_tab(self):
+        tab = self.current_tab
+        if len(self.tabs) == 1:
+            self.new_tab()  # There is always a tab to type into
+        del self.tabs[str(tab.frame)]
+        if self.shown_tab is tab:
+            self.shown_tab = None
+        self.notebook.forget(tab.frame)
+        # Tools writing to this tab carry on in the one shown in its place
+        for tool_name, tool_tab in list(self.tool_tabs.items()):
+            if tool_tab is tab:
+                self.tool_tabs[tool_name] = self.current_tab
+        tab.close()
+
+    def on_tab_changed(self, event=None):
+        # Only the visible tab draws; the others buffer their text until they are shown
+        tab = self.tabs.get(self.notebook.select())
+        if tab is None or tab is self.shown_tab:
+            return
+        if self.shown_tab is not None:
+            self.shown_tab.hide()
+        self.shown_tab = tab
+        tab.show()
+
+    def fill_prompt_menu(self):
+        menu = self.tab_prompt_menu
+        menu.delete(0, tk.END)
+        self.tab_prompt_var.set(self.session.prompt_name or "")
+        menu.add_radiobutton(label="Default", value="", variable=self.tab_prompt_var, command=self.select_tab_prompt)
+        for name in self.config_manager.get("system_prompts"):
+            menu.add_radiobutton(label=name, value=name, variable=self.tab_prompt_var, command=self.select_tab_prompt)
+
+    def select_tab_prompt(self):
+        self.session.prompt_name = self.tab_prompt_var.get() or None
+        self.update_chat_history(f"System prompt for this tab: {self.session.prompt_name or 'Default'}\n", "ollama")
+
     def copy_to_clipboard(self):
-      self.chat_history.configure(state=tk.NORMAL)
-      text_lines = self.chat_history.get("1.0", tk.END).strip().split("\n")
-    
-      ai_responses = []
-      collecting = False
-
-      for line in text_lines:
-          if line.startswith("You:"):
-              collecting = True
-              ai_responses = []  # Start collecting new AI responses after the last user query
-          elif collecting and not line.startswith("You:"):
-              ai_responses.append(line.strip())
-    
-      if ai_responses:
-          pyperclip.copy("\n".join(ai_responses))
+      tab = self.current_tab
+      tab.renderer.flush()
+      # Read from the transcript, which still has replies trimmed out of the widget
+      reply = tab.transcript.latest_reply().strip()
+      if reply:
+          import pyperclip  # Only loaded once something is copied
+          pyperclip.copy("\n".join(line.strip() for line in reply.split("\n")))
         # Optionally, show a messagebox:
         # messagebox.showinfo("Copy to Clipboard", "AI responses copied to clipboard.")
       else:
@@ -57,13 +141,46 @@ class OllamaChatApp:
         # messagebox.showwarning("Copy to Clipboard", "No AI response found to copy.")
           pass
 
-      self.chat_history.configure(state=tk.DISABLED)
+    def find_in_transcript(self):
+        query = simpledialog.askstring("Find", "Find in transcript:", initialvalue=self.last_search)
+        if not query:
+            return
+        tab = self.current_tab
+        tab.renderer.flush()
+        matches = tab.transcript.search(query)
+        if not matches:
+            messagebox.showinfo("Find", f"'{query}' not found.")
+            return
+        # Repeating a search moves on to the next older match
+        self.search_position = self.search_position - 1 if query == self.last_search else len(matches) - 1
+        self.search_position %= len(matches)
+        self.last_search = query
+        entry = matches[self.search_position]
+        tab.chat_history.tag_remove("search_match", "1.0", tk.END)
+        if tab.transcript_view.show(entry):
+            start = tab.chat_history.search(query, entry.mark, tk.END, nocase=True)
+            if start:
+                tab.chat_history.tag_add("search_match", start, f"{start} + {len(query)} chars")
+                tab.chat_history.see(start)
+
+    def export_transcript(self):
+        path = filedialog.asksaveasfilename(defaultextension=".md",
+                                            filetypes=[("Markdown", "*.md"), ("JSON Lines", "*.jsonl"), ("All files", "*.*")])
+        if path:
+            self.current_tab.renderer.flush()
+            self.current_tab.transcript.export(path)
 
     def create_menu_bar(self):
         menu_bar = Menu(self.root)
         self.root.config(menu=menu_bar)
 
         file_menu = Menu(menu_bar, tearoff=0)
+        file_menu.add_command(label="New Tab", command=self.new_tab, accelerator="Ctrl+T")
+        file_menu.add_command(label="Close Tab", command=self.close_tab, accelerator="Ctrl+W")
+        file_menu.add_command(label="New Session", command=self.new_session)
+        file_menu.add_command(label="Search Sessions", command=self.search_sessions, accelerator="Ctrl+Shift+F")
+        file_menu.add_command(label="Find in Transcript", command=self.find_in_transcript, accelerator="Ctrl+F")
+        file_menu.add_command(label="Export Transcript", command=self.export_transcript)
         file_menu.add_command(label="Exit", command=self.exit_app)
         menu_bar.add_cascade(label="File", menu=file_menu)
 
@@ -71,6 +188,25 @@ class OllamaChatApp:
         prompt_menu.add_command(label="Manage System Prompts", command=self.manage_system_prompts)
         menu_bar.add_cascade(label="System Prompt", menu=prompt_menu)
 
+        chat_menu = Menu(menu_bar, tearoff=0)
+        self.tab_prompt_var = tk.StringVar()
+        self.tab_prompt_menu = Menu(chat_menu, tearoff=0, postcommand=self.fill_prompt_menu)
+        chat_menu.add_cascade(label="System Prompt for This Tab", menu=self.tab_prompt_menu)
+        self.supersede_var = tk.BooleanVar(value=self.config_manager.get("supersede_generation", False))
+        chat_menu.add_checkbutton(label="New Message Replaces Current Reply", variable=self.supersede_var, command=self.toggle_supersede)
+        self.status_bar_var = tk.BooleanVar(value=self.config_manager.get("status_bar", False))
+        chat_menu.add_checkbutton(label="Show Status Bar", variable=self.status_bar_var, command=self.toggle_status_bar)
+        menu_bar.add_cascade(label="Chat", menu=chat_menu)
+
+        self.model_vars = {}
+        model_menu = Menu(menu_bar, tearoff=0)
+        for role, label in (("chat", "Chat Model"), ("correction", "Correction Model"), ("summary", "Summary Model")):
+            self.model_vars[role] = tk.StringVar(value=self.services.model_registry.profile(role).name)
+            role_menu = Menu(model_menu, tearoff=0, postcommand=lambda role=role: self.fill_model_menu(role))
+            model_menu.add_cascade(label=label, menu=role_menu)
+            self.model_vars[role].menu = role_menu
+        menu_bar.add_cascade(label="Model", menu=model_menu)
+
         utility_menu = Menu(menu_bar, tearoff=0)
         utility_menu.add_command(label="Manage Utility Tools", command=self.manage_utility_tools)
         menu_bar.add_cascade(label="Utility Tools", menu=utility_menu)
@@ -86,13 +222,10 @@ class OllamaChatApp:
         menu_bar.add_cascade(label="Help", menu=help_menu)
 
     def create_chat_widgets(self):
-        self.chat_history = scrolledtext.ScrolledText(self.root, wrap=tk.WORD, state=tk.DISABLED, font=('Courier', self.config_manager.get("font_size")), 
-                                                      bg=self.config_manager.get("background_color"), fg=self.config_manager.get("foreground_color"))
-        self.chat_history.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
-        self.chat_history.tag_configure("user", foreground="#7289DA")
-        self.chat_history.tag_configure("ollama", foreground="#99AAB5")
-        self.chat_history.tag_configure("error", foreground="#FF5555")
-        self.chat_history.tag_configure("result", foreground="#00FF00")
+        # One tab per chat; the input box and buttons below act on the selected one
+        self.notebook = ttk.Notebook(self.root)
+        self.notebook.pack(fill=tk.BOTH, expand=True)
+        self.notebook.bind('<<NotebookTabChanged>>', self.on_tab_changed)
 
         self.input_text = tk.Text(self.root, height=4, font=('Courier', self.config_manager.get("font_size")), 
                                   bg=self.config_manager.get("background_color"), fg=self.config_manager.get("foreground_color"), insertbackground='white')
@@ -107,6 +240,7 @@ class OllamaChatApp:
         send_button = tk.Button(button_frame, text="Send (Ctrl+Enter)", command=self.send_message, bg='#7289DA', fg='#FFFFFF', font=('Courier', 12))
         send_button.pack(side=tk.LEFT, padx=5, pady=5)
         self.root.bind('<Control-Return>', lambda event: self.send_message())
+        self.root.bind('<Control-Shift-Return>', lambda event: self.send_message(use_cache=False))
 
         stop_button = tk.Button(button_frame, text="Stop (Ctrl+S)", command=self.stop_typing, bg='#FF5555', fg='#FFFFFF', font=('Courier', 12))
         stop_button.pack(side=tk.LEFT, padx=5, pady=5)
@@ -120,140 +254,67 @@ class OllamaChatApp:
         copy_button.pack(side=tk.LEFT, padx=5, pady=5)
         self.root.bind('<Control-Shift-B>', lambda event: self.copy_to_clipboard())
 
+        kill_button = tk.Button(button_frame, text="Kill Code (Ctrl+K)", command=self.kill_running_code, bg='#AA3333', fg='#FFFFFF', font=('Courier', 12))
+        kill_button.pack(side=tk.LEFT, padx=5, pady=5)
+        self.root.bind('<Control-k>', lambda event: self.kill_running_code())
+        self.root.bind('<Control-f>', lambda event: self.find_in_transcript())
+        self.root.bind('<Control-Shift-F>', lambda event: self.search_sessions())
+        self.root.bind('<Control-t>', lambda event: self.new_tab())
+        self.root.bind('<Control-w>', lambda event: self.close_tab())
+
 
-    def send_message(self):
+    def send_message(self, use_cache=True):
         user_message = self.input_text.get("1.0", tk.END).strip()
         if not user_message:
             return
         self.input_history.append(user_message)
         self.history_index = -1
         self.input_text.delete("1.0", tk.END)
-        self.input_text.config(state=tk.DISABLED)
         if self.current_canvas:
             self.current_canvas.get_tk_widget().pack_forget()
             self.current_canvas = None
-        self.update_chat_history(f"You: {user_message}\n", "user")
-        
-        # Add user message to conversation history
-        self.conversation_history.append({'role': 'user', 'content': user_message})
-        # Trim conversation history if it exceeds the maximum length
-        if len(self.conversation_history) > self.max_history_length:
-            self.conversation_history.pop(0)
-
-        self.typing = True
-        threading.Thread(target=self.fetch_response, args=(user_message,)).start()
-
-    def extract_error_line(self, error_message, code):
+
+        tab = self.current_tab
+        if tab.name_after(user_message):
+            self.notebook.tab(tab.frame, text=tab.title)
         try:
-            parts = error_message.split("line")
-            if len(parts) > 1:
-                line_number_part = parts[1].split(":")[0].strip()
-                if line_number_part.isdigit():
-                    line_number = int(line_number_part)
-                    code_lines = code.splitlines()
-                    if 0 < line_number <= len(code_lines):
-                        return code_lines[line_number - 1], line_number
-                    else:
-                        return f"Line number {line_number} is out of range for the provided code.", line_number
-                else:
-                    return "Could not determine the line number from the error message.", None
-            else:
-                return "Could not find the line number in the error message.", None
-        except Exception as e:
-            print(f"Error extracting line number: {str(e)}")
-            return None, None
-
-    def highlight_problematic_code(self, error_message, code):
-        error_line, line_number = self.extract_error_line(error_message, code)
-        if error_line and line_number:
-            print(f"\nError in the following line (Line {line_number}):\n\n{error_line.strip()}\n\n")
-            print("Suggested correction:")
-            if "invalid syntax" in error_message:
-                print("Check for missing or extra characters, such as a misplaced comma, parenthesis, or colon.")
-            elif "must be dict" in error_message:
-                print("Ensure that the 'globals' argument is passed as a dictionary and not None.")
+            tab.session.send(user_message, use_cache)
+        except queue.Full:
+            self.update_chat_history("Too many messages are waiting for a reply. Please wait or press Stop.\n", "error")
+
+    def fill_model_menu(self, role):
+        # Rebuilt each time the menu opens; the server's model list is refreshed in the background for next time
+        threading.Thread(target=self.services.model_registry.refresh_models, daemon=True).start()
+        menu = self.model_vars[role].menu
+        menu.delete(0, tk.END)
+        for name in self.services.model_registry.known_models():
+            menu.add_radiobutton(label=name, value=name, variable=self.model_vars[role],
+                                 command=lambda role=role: self.select_model(role))
+
+    def select_model(self, role):
+        name = self.model_vars[role].get()
+        self.services.model_registry.set_model(role, name)
+        self.update_chat_history(f"{role.capitalize()} model: {name}\n", "ollama")
+
+    def toggle_status_bar(self):
+        if self.status_bar_var.get():
+            self.status_bar.pack(side=tk.BOTTOM, fill=tk.X, before=self.notebook)
+            self.status_bar.config(text=self.services.telemetry.status_text())
         else:
-            print("Could not determine the exact line of the error.")
-
-    def track_error(self, error_message, code):
-        # Log the error to a file
-        with open("error_log.txt", "a") as log_file:
-            log_file.write(f"Error: {error_message}\n")
-            log_file.write(f"Code: {code}\n")
-            log_file.write("="*40 + "\n")
-        # Extract and print the problematic part of the code
-        error_line, line_number = self.extract_error_line(error_message, code)
-        if error_line and line_number:
-            print(f"Error in the following line (Line {line_number}):\n\n{error_line.strip()}\n\n")
-            print("Suggested correction:")
-            if "invalid syntax" in error_message:
-                print("Check for missing or extra characters, such as a misplaced comma, parenthesis, or colon.")
-            elif "must be dict" in error_message:
-                print("Ensure that the 'globals' argument is passed as a dictionary and not None.")
-            # Send the error details back to AI for correction
-            self.correct_code(code, error_message, line_number, attempt=1)
-        else:
-            print("Could not determine the exact line of the error.")
+            self.status_bar.pack_forget()
+        self.config_manager.set("status_bar", self.status_bar_var.get())
 
-    def correct_code(self, code, error_message, line_number, attempt):
-        correction_prompt = f"The following code produced an error on line {line_number}:\n\n```python\n{code}\n```\nError message: {error_message}\n\nPlease provide a corrected version of the code."
-        self.fetch_corrected_code(correction_prompt, attempt)
+    def on_ui_sample(self, lag):
+        self.services.telemetry.sample_ui(lag, sum(tab.renderer.queue_depth() for tab in self.tabs.values()))
+        self.ui_samples += 1
+        # The label is refreshed twice a second; reconfiguring it on every heartbeat would add to the lag it shows
+        if self.status_bar_var.get() and self.ui_samples % 5 == 0:
+            self.status_bar.config(text=self.services.telemetry.status_text())
 
-    def fetch_corrected_code(self, correction_prompt, attempt):
-        try:
-            system_message = {'role': 'system', 'content': self.config_manager.get("system_prompts").get(self.config_manager.get("default_prompt"))}
-            messages = [system_message, {'role': 'user', 'content': correction_prompt}]
-            response = ollama.chat(model='llama3.1', messages=messages, stream=True)
-            full_reply = ""
-            for part in response:
-                if not self.typing:
-                    break
-                reply = part['message']['content']
-                full_reply += reply
-            code_block = Utility.extract_code_block(full_reply)
-            if code_block:
-                self.update_chat_history(f"AI provided a corrected code (Attempt {attempt}):\n", "ollama")
-                self.prompt_code_execution(code_block)
-            else:
-                self.update_chat_history("AI failed to provide a corrected code.\n", "error")
-        except Exception as e:
-            self.update_chat_history(f"Error: {str(e)}\n", "error")
-
-    def fetch_response(self, user_message):
-        try:
-            system_message = {'role': 'system', 'content': self.config_manager.get("system_prompts").get(self.config_manager.get("default_prompt"), "Default")}
-            messages = [system_message] + self.conversation_history + [{'role': 'user', 'content': user_message}]
-            
-            response = ollama.chat(
-                model='llama3.1',
-                messages=messages,
-                stream=True,
-            )
-            
-            full_reply = ""
-            for part in response:
-                if not self.typing:
-                    break
-                reply = part['message']['content']
-                for char in reply:
-                    if not self.typing:
-                        break
-                    full_reply += char
-                    self.root.after(0, self.update_chat_history, char)
-                    time.sleep(0.01)
-            self.root.after(0, self.update_chat_history, "\n")
-            
-            code_block = Utility.extract_code_block(full_reply)
-            if code_block:
-                self.root.after(0, self.prompt_code_execution, code_block)
-            
-            self.conversation_history.append({'role': 'assistant', 'content': full_reply})
-            if len(self.conversation_history) > self.max_history_length:
-                self.conversation_history.pop(0)
-                
-        except Exception as e:
-            self.root.after(0, self.update_chat_history, f"Error: {str(e)}\n", "error")
-        self.root.after(0, self.enable_input)
+    def toggle_supersede(self):
+        for tab in self.tabs.values():
+            tab.session.generation_worker.supersede = self.supersede_var.get()
+        self.config_manager.set("supersede_generation", self.supersede_var.get())
 
     def navigate_history(self, event):
         if self.input_history:
@@ -273,68 +334,101 @@ class OllamaChatApp:
                     self.history_index = -1
                     self.input_text.delete("1.0", tk.END)
 
-    def prompt_code_execution(self, code_block):
-        if messagebox.askyesno("Run Code", "A Python code block was detected. Do you want to run this code?"):
-            thread = threading.Thread(target=self.execute_code_with_tracking, args=(code_block,))
+    def prompt_code_execution(self, tab, code_block, attempt=1):
+        if str(tab.frame) not in self.tabs:
+            return  # The tab was closed meanwhile
+        if messagebox.askyesno("Run Code", f"A Python code block was detected in '{tab.title}'. Do you want to run this code?"):
+            thread = threading.Thread(target=tab.session.execute_code, args=(code_block, attempt))
             thread.start()
 
-    def execute_code_with_tracking(self, code, attempt=1):
-        temp_script = f"temp_script_{int(time.time())}.py"
-        def cleanup():
-            os.remove(temp_script)
-            gc.collect()
-        try:
-            with open(temp_script, "w") as f:
-                f.write(code)
-            result = Utility.execute_code(open(temp_script).read(), globals(), cleanup)
-            self.update_chat_history(f"Result:\n{result}\n", "result")
-        except ModuleNotFoundError as e:
-            package_name = str(e).split("'")[1]
-            self.update_chat_history(f"Package '{package_name}' not found. Attempting to install...\n", "error")
-            if Utility.install_package(package_name):
-                self.execute_code_with_tracking(code)  # Retry executing the code after installation
-            else:
-                self.handle_missing_package(package_name, code)
-        except Exception as e:
-            self.update_chat_history(f"Error executing code: {str(e)}\n", "error")
-            self.track_error(str(e), code)
-            if attempt < 5:  # Maximum attempts
-                self.correct_code(code, str(e), attempt + 1)
-            else:
-                self.update_chat_history("Maximum attempts reached. Could not correct the code.\n", "error")
-
-    def handle_missing_package(self, package_name, code):
-        correction_prompt = f"The package '{package_name}' could not be found. Please provide an alternative package or a different approach to achieve the same functionality.\n\nHere is the code that requires the package:\n\n```python\n{code}\n```"
-        self.fetch_corrected_code(correction_prompt, attempt=1)
+    def kill_running_code(self):
+        if self.session.kill_running_code():
+            self.update_chat_history("Stopping running code...\n", "error")
 
     def update_chat_history(self, text, tag="ollama"):
-        with self.output_lock:
-            self.chat_history.configure(state=tk.NORMAL)
-            self.chat_history.insert(tk.END, text, tag)
-            self.chat_history.configure(state=tk.DISABLED)
-            self.chat_history.yview(tk.END)
+        # Thread-safe: text is buffered and drawn by the current tab's renderer on the Tk thread
+        self.current_tab.renderer.push(text, tag)
 
     def stop_typing(self):
-        self.typing = False
+        self.session.stop()
         self.enable_input()
 
     def clear_chat(self):
-        self.chat_history.configure(state=tk.NORMAL)
-        self.chat_history.delete("1.0", tk.END)
-        self.chat_history.configure(state=tk.DISABLED)
+        self.current_tab.clear()
         if self.current_canvas:
             self.current_canvas.get_tk_widget().pack_forget()
             self.current_canvas = None
 
-  
 
+    def new_session(self):
+        self.current_tab.new_session()
+        self.notebook.tab(self.current_tab.frame, text=self.current_tab.title)
+
+    def open_stored_session(self, session_id, title):
+        # Opens in a new tab, so the current chat is left as it is
+        tab = self.new_tab()
+        tab.open_stored_session(session_id, title)
+        self.notebook.tab(tab.frame, text=tab.title)
 
+    def search_sessions(self):
+        if self.services.store is None:
+            messagebox.showinfo("Search Sessions", "Saving sessions is turned off (session_store in the config).")
+            return
+        search_window = Toplevel(self.root)
+        search_window.title("Search Sessions")
+        search_window.geometry("600x400")
+
+        query_entry = tk.Entry(search_window, font=('Courier', 11))
+        query_entry.pack(fill=tk.X, padx=5, pady=5)
+        listbox = Listbox(search_window, font=('Courier', 10))
+        listbox.pack(fill=tk.BOTH, expand=True)
+        status = tk.Label(search_window, anchor=tk.W)
+        status.pack(fill=tk.X)
+        results = []
+
+        def show(rows):
+            listbox.delete(0, tk.END)
+            results[:] = [(row[0], row[1]) for row in rows]
+            for session_id, title, _, role, snippet, created in rows:
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(created))
+                listbox.insert(tk.END, f"{when}  {title[:30]}  {role}: {' '.join(snippet.split())}")
+
+        def run_search(event=None):
+            query = query_entry.get()
+            start = time.perf_counter()
+            if query.strip():
+                rows = self.services.store.search(query)
+            else:
+                rows = [(session_id, title, None, "session", "", updated)
+                        for session_id, title, updated in self.services.store.recent_sessions()]
+            show(rows)
+            status.config(text=f"{len(rows)} results in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        def open_selected(event=None):
+            selected = listbox.curselection() or ((0,) if results else ())
+            if selected:
+                session_id, title = results[selected[0]]
+                search_window.destroy()
+                self.open_stored_session(session_id, title)
+
+        query_entry.bind('<KeyRelease>', run_search)
+        query_entry.bind('<Return>', open_selected)
+        listbox.bind('<Double-Button-1>', open_selected)
+        tk.Button(search_window, text="Open Session", command=open_selected).pack(side=tk.LEFT, padx=5, pady=5)
+        run_search()
+        query_entry.focus_set()
 
     def enable_input(self):
         self.input_text.config(state=tk.NORMAL)
 
     def exit_app(self):
-        self.config_manager.save_config()
+        self.event_loop_monitor.stop()
+        for tab in self.tabs.values():
+            tab.renderer.stop()
+            tab.session.shutdown()
+        self.services.shutdown()
+        self.tool_scheduler.shutdown()
+        self.config_manager.flush()
         self.root.quit()
 
     def show_about(self):
@@ -402,31 +496,53 @@ class OllamaChatApp:
     def manage_utility_tools(self):
         utility_window = Toplevel(self.root)
         utility_window.title("Manage Utility Tools")
-        utility_window.geometry("400x300")
+        utility_window.geometry("600x300")
 
         listbox = Listbox(utility_window)
         listbox.pack(fill=tk.BOTH, expand=True)
+        runtime_label = tk.Label(utility_window, anchor=tk.W)  # Shared HTTP fetches and cache hits
+        runtime_label.pack(fill=tk.X)
 
-        # Populate listbox with utility tool names
-        for tool_name in self.utility_tools.keys():
-            listbox.insert(tk.END, tool_name)
+        # Populate listbox with utility tool names; rows show live scheduler status next to the name
+        tool_names = list(self.utility_tools.keys())
+        for tool_name in tool_names:
+            listbox.insert(tk.END, self.describe_utility_tool(tool_name))
 
-        def edit_tool():
+        def selected_tool():
+            selected = listbox.curselection()
+            return tool_names[selected[0]] if selected else None
+
+        def refresh_status():
+            if not utility_window.winfo_exists():
+                return
             selected = listbox.curselection()
+            for index, tool_name in enumerate(tool_names):
+                text = self.describe_utility_tool(tool_name)
+                if listbox.get(index) != text:
+                    listbox.delete(index)
+                    listbox.insert(index, text)
             if selected:
-                tool_name = listbox.get(selected)
+                listbox.selection_set(selected[0])
+            if self.services.tool_runtime is not None:
+                runtime_label.configure(text=self.services.tool_runtime.describe())
+            utility_window.after(1000, refresh_status)
+
+        def edit_tool():
+            tool_name = selected_tool()
+            if tool_name:
                 new_code = simpledialog.askstring("Edit Utility Tool", f"Edit the code for '{tool_name}':", initialvalue=self.utility_tools[tool_name])
                 if new_code:
                     self.utility_tools[tool_name] = new_code
                     self.save_utility_tools()
 
         def delete_tool():
-            selected = listbox.curselection()
-            if selected:
-                tool_name = listbox.get(selected)
+            tool_name = selected_tool()
+            if tool_name:
                 if messagebox.askyesno("Delete Utility Tool", f"Are you sure you want to delete '{tool_name}'?"):
+                    self.tool_scheduler.stop(tool_name)
                     del self.utility_tools[tool_name]
-                    listbox.delete(selected)
+                    listbox.delete(tool_names.index(tool_name))
+                    tool_names.remove(tool_name)
                     self.save_utility_tools()
 
         def add_tool():
@@ -435,16 +551,42 @@ class OllamaChatApp:
                 tool_code = simpledialog.askstring("Add Utility Tool", "Enter the code for the new utility tool:")
                 if tool_code:
                     self.utility_tools[tool_name] = tool_code
-                    listbox.insert(tk.END, tool_name)
+                    if tool_name not in tool_names:
+                        tool_names.append(tool_name)
+                        listbox.insert(tk.END, self.describe_utility_tool(tool_name))
                     self.save_utility_tools()
 
         def run_tool():
-            selected = listbox.curselection()
-            if selected:
-                tool_name = listbox.get(selected)
-                tool_code = self.utility_tools.get(tool_name)
-                if tool_code:
-                    self.run_utility_tool(tool_code)
+            tool_name = selected_tool()
+            if tool_name and self.utility_tools.get(tool_name):
+                self.run_utility_tool(tool_name)
+
+        def stop_tool():
+            tool_name = selected_tool()
+            if tool_name:
+                self.tool_scheduler.stop(tool_name)
+
+        def schedule_tool():
+            tool_name = selected_tool()
+            if not tool_name:
+                return
+            schedules = self.config_manager.get("utility_tool_schedules", {})
+            schedule = schedules.get(tool_name, {})
+            mode = simpledialog.askstring("Schedule Utility Tool", f"Run mode for '{tool_name}' ({', '.join(MODES)}):", initialvalue=schedule.get("mode", "once"))
+            if not mode:
+                return
+            mode = mode.strip().lower()
+            if mode not in MODES:
+                messagebox.showerror("Schedule Utility Tool", f"Unknown run mode '{mode}'.")
+                return
+            schedule = {"mode": mode}
+            if mode == "interval":
+                interval = simpledialog.askinteger("Schedule Utility Tool", "Run every how many seconds?", initialvalue=schedules.get(tool_name, {}).get("interval", 60), minvalue=1)
+                if not interval:
+                    return
+                schedule["interval"] = interval
+            schedules[tool_name] = schedule
+            self.config_manager.set("utility_tool_schedules", schedules)
 
         button_frame = tk.Frame(utility_window)
         button_frame.pack(fill=tk.X, pady=10)
@@ -458,15 +600,38 @@ class OllamaChatApp:
         delete_button = tk.Button(button_frame, text="Delete", command=delete_tool)
         delete_button.pack(side=tk.LEFT, padx=5)
 
-        run_button = tk.Button(button_frame, text="Run", command=run_tool)
+        run_button = tk.Button(button_frame, text="Start", command=run_tool)
         run_button.pack(side=tk.LEFT, padx=5)
 
-    def run_utility_tool(self, code):
-        try:
-            exec(code, globals())
-            messagebox.showinfo("Success", "Utility Tool executed successfully.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to execute Utility Tool: {str(e)}")
+        stop_button = tk.Button(button_frame, text="Stop", command=stop_tool)
+        stop_button.pack(side=tk.LEFT, padx=5)
+
+        schedule_button = tk.Button(button_frame, text="Schedule", command=schedule_tool)
+        schedule_button.pack(side=tk.LEFT, padx=5)
+
+        refresh_status()
+
+    def describe_utility_tool(self, tool_name):
+        status = self.tool_scheduler.status(tool_name)
+        if status:
+            return status.describe()
+        mode = self.config_manager.get("utility_tool_schedules", {}).get(tool_name, {}).get("mode", "once")
+        return f"{tool_name} [{mode}]"
+
+    def run_utility_tool(self, tool_name):
+        # Tools run in worker processes managed by the scheduler, never on the Tk thread.
+        # Their output goes to the tab shown now, picked here because the scheduler's threads cannot ask Tk.
+        self.tool_tabs[tool_name] = self.current_tab
+        schedule = self.config_manager.get("utility_tool_schedules", {}).get(tool_name, {})
+        self.tool_scheduler.start(tool_name, self.utility_tools[tool_name],
+                                  mode=schedule.get("mode", "once"), interval=schedule.get("interval", 60))
+
+    def tool_output(self, tool_name):
+        # Called by the scheduler for each run, on its own threads
+        tab = self.tool_tabs.get(tool_name)
+        if tab is None:
+            return None
+        return tab.session.start_output_stream(f"Tool '{tool_name}':\n", lazy_header=True)
 
     def save_utility_tools(self):
         self.config_manager.set("utility_tools", self.utility_tools)
@@ -488,9 +653,9 @@ class OllamaChatApp:
             self.update_text_widget_styles()
 
     def update_text_widget_styles(self):
-        self.chat_history.configure(font=('Courier', self.config_manager.get("font_size")), fg=self.config_manager.get("foreground_color"), bg=self.config_manager.get("background_color"))
+        for tab in self.tabs.values():
+            tab.update_styles()
         self.input_text.configure(font=('Courier', self.config_manager.get("font_size")), fg=self.config_manager.get("foreground_color"), bg=self.config_manager.get("background_color"))
-        self.config_manager.save_config()
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,121 @@
+import threading
+import time
+from collections import deque
+
+
+class OutputThrottle:
+    """Bounded, rate-limited hand-off of one code run's output lines to the chat renderer.
+
+    The pending lines are a rolling tail: when they overflow, the oldest go, so a long-running program's
+    latest output is always what gets shown. While the tab is hidden (pause()) up to max_lines are kept
+    instead of max_pending, and resume() lets that backlog through in one go.
+    """
+
+    def __init__(self, lines_per_second=200, max_pending=500, max_lines=2000, header=None):
+        self.lines_per_second = lines_per_second
+        self.max_pending = max_pending
+        self.max_lines = max_lines
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.paused = False
+        self.backlog = 0  # Lines kept while hidden, taken next without waiting for the rate limit
+        self.dropped_hidden = 0  # Lines pushed out of the max_lines tail kept while the tab was hidden
+        self.dropped_backlog = 0  # Lines pushed out because output arrived faster than it could be shown
+        self.allowance = float(lines_per_second)
+        self.last_take = time.monotonic()
+        self.closed = False
+        self.finished = False
+        self.header = header  # Shown just before the first line, so silent runs leave no trace in the chat
+
+    def feed(self, stream, lines):
+        # Called from the thread waiting on the execution pool
+        tag = "error" if stream == "stderr" else "result"
+        with self.lock:
+            self.write_header()
+            limit = self.max_lines if self.paused or self.backlog else self.max_pending
+            for line in lines:
+                if len(self.pending) >= limit:
+                    self.pending.popleft()
+                    if self.paused or self.backlog:
+                        self.dropped_hidden += 1
+                        self.backlog = max(0, self.backlog - 1)
+                    else:
+                        self.dropped_backlog += 1
+                self.pending.append((line, tag))
+
+    def write(self, text, tag):
+        # Status messages bypass the limits but stay in order with the program's output
+        with self.lock:
+            self.write_header()
+            self.pending.append((text, tag))
+
+    def write_header(self):
+        if self.header:
+            self.pending.append((self.header, "result"))
+            self.header = None
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+    def pause(self):
+        # The renderer is not taking lines (its tab is hidden): keep up to max_lines of them meanwhile
+        with self.lock:
+            self.paused = True
+
+    def resume(self):
+        # Shown again: what piled up is drawn at once rather than at lines_per_second
+        with self.lock:
+            self.paused = False
+            self.backlog = len(self.pending)
+
+    def dropped(self):
+        return self.dropped_hidden + self.dropped_backlog
+
+    def take(self):
+        # Called by the renderer once per frame on the Tk thread
+        now = time.monotonic()
+        segments = []
+        with self.lock:
+            self.allowance = min(float(self.lines_per_second),
+                                 self.allowance + (now - self.last_take) * self.lines_per_second)
+            self.last_take = now
+            while self.pending and (self.backlog or self.allowance >= 1):
+                text, tag = self.pending.popleft()
+                if self.backlog:
+                    self.backlog -= 1
+                else:
+                    self.allowance -= 1
+                if segments and segments[-1][1] == tag:
+                    segments[-1] = (segments[-1][0] + text, tag)
+                else:
+                    segments.append((text, tag))
+            if self.closed and not self.pending:
+                self.finished = True
+                if self.dropped():
+                    segments.append((f"[{self.dropped()} older output lines not shown: {self.dropped_backlog} dropped "
+                                     f"while output was arriving too fast, {self.dropped_hidden} beyond the last "
+                                     f"{self.max_lines} kept while the tab was hidden]\n", "error"))
+        return segments
+
+
+class DirectOutput:
+    """Unthrottled stand-in for OutputThrottle that writes a run's output straight through, for headless use."""
+
+    def __init__(self, write, header=None, lazy_header=False):
+        self.write_text = write  # write(text, tag)
+        self.header = header if lazy_header else None
+        if header and not lazy_header:
+            write(header, "result")
+
+    def feed(self, stream, lines):
+        self.write("".join(lines), "error" if stream == "stderr" else "result")
+
+    def write(self, text, tag):
+        if self.header:
+            header, self.header = self.header, None
+            self.write_text(header, "result")
+        self.write_text(text, tag)
+
+    def close(self):
+        pass
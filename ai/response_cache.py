@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """On-disk cache of streamed replies keyed by a hash of everything that shapes the reply.
+
+    The index of what is on disk is built on a background thread, so a large cache does not hold up
+    start-up; until it is ready, get() reports a miss and put() still writes through.
+    """
+
+    def __init__(self, cache_dir="response_cache", max_bytes=64 * 1024 * 1024, max_age=7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (size, last_used), least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.ready = threading.Event()  # Set once load_index() has scanned the cache directory
+        os.makedirs(self.cache_dir, exist_ok=True)
+        threading.Thread(target=self.load_index, name="response-cache-index", daemon=True).start()
+
+    @staticmethod
+    def make_key(model, messages, options=None):
+        payload = json.dumps({'model': model, 'messages': list(messages), 'options': options or {}},
+                             sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load_index(self):
+        # File mtimes double as last-used times, so LRU order survives restarts without a separate index.
+        # The scan runs without the lock; entries put() in the meantime are newer and stay at the end.
+        found = []
+        try:
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".json"):
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            continue  # Evicted or replaced while scanning
+                        found.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        except OSError:
+            pass
+        with self.lock:
+            entries = OrderedDict((key, (size, last_used)) for last_used, key, size in sorted(found)
+                                  if key not in self.entries)
+            entries.update(self.entries)
+            self.entries = entries
+            self.total_bytes = sum(size for size, _ in entries.values())
+            self.evict()
+            self.ready.set()
+
+    def get(self, key):
+        with self.lock:
+            if not self.ready.is_set() or key not in self.entries:
+                self.misses += 1
+                return None
+            path = self.entry_path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.remove(key)
+                self.misses += 1
+                return None
+            if time.time() - entry.get("created", 0) > self.max_age:
+                self.remove(key)
+                self.misses += 1
+                return None
+            now = time.time()
+            os.utime(path, (now, now))
+            self.entries[key] = (self.entries[key][0], now)
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry["chunks"]
+
+    def put(self, key, chunks, model=None):
+        entry = {'created': time.time(), 'model': model, 'chunks': list(chunks)}
+        path = self.entry_path(key)
+        with self.lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+            if key in self.entries:
+                self.total_bytes -= self.entries[key][0]
+            size = os.path.getsize(path)
+            self.entries[key] = (size, time.time())
+            self.entries.move_to_end(key)
+            self.total_bytes += size
+            self.evict()
+
+    def remove(self, key):
+        size, _ = self.entries.pop(key, (0, 0))
+        self.total_bytes -= size
+        try:
+            os.remove(self.entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        cutoff = time.time() - self.max_age
+        for key in [key for key, (_, last_used) in self.entries.items() if last_used < cutoff]:
+            self.remove(key)
+        while self.entries and self.total_bytes > self.max_bytes:
+            self.remove(next(iter(self.entries)))
+
+    def clear(self):
+        self.ready.wait()  # Otherwise entries the scan has not reached yet would survive
+        with self.lock:
+            for key in list(self.entries):
+                self.remove(key)
+
+
+def create_response_cache(cache_config):
+    # cache_config is the "response_cache" config section; returns None when caching is disabled
+    if not cache_config.get("enabled", True):
+        return None
+    return ResponseCache(cache_config.get("directory", "response_cache"),
+                         max_bytes=cache_config.get("max_mb", 64) * 1024 * 1024,
+                         max_age=cache_config.get("max_age_days", 7) * 24 * 3600)
@@ -0,0 +1,195 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages(session_id, id);
+CREATE INDEX IF NOT EXISTS sessions_by_update ON sessions(updated);
+CREATE TABLE IF NOT EXISTS code_runs (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES sessions(id),
+    code TEXT NOT NULL,
+    attempt INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    output TEXT NOT NULL,
+    error TEXT,
+    duration REAL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS code_runs_by_session ON code_runs(session_id, id);
+"""
+
+# An external-content index: the text lives once, in messages, and triggers keep the index in step
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def fts_query(text):
+    # Every word must match; the last one may be a prefix, so results appear while typing
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class SessionStore:
+    """Conversations, messages and code runs in one SQLite database, searchable with FTS5.
+
+    Writes are queued and applied by a background thread, which groups whatever arrives within
+    batch_interval into a single transaction, so callers on the Tk or generation threads never wait on
+    the disk. The database runs in WAL mode, so reads on the calling thread proceed while a batch is
+    being written. Without FTS5 in the local SQLite, search falls back to LIKE.
+    """
+
+    def __init__(self, path="sessions.db", batch_interval=0.2, batch_size=500):
+        self.path = path
+        self.batch_interval = batch_interval
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.writes = queue.Queue()
+        self.read_lock = threading.Lock()
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        try:
+            connection.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5
+        connection.close()
+        self.reader = self.connect(check_same_thread=False)
+        self.writer = threading.Thread(target=self.write_loop, name="session-store", daemon=True)
+        self.writer.start()
+
+    def connect(self, check_same_thread=True):
+        connection = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; a crash can lose only the last batch
+        return connection
+
+    def start_session(self, title):
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        self.writes.put(("INSERT INTO sessions (id, title, created, updated) VALUES (?, ?, ?, ?)",
+                         (session_id, title[:200], now, now)))
+        return session_id
+
+    def add_message(self, session_id, role, content):
+        now = time.time()
+        self.writes.put(("INSERT INTO messages (session_id, role, content, created) VALUES (?, ?, ?, ?)",
+                         (session_id, role, content, now)))
+        self.writes.put(("UPDATE sessions SET updated = ? WHERE id = ?", (now, session_id)))
+
+    def add_code_run(self, session_id, code, attempt, result):
+        self.writes.put(("INSERT INTO code_runs (session_id, code, attempt, ok, output, error, duration, created) "
+                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                         (session_id, code, attempt, int(result.ok), result.output,
+                          None if result.ok else result.error_message, result.duration, time.time())))
+
+    def write_loop(self):
+        connection = self.connect()
+        while True:
+            item = self.writes.get()
+            batch = [item]
+            deadline = time.monotonic() + self.batch_interval
+            # Collect more writes for a moment, so a streamed session costs one commit per interval
+            while item is not None and len(batch) < self.batch_size:
+                try:
+                    item = self.writes.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                batch.append(item)
+            statements = [entry for entry in batch if entry is not None]
+            try:
+                with connection:
+                    for sql, parameters in statements:
+                        connection.execute(sql, parameters)
+            except sqlite3.Error as e:
+                print(f"Session store write failed: {e}")
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
+            if len(statements) < len(batch):
+                connection.close()
+                return
+
+    def flush(self):
+        # Blocks until everything queued so far is written
+        self.writes.join()
+
+    def query(self, sql, parameters=()):
+        with self.read_lock:
+            return self.reader.execute(sql, parameters).fetchall()
+
+    def recent_sessions(self, limit=50):
+        return self.query("SELECT id, title, updated FROM sessions ORDER BY updated DESC LIMIT ?", (limit,))
+
+    def messages(self, session_id, before_id=None, limit=50):
+        # The newest `limit` messages older than before_id, oldest first: (id, role, content, created)
+        rows = self.query("SELECT id, role, content, created FROM messages WHERE session_id = ? AND id < ? "
+                          "ORDER BY id DESC LIMIT ?",
+                          (session_id, before_id if before_id is not None else 2 ** 62, limit))
+        return rows[::-1]
+
+    def recent_inputs(self, limit=100):
+        # The user's last messages across sessions, oldest first, for the input box history
+        rows = self.query("SELECT content FROM messages WHERE role = 'user' ORDER BY id DESC LIMIT ?", (limit,))
+        return [content for content, in reversed(rows)]
+
+    def search(self, text, limit=50):
+        # Newest matches first: (session_id, session title, message id, role, snippet, created)
+        text = text.strip()
+        if not text:
+            return []
+        if self.fts:
+            try:
+                return self.query(
+                    "SELECT m.session_id, s.title, m.id, m.role, "
+                    "snippet(messages_fts, 0, '[', ']', '...', 12), m.created "
+                    "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                    "JOIN sessions s ON s.id = m.session_id "
+                    "WHERE messages_fts MATCH ? ORDER BY messages_fts.rowid DESC LIMIT ?", (fts_query(text), limit))
+            except sqlite3.OperationalError:
+                return []
+        pattern = "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return self.query("SELECT m.session_id, s.title, m.id, m.role, substr(m.content, 1, 120), m.created "
+                          "FROM messages m JOIN sessions s ON s.id = m.session_id "
+                          "WHERE m.content LIKE ? ESCAPE '\\' ORDER BY m.id DESC LIMIT ?", (pattern, limit))
+
+    def close(self):
+        self.writes.put(None)
+        self.writer.join(timeout=5)
+        with self.read_lock:
+            self.reader.close()
+
+
+def create_session_store(store_config):
+    # store_config is the "session_store" config section; returns None when saving sessions is disabled
+    if not store_config.get("enabled", True):
+        return None
+    return SessionStore(store_config.get("path", "sessions/sessions.db"),
+                        batch_interval=store_config.get("batch_interval", 0.2))
@@ -0,0 +1,111 @@
+import builtins
+import keyword
+import re
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>\#.*)
+  | (?P<triple>[rRbBuUfF]{0,2}(?:\"\"\"|'''))
+  | (?P<string>[rRbBuUfF]{0,2}(?:"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?))
+  | (?P<number>\b(?:0[xXoObB][0-9a-fA-F_]+|\d[\d_]*(?:\.\d*)?(?:[eE][+-]?\d+)?j?)\b)
+  | (?P<name>[A-Za-z_]\w*)
+""", re.VERBOSE)
+
+KEYWORDS = set(keyword.kwlist) | set(getattr(keyword, "softkwlist", []))
+BUILTINS = {name for name in dir(builtins) if not name.startswith("_")}
+
+TAG_COLORS = {
+    "code_keyword": "#FF79C6",
+    "code_builtin": "#8BE9FD",
+    "code_string": "#F1FA8C",
+    "code_number": "#BD93F9",
+    "code_comment": "#6272A4",
+}
+
+
+def highlight_line(line, state=None):
+    # Returns ([(start, end, tag)], state); state is the open triple quote carried into the next line, or None
+    spans = []
+    position = 0
+    if state:
+        close = line.find(state)
+        if close < 0:
+            return [(0, len(line), "code_string")] if line else [], state
+        position = close + len(state)
+        spans.append((0, position, "code_string"))
+        state = None
+    while True:
+        match = TOKEN_PATTERN.search(line, position)
+        if not match:
+            break
+        kind = match.lastgroup
+        start, end = match.span()
+        if kind == "triple":
+            quote = match.group()[-3:]
+            close = line.find(quote, end)
+            if close < 0:
+                spans.append((start, len(line), "code_string"))
+                return spans, quote
+            end = close + 3
+            spans.append((start, end, "code_string"))
+        elif kind == "name":
+            word = match.group()
+            if word in KEYWORDS:
+                spans.append((start, end, "code_keyword"))
+            elif word in BUILTINS:
+                spans.append((start, end, "code_builtin"))
+        else:
+            spans.append((start, end, f"code_{kind}"))
+        position = max(end, start + 1)
+    return spans, state
+
+
+class CodeHighlighter:
+    """Colours Python code in a Text widget as it is streamed in, touching only the lines just written.
+
+    Hooked up as the renderer's on_insert. The line still being written is re-coloured when more of
+    it arrives; finished lines are never looked at again. The unfinished line is tracked with a Tk mark,
+    so deleting older text above it does not confuse the highlighter.
+    """
+
+    line_mark = "code_highlight_line"
+
+    def __init__(self, widget, code_tag="code"):
+        self.widget = widget
+        self.code_tag = code_tag
+        self.tracking = False  # Whether line_mark sits on the unfinished line of a block being streamed
+        self.line_state = None  # Triple-quote state at the start of that line
+        for tag, color in TAG_COLORS.items():
+            widget.tag_configure(tag, foreground=color)
+
+    def reset(self):
+        self.tracking = False
+        self.line_state = None
+
+    def on_insert(self, start, end, tag):
+        if tag != self.code_tag:
+            self.reset()  # Any other text ends the block, so the next block starts with no open string
+            return
+        first = int(start.split(".")[0])
+        tracked = int(self.widget.index(self.line_mark).split(".")[0]) if self.tracking else None
+        state = self.highlight_lines(first, int(end.split(".")[0]), self.line_state if first == tracked else None)
+        # The last line is unfinished (or empty, after a newline); remember where it starts
+        self.widget.mark_set(self.line_mark, f"{end.split('.')[0]}.0")
+        self.tracking = True
+        self.line_state = state
+
+    def highlight_range(self, start, end):
+        # For code inserted in one piece, such as older messages loaded back into the widget
+        self.highlight_lines(int(start.split(".")[0]), int(end.split(".")[0]), None)
+
+    def highlight_lines(self, first, last, state):
+        # Returns the triple-quote state at the start of the last line
+        for number in range(first, last + 1):
+            text = self.widget.get(f"{number}.0", f"{number}.end")
+            for highlight_tag in TAG_COLORS:
+                self.widget.tag_remove(highlight_tag, f"{number}.0", f"{number}.end")
+            spans, next_state = highlight_line(text, state)
+            for span_start, span_end, highlight_tag in spans:
+                self.widget.tag_add(highlight_tag, f"{number}.{span_start}", f"{number}.{span_end}")
+            if number < last:
+                state = next_state
+        return state
@@ -0,0 +1,308 @@
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from logging.handlers import RotatingFileHandler
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile; values must already be sorted
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+class GenerationMetrics:
+    """Timings for one generation, filled in by stream_chat and handed to the sink when it ends."""
+
+    def __init__(self, kind, model, sink=None, queued=0.0):
+        self.kind = kind  # "chat" or "correction"
+        self.model = model
+        self.sink = sink
+        self.started = time.monotonic()
+        self.queued = queued  # Seconds the request waited behind other generations
+        self.first_chunk = None
+        self.chunks = 0
+        self.chars = 0
+        self.eval_count = None
+        self.eval_duration = None
+        self.prompt_eval_count = None
+        self.load_duration = None
+        self.prompt_tokens = None  # Estimated size of the prompt sent (characters / 4)
+        self.reused_tokens = None  # Estimated leading part of it unchanged since the conversation's last prompt
+        # Server tokens per estimated token, measured on the conversation's last prompt that reused nothing;
+        # it takes in the chat template and the model's tokenizer, which the estimate knows nothing about
+        self.prompt_scale = None
+        self.total = None
+        self.cached = False
+        self.cancelled = False
+        self.error = None
+
+    def chunk(self, text):
+        if self.first_chunk is None:
+            self.first_chunk = time.monotonic() - self.started
+        self.chunks += 1
+        self.chars += len(text)
+
+    def final(self, part):
+        # The last streamed part carries Ollama's own counts; durations are in nanoseconds
+        self.eval_count = part.get('eval_count')
+        self.eval_duration = part.get('eval_duration')
+        self.prompt_eval_count = part.get('prompt_eval_count')
+        self.load_duration = part.get('load_duration')
+
+    def tokens_per_second(self):
+        if self.eval_count and self.eval_duration:
+            return self.eval_count / (self.eval_duration / 1e9)
+        return None
+
+    def full_prompt_estimate(self):
+        # What evaluating the whole prompt would have cost, in the server's tokens; None until calibrated
+        if self.prompt_tokens is None or self.prompt_scale is None:
+            return None
+        return round(self.prompt_tokens * self.prompt_scale)
+
+    def prefill_saved_estimate(self):
+        # Prompt tokens the server did not have to evaluate: the calibrated full size less its own count
+        full = self.full_prompt_estimate()
+        if full is None or self.prompt_eval_count is None:
+            return None
+        return max(0, full - self.prompt_eval_count)
+
+    def finish(self, cancelled=False, error=None):
+        if self.total is not None:
+            return
+        self.total = time.monotonic() - self.started
+        self.cancelled = cancelled
+        # Errors from the stream being torn down underneath a cancelled request are not failures
+        self.error = f"{type(error).__name__}: {error}" if error is not None and not cancelled else None
+        if self.sink is not None:
+            self.sink(self)
+
+    def as_record(self):
+        return {
+            'type': 'generation',
+            'time': time.time(),
+            'kind': self.kind,
+            'model': self.model,
+            'queued': self.queued,
+            'ttft': self.first_chunk,
+            'chunks': self.chunks,
+            'chars': self.chars,
+            'eval_count': self.eval_count,
+            'prompt_eval_count': self.prompt_eval_count,
+            'prompt_tokens_estimate': self.prompt_tokens,
+            'reused_tokens_estimate': self.reused_tokens,
+            'prompt_scale': self.prompt_scale,
+            'prefill_saved_estimate': self.prefill_saved_estimate(),
+            'load_duration': self.load_duration / 1e9 if self.load_duration else None,
+            'tokens_per_second': self.tokens_per_second(),
+            'total': self.total,
+            'cached': self.cached,
+            'cancelled': self.cancelled,
+            'error': self.error,
+        }
+
+
+class Telemetry:
+    """Collects generation and UI metrics, keeps the latest for the status bar and appends them to a JSONL file.
+
+    The file rotates at max_bytes, keeping `backups` older files. UI lag samples are aggregated and
+    written once every ui_interval seconds rather than one line per sample.
+    """
+
+    def __init__(self, path=None, max_bytes=5 * 1024 * 1024, backups=3, ui_interval=10):
+        self.lock = threading.Lock()
+        self.last_generation = None
+        self.ui_samples = []  # (lag seconds, render queue depth) since the last UI record
+        self.last_lag = 0.0
+        self.last_depth = 0
+        self.ui_interval = ui_interval
+        self.ui_started = time.monotonic()
+        self.logger = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger = logging.getLogger(f"telemetry.{os.path.abspath(path)}")
+            self.logger.propagate = False
+            self.logger.setLevel(logging.INFO)
+            self.logger.addHandler(handler)
+
+    def start(self, kind, model, queued=0.0):
+        return GenerationMetrics(kind, model, self.record_generation, queued)
+
+    def record_generation(self, metrics):
+        with self.lock:
+            if metrics.kind == "chat":
+                self.last_generation = metrics
+        self.write(metrics.as_record())
+
+    def sample_ui(self, lag, depth):
+        # Called on the Tk thread for every event loop heartbeat
+        record = None
+        with self.lock:
+            self.last_lag = lag
+            self.last_depth = depth
+            self.ui_samples.append((lag, depth))
+            now = time.monotonic()
+            if now - self.ui_started >= self.ui_interval:
+                lags = sorted(sample[0] for sample in self.ui_samples)
+                record = {
+                    'type': 'ui',
+                    'time': time.time(),
+                    'samples': len(lags),
+                    'lag_p50': percentile(lags, 0.5),
+                    'lag_max': lags[-1],
+                    'queue_max': max(sample[1] for sample in self.ui_samples),
+                }
+                self.ui_samples = []
+                self.ui_started = now
+        if record is not None:
+            self.write(record)
+
+    def write(self, record):
+        if self.logger is not None:
+            self.logger.info(json.dumps(record))
+
+    def status_text(self):
+        with self.lock:
+            metrics = self.last_generation
+            lag, depth = self.last_lag, self.last_depth
+        ui = f"UI lag {lag * 1000:.0f} ms, render queue {depth}"
+        if metrics is None:
+            return ui
+        parts = [metrics.model]
+        if metrics.cached:
+            parts.append("cached")
+        if metrics.first_chunk is not None:
+            parts.append(f"first token {metrics.first_chunk:.2f}s")
+        tokens_per_second = metrics.tokens_per_second()
+        if tokens_per_second:
+            parts.append(f"{tokens_per_second:.1f} tok/s")
+        if not metrics.cached and metrics.prompt_eval_count is not None:
+            full = metrics.full_prompt_estimate()
+            # The server's count is exact; the size of the whole prompt is an estimate, and marked as one
+            parts.append(f"prefill {metrics.prompt_eval_count} of ~{full} tok (est.)" if full
+                         else f"prefill {metrics.prompt_eval_count} tok")
+        parts.append(f"{metrics.chunks} chunks in {metrics.total:.1f}s")
+        if metrics.cancelled:
+            parts.append("stopped")
+        return " | ".join([", ".join(parts), ui])
+
+    def close(self):
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
+
+
+class StartupProfile:
+    """Time spent in each phase of starting the app, up to the first drawn window."""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.last = self.started
+        self.phases = []  # (name, seconds)
+
+    def mark(self, phase):
+        # Ends the phase that began at the previous mark
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def total(self):
+        return self.last - self.started
+
+    def as_record(self):
+        return {'type': 'startup', 'time': time.time(), 'phases': dict(self.phases), 'total': self.total()}
+
+    def report(self):
+        lines = [f"{name:<20} {seconds * 1000:8.1f} ms" for name, seconds in self.phases]
+        lines.append(f"{'interactive after':<20} {self.total() * 1000:8.1f} ms")
+        return "\n".join(lines)
+
+
+class EventLoopMonitor:
+    """Measures Tk event loop lag with a heartbeat: how late each after() callback fires."""
+
+    def __init__(self, root, on_sample, interval=0.1):
+        self.root = root
+        self.on_sample = on_sample  # Called with the lag in seconds
+        self.interval = interval
+        self.expected = None
+        self.after_id = None
+
+    def start(self):
+        self.expected = time.monotonic() + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self.beat)
+
+    def beat(self):
+        now = time.monotonic()
+        self.on_sample(max(0.0, now - self.expected))
+        self.expected = now + self.interval
+        self.after_id = self.root.after(int(self.interval * 1000), self.beat)
+
+    def stop(self):
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+
+def read_records(path):
+    # The current file and its rotated backups, oldest first
+    paths = [f"{path}.{index}" for index in range(9, 0, -1)] + [path]
+    for file_path in paths:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+
+def summarize(records):
+    # {(kind, model): {metric: (count, p50, p95, p99)}} for generations, plus ("ui", "") for event loop lag
+    # and ("startup", "") for the time of each start-up phase
+    samples = defaultdict(lambda: defaultdict(list))
+    for record in records:
+        if record.get('type') == 'generation':
+            group = samples[(record['kind'], record['model'])]
+            for name in ('ttft', 'tokens_per_second', 'total', 'queued', 'prefill_saved_estimate'):
+                if record.get(name) is not None:
+                    group[name].append(record[name])
+            group['cancelled'].append(1 if record.get('cancelled') else 0)
+        elif record.get('type') == 'ui':
+            samples[('ui', '')]['lag_max'].append(record['lag_max'])
+            samples[('ui', '')]['queue_max'].append(record['queue_max'])
+        elif record.get('type') == 'startup':
+            for name, seconds in record['phases'].items():
+                samples[('startup', '')][name].append(seconds)
+            samples[('startup', '')]['total'].append(record['total'])
+    summary = {}
+    for group, metrics in samples.items():
+        summary[group] = {}
+        for name, values in metrics.items():
+            values = sorted(values)
+            summary[group][name] = (len(values), percentile(values, 0.5), percentile(values, 0.95), percentile(values, 0.99))
+    return summary
+
+
+def format_summary(summary):
+    lines = []
+    for (kind, model), metrics in sorted(summary.items()):
+        lines.append(f"{kind} {model}".strip())
+        for name, (count, p50, p95, p99) in sorted(metrics.items()):
+            lines.append(f"  {name:<18} n={count:<6} p50={p50:<10.3f} p95={p95:<10.3f} p99={p99:.3f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python telemetry.py [metrics/metrics.jsonl]
+    print(format_summary(summarize(read_records(sys.argv[1] if len(sys.argv) > 1 else "metrics/metrics.jsonl"))))
@@ -0,0 +1,42 @@
+import threading
+import time
+
+import pytest
+
+from chat_session import ChatSession, SessionServices
+from config_manager import ConfigManager
+
+
+@pytest.fixture
+def services(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    config_manager = ConfigManager(str(tmp_path / "config.json"), debounce=60)
+    config_manager.set("dependencies", {"enabled": False})
+    config_manager.set("retrieval", {"enabled": False})
+    services = SessionServices(config_manager)
+    yield config_manager, services
+    services.shutdown()
+
+
+def run_in_background(session, code):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(session.execute_code(code)), daemon=True)
+    thread.start()
+    return thread, results
+
+
+def test_kill_running_code_only_stops_own_session(services):
+    config_manager, shared = services
+    first = ChatSession(config_manager, services=shared)
+    second = ChatSession(config_manager, services=shared)
+    first_thread, first_results = run_in_background(first, "import time\ntime.sleep(30)")
+    second_thread, second_results = run_in_background(second, "import time\ntime.sleep(1.5)\nprint('done')")
+    deadline = time.monotonic() + 10
+    while shared.execution_pool.running() < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert first.kill_running_code() == 1
+    first_thread.join(5)
+    second_thread.join(10)
+    assert first_results[0].killed
+    assert second_results[0].ok
+    assert second.kill_running_code() == 0
@@ -0,0 +1,48 @@
+from context_window import ContextWindow, message_tokens, shared_prefix_tokens
+
+
+def fill(window, turns, start=0):
+    for turn in range(start, start + turns):
+        window.append('user', f"Question {turn}: " + "tell me about Python lists. " * 8)
+        window.append('assistant', f"Answer {turn}: " + "lists are ordered and mutable. " * 8)
+
+
+def refine_between_folds(hold):
+    refinements = []
+    window = ContextWindow(token_budget=600, summary_tokens=100, fold_target=0.75, hold_refinements=hold,
+                           refiner=lambda context, version, previous, folded: refinements.append(version))
+    fill(window, 8)
+    window.append('user', "First new question?")
+    first = window.build("System prompt.")
+    assert refinements, "the first build should fold"
+    # The model-written summary lands in the background between the two turns
+    assert window.apply_summary("A model-written summary of the earlier turns.", refinements[-1])
+    window.append('assistant', "First new answer.")
+    window.append('user', "Second new question?")
+    second = window.build("System prompt.")
+    previous = first + [{'role': 'assistant', 'content': "First new answer."}]
+    return shared_prefix_tokens(previous, second), message_tokens(previous), len(refinements)
+
+
+def test_held_refinement_keeps_prefix_between_folds():
+    shared, previous_tokens, folds = refine_between_folds(hold=True)
+    assert folds == 1
+    assert shared == previous_tokens
+
+
+def test_unheld_refinement_changes_prefix():
+    shared, previous_tokens, _ = refine_between_folds(hold=False)
+    assert shared < previous_tokens // 4
+
+
+def test_held_refinement_applies_at_next_fold():
+    versions = []
+    window = ContextWindow(token_budget=600, summary_tokens=100, fold_target=0.75, hold_refinements=True,
+                           refiner=lambda context, version, previous, folded: versions.append((version, previous)))
+    fill(window, 8)
+    window.fit("System prompt.")
+    window.apply_summary("Refined summary.", versions[-1][0])
+    assert "Refined summary." not in window.summary
+    fill(window, 8, start=8)
+    window.fit("System prompt.")
+    assert versions[-1][1] == "Refined summary."  # The next summary builds on the refinement
@@ -0,0 +1,29 @@
+from correction_engine import CorrectionCandidate, CorrectionEngine
+from generation_worker import CancelToken
+
+
+def checked(engine, code):
+    candidate = CorrectionCandidate(0, {})
+    candidate.reply = f"```python\n{code}\n```"
+    engine.check(candidate, CancelToken())
+    return candidate
+
+
+def test_dry_runs():
+    engine = CorrectionEngine(dry_run_timeout=1)
+    try:
+        polling = checked(engine, "import time\nwhile True:\n    time.sleep(0.1)")
+        assert polling.passed and polling.unverified
+        failing = checked(engine, "1/0")
+        assert not failing.passed and failing.error.error_type == "ZeroDivisionError"
+        finishing = checked(engine, "print(sum(range(10)))")
+        assert finishing.passed and not finishing.unverified
+    finally:
+        engine.shutdown()
+
+
+def test_seeds_change_with_attempt():
+    engine = CorrectionEngine(candidates=3)
+    first = {engine.candidate_options(index, attempt=1)['seed'] for index in range(3)}
+    second = {engine.candidate_options(index, attempt=2)['seed'] for index in range(3)}
+    assert len(first) == 3 and not first & second
@@ -0,0 +1,68 @@
+import threading
+from concurrent.futures import Future
+
+from embedding_index import EmbeddingIndex, Retriever, hashing_embedder
+from model_registry import ModelRegistry
+import model_registry
+
+
+def make_retriever(tmp_path):
+    embed = hashing_embedder()
+    retriever = Retriever(EmbeddingIndex(str(tmp_path / "embeddings"), embed.name), embed, min_score=0.1)
+    retriever.add("earlier", "user", "the deploy script needs the staging token")
+    retriever.flush()
+    return retriever
+
+
+def test_context_for_skips_a_query_that_is_not_done(tmp_path):
+    retriever = make_retriever(tmp_path)
+    try:
+        pending = Future()  # Never resolved: waiting on it would hang the test
+        assert retriever.context_for("deploy script staging token", "current", pending) == ""
+        assert retriever.skipped == 1
+        ready = retriever.prepare("deploy script staging token")
+        ready.result(timeout=5)
+        assert "staging token" in retriever.context_for("deploy script staging token", "current", ready)
+    finally:
+        retriever.close()
+
+
+class FakeConfig:
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.embedded = threading.Event()
+
+    def generate(self, **kwargs):
+        self.calls.append(("generate", kwargs))
+
+    def list(self):
+        return {'models': []}
+
+    def embed(self, **kwargs):
+        self.calls.append(("embed", kwargs))
+        self.embedded.set()
+
+
+def test_warm_up_loads_the_embedding_model(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(model_registry, "create_client", lambda host=None: client)
+    registry = ModelRegistry(FakeConfig({"retrieval": {"enabled": True, "model": "nomic-embed-text", "keep_alive": "30m"}}))
+    registry.warm_up()
+    assert client.embedded.wait(5)
+    assert ("embed", {'model': "nomic-embed-text", 'input': "", 'keep_alive': "30m"}) in client.calls
+
+
+def test_no_embedding_warm_up_for_the_hashing_embedder(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(model_registry, "create_client", lambda host=None: client)
+    registry = ModelRegistry(FakeConfig({"retrieval": {"enabled": True, "embedder": "hashing"}}))
+    assert not registry.load_embedding_model()
+    assert not client.calls
@@ -0,0 +1,40 @@
+from output_stream import OutputThrottle
+
+
+def lines(start, stop):
+    return [f"line {number}\n" for number in range(start, stop)]
+
+
+def shown(throttle):
+    return "".join(text for text, tag in throttle.take())
+
+
+def test_overflow_drops_the_oldest_lines():
+    throttle = OutputThrottle(lines_per_second=1000, max_pending=10, max_lines=50)
+    throttle.feed("stdout", lines(0, 100))
+    text = shown(throttle)
+    assert text == "".join(lines(90, 100))
+    throttle.feed("stdout", lines(100, 103))  # A long-running program keeps being shown
+    assert shown(throttle) == "".join(lines(100, 103))
+    throttle.close()
+    assert "90 older output lines not shown" in shown(throttle)
+
+
+def test_hidden_output_is_buffered_until_shown():
+    throttle = OutputThrottle(lines_per_second=5, max_pending=10, max_lines=50)
+    throttle.pause()
+    throttle.feed("stdout", lines(0, 40))
+    throttle.feed("stderr", ["Traceback\n"])
+    throttle.resume()
+    segments = throttle.take()
+    assert segments == [("".join(lines(0, 40)), "result"), ("Traceback\n", "error")]
+    assert throttle.dropped() == 0
+
+
+def test_hidden_buffer_keeps_the_last_max_lines():
+    throttle = OutputThrottle(lines_per_second=5, max_pending=10, max_lines=50)
+    throttle.pause()
+    throttle.feed("stdout", lines(0, 80))
+    throttle.resume()
+    assert shown(throttle) == "".join(lines(30, 80))
+    assert throttle.dropped_hidden == 30
@@ -0,0 +1,30 @@
+import os
+import threading
+
+import response_cache
+from response_cache import ResponseCache
+
+
+def test_lookups_miss_until_the_index_is_loaded(tmp_path, monkeypatch):
+    directory = str(tmp_path / "cache")
+    first = ResponseCache(directory)
+    assert first.ready.wait(5)
+    first.put("aa11", ["cached reply"])
+
+    release = threading.Event()
+    scandir = os.scandir
+
+    def slow_scandir(path):
+        release.wait(5)  # Stands in for a large cache directory
+        return scandir(path)
+    monkeypatch.setattr(response_cache.os, "scandir", slow_scandir)
+    second = ResponseCache(directory)
+    assert not second.ready.is_set()
+    assert second.get("aa11") is None
+    second.put("bb22", ["written during the scan"])
+    release.set()
+    assert second.ready.wait(5)
+    assert second.get("aa11") == ["cached reply"]
+    assert second.get("bb22") == ["written during the scan"]
+    assert list(second.entries) == ["aa11", "bb22"]
+    assert second.total_bytes == sum(size for size, _ in second.entries.values())
@@ -0,0 +1,46 @@
+import subprocess
+
+from tool_environment import ToolEnvironment, is_permanent_failure
+
+NETWORK_FAILURE = ("WARNING: Retrying (Retry(total=4, connect=None, read=None, redirect=None, status=None)) after "
+                   "connection broken by 'NewConnectionError'\n"
+                   "ERROR: Could not find a version that satisfies the requirement requests (from versions: none)\n"
+                   "ERROR: No matching distribution found for requests\n")
+NOT_ON_INDEX = ("ERROR: Could not find a version that satisfies the requirement no-such-package (from versions: none)\n"
+                "ERROR: No matching distribution found for no-such-package\n")
+
+
+def test_only_a_missing_package_is_a_permanent_failure():
+    assert is_permanent_failure(NOT_ON_INDEX)
+    assert not is_permanent_failure(NETWORK_FAILURE)
+    assert not is_permanent_failure("ERROR: Exception: [Errno 28] No space left on device\n")
+
+
+def make_environment(tmp_path, monkeypatch, retry_after, outcomes):
+    environment = ToolEnvironment(str(tmp_path / "env"), retry_after=retry_after)
+    downloads = []
+
+    def download(package):
+        downloads.append(package)
+        return outcomes[package].pop(0)
+    monkeypatch.setattr(environment, "ensure", lambda: None)
+    monkeypatch.setattr(environment, "download", download)
+    monkeypatch.setattr(environment, "pip", lambda *args: subprocess.CompletedProcess(args, 0))
+    return environment, downloads
+
+
+def test_transient_failures_are_retried_after_retry_after(tmp_path, monkeypatch):
+    environment, downloads = make_environment(tmp_path, monkeypatch, 60, {'requests': [(False, False), (True, False)]})
+    assert environment.install(["requests"]) == ([], ["requests"])
+    assert environment.install(["requests"]) == ([], [])  # Too soon
+    environment.failed_at["requests"] -= 60
+    assert environment.install(["requests"]) == (["requests"], [])
+    assert downloads == ["requests", "requests"]
+    assert environment.install(["requests"]) == ([], [])
+
+
+def test_packages_missing_from_the_index_are_not_asked_for_again(tmp_path, monkeypatch):
+    environment, downloads = make_environment(tmp_path, monkeypatch, 0, {'no-such-package': [(False, True)]})
+    assert environment.install(["no-such-package"]) == ([], ["no-such-package"])
+    assert environment.install(["no_such_package"]) == ([], [])
+    assert downloads == ["no-such-package"]
@@ -0,0 +1,120 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from code_runner import ExecutionPool
+from tool_runtime import RuntimeClient, ToolRuntime
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so connections can be reused
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.connections.add(self.client_address)
+        if self.path.startswith("/slow"):
+            time.sleep(0.5)
+        body = f"hello from {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    httpd.lock = threading.Lock()
+    httpd.requests = []
+    httpd.connections = set()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_requests_reuse_a_kept_alive_connection(server):
+    httpd, base = server
+    runtime = ToolRuntime(ttl=0, rate=0)
+    try:
+        for index in range(3):
+            assert runtime.request("GET", f"{base}/item/{index}").text == f"hello from /item/{index}"
+        stats = runtime.stats()
+        assert stats['connections_opened'] == 1 and stats['connections_reused'] == 2
+        assert len(httpd.connections) == 1
+    finally:
+        runtime.close()
+
+
+def test_concurrent_identical_gets_share_one_fetch(server):
+    httpd, base = server
+    runtime = ToolRuntime(ttl=0, rate=0)
+    start = threading.Barrier(5)
+    results = []
+
+    def get():
+        start.wait()
+        results.append(runtime.request("GET", f"{base}/slow"))
+    threads = [threading.Thread(target=get) for _ in range(5)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert [response.text for response in results] == ["hello from /slow"] * 5
+        assert httpd.requests == ["/slow"]
+        assert runtime.stats()['coalesced'] == 4
+    finally:
+        runtime.close()
+
+
+def test_requests_to_a_host_are_rate_limited(server):
+    httpd, base = server
+    runtime = ToolRuntime(ttl=0, rate=10, burst=1)
+    try:
+        started = time.monotonic()
+        for index in range(4):
+            runtime.request("GET", f"{base}/item/{index}")
+        assert time.monotonic() - started >= 0.25  # Three waits of a tenth of a second after the burst
+        assert runtime.stats()['rate_limited'] == 3
+        assert len(httpd.requests) == 4
+    finally:
+        runtime.close()
+
+
+def test_executed_code_fetches_through_the_runtime(server):
+    httpd, base = server
+    runtime = ToolRuntime(rate=0)
+    pool = ExecutionPool(size=1, timeout=20, runtime=runtime)
+    try:
+        result = pool.run(f"print(runtime.get({base + '/feed'!r}).text)\nprint(runtime.get({base + '/feed'!r}).from_cache)")
+        assert result.ok, result.error
+        assert result.output.split() == ["hello", "from", "/feed", "True"]
+        assert httpd.requests == ["/feed"]
+    finally:
+        pool.shutdown()
+        runtime.close()
+
+
+class SilentSender:
+    def send(self, message):
+        pass  # The app never answers
+
+
+def test_unanswered_call_times_out_in_the_child():
+    client = RuntimeClient(SilentSender(), call_timeout=0.2)
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        client.get("http://127.0.0.1:9/")
+    assert time.monotonic() - started < 5
+    client.deliver({'kind': 'reply', 'id': 1, 'ok': True, 'result': {}})  # Arrives too late
+    assert not client.replies
@@ -0,0 +1,44 @@
+import time
+
+from tool_scheduler import ToolScheduler, ToolStatus
+
+
+def test_stopped_tool_does_not_start():
+    scheduler = ToolScheduler(workers=1, timeout=5)
+    try:
+        status = ToolStatus("tool")
+        scheduler.statuses["tool"] = status
+        status.state = "stopped"  # stop() landed before the executor got to the run
+        scheduler.run_once(status, "print('ran')")
+        assert status.state == "stopped" and status.runs == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_run_queued_behind_a_running_one_is_skipped():
+    scheduler = ToolScheduler(workers=1, timeout=5)
+    try:
+        status = ToolStatus("tool", mode="interval", interval=1)
+        scheduler.statuses["tool"] = status
+        status.state = "running"
+        scheduler.run_once(status, "print('ran')")
+        assert status.skipped == 1 and status.runs == 0
+    finally:
+        scheduler.shutdown()
+
+
+def test_stop_kills_a_running_once_tool():
+    scheduler = ToolScheduler(workers=1, timeout=60)
+    try:
+        status = scheduler.start("slow", "import time\ntime.sleep(30)")
+        deadline = time.monotonic() + 10
+        while "slow" not in scheduler.runs and time.monotonic() < deadline:
+            time.sleep(0.05)
+        started = time.monotonic()
+        scheduler.stop("slow")
+        while status.runs == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert status.state == "stopped"
+        assert time.monotonic() - started < 5
+    finally:
+        scheduler.shutdown()
@@ -0,0 +1,95 @@
+from transcript import Transcript, TranscriptView
+
+
+class FakeText:
+    # Just enough of a Tk Text widget for TranscriptView: text, marks with gravity and a few index forms
+    def __init__(self):
+        self.text = ""
+        self.marks = {}  # name -> [offset, gravity]
+
+    def offset(self, index):
+        if index in self.marks:
+            return self.marks[index][0]
+        if index in ("end", "end-1c"):
+            return len(self.text)
+        if index == "@0,0":
+            return 0
+        if "+" in index:
+            return int(index.split("+")[1].split()[0])
+        line, column = (int(part) for part in index.split("."))
+        return sum(len(text) + 1 for text in self.text.split("\n")[:line - 1]) + column
+
+    def index(self, index):
+        offset = self.offset(index)
+        return f"{self.text.count(chr(10), 0, offset) + 1}.{offset - (self.text.rfind(chr(10), 0, offset) + 1)}"
+
+    def get(self, start, end):
+        return self.text[self.offset(start):self.offset(end)]
+
+    def insert(self, index, *arguments):
+        position = self.offset(index)
+        inserted = "".join(arguments[::2])
+        self.text = self.text[:position] + inserted + self.text[position:]
+        for mark in self.marks.values():
+            if mark[0] > position or (mark[0] == position and mark[1] == "right"):
+                mark[0] += len(inserted)
+
+    def delete(self, start, end):
+        start, end = self.offset(start), self.offset(end)
+        self.text = self.text[:start] + self.text[end:]
+        for mark in self.marks.values():
+            mark[0] = start if start <= mark[0] < end else mark[0] - (end - start) if mark[0] >= end else mark[0]
+
+    def mark_set(self, name, index):
+        self.marks[name] = [self.offset(index), self.marks.get(name, [0, "right"])[1]]
+
+    def mark_gravity(self, name, gravity):
+        self.marks[name][1] = gravity
+
+    def mark_unset(self, name):
+        del self.marks[name]
+
+    def cget(self, option):
+        return "disabled"
+
+    def configure(self, **options):
+        pass
+
+    def yview(self, *args):
+        pass
+
+
+def render(view, widget, text, tag):
+    start = widget.index("end-1c")
+    widget.insert("end", text, tag)
+    view.on_insert(start, widget.index("end-1c"), tag)
+
+
+def make_view(entries):
+    widget = FakeText()
+    transcript = Transcript()
+    view = TranscriptView(None, widget, transcript, max_lines=10, load_batch=2)
+    for number in range(entries):
+        render(view, widget, f"message {number}\n", "user" if number % 2 == 0 else "ollama")
+    return widget, transcript, view
+
+
+def test_trim_keeps_the_newest_entries_loaded():
+    widget, transcript, view = make_view(200)
+    loaded = list(view.loaded)
+    assert loaded == [entry for entry in transcript.entries if entry.loaded]
+    assert loaded[-1] is transcript.entries[-1] and len(loaded) < len(transcript.entries)
+    assert widget.text == "".join(entry.text for entry in loaded)
+    assert all(widget.offset(entry.mark) == widget.text.index(entry.text) for entry in loaded)
+    assert not any(entry.mark in widget.marks for entry in transcript.entries if not entry.loaded)
+
+
+def test_load_older_puts_entries_back_in_front():
+    widget, transcript, view = make_view(200)
+    first = view.loaded[0]
+    view.load_older()
+    older = [transcript.get(first.id - 2), transcript.get(first.id - 1)]
+    assert list(view.loaded)[:3] == older + [first]
+    assert all(entry.loaded for entry in older)
+    assert widget.text.startswith(older[0].text + older[1].text + first.text)
+    assert widget.offset(first.mark) == len(older[0].text) + len(older[1].text)
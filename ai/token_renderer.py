@@ -0,0 +1,165 @@
+import threading
+from collections import deque
+import tkinter as tk
+
+
+class TokenRenderer:
+    """Buffers text pushed from any thread and flushes it to a Text widget once per frame."""
+
+    def __init__(self, root, widget, fps=30, typewriter=False, typewriter_cps=400, max_lag=2.0, on_insert=None,
+                 max_frame_chars=None):
+        self.root = root
+        self.widget = widget
+        self.max_frame_chars = max_frame_chars  # Render budget per frame, so a large backlog is drawn over several frames
+        self.on_insert = on_insert  # on_insert(start index, end index, tag) after each insert, e.g. for highlighting
+        self.fps = max(1, int(fps))
+        self.frame_ms = int(1000 / self.fps)
+        self.typewriter = typewriter
+        self.typewriter_cps = typewriter_cps
+        self.max_lag = max_lag  # Typewriter mode drains any backlog within roughly this many seconds
+        self.catch_up = 0
+        # (text, tag) runs in the order they were pushed, with code-output sources among them as (source, None).
+        # A source is an object with take() -> [(text, tag)] and closed and finished flags, polled every frame.
+        self.buffer = deque()
+        self.buffer_lock = threading.Lock()
+        self.pending_chars = 0
+        self.running = False
+        self.after_id = None
+        # Counters used by the status bar and the render benchmark
+        self.callbacks = 0
+        self.inserts = 0
+        self.chars_rendered = 0
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.set_sources_paused(False)
+            self.after_id = self.root.after(self.frame_ms, self.drain)
+
+    def stop(self):
+        self.running = False
+        self.set_sources_paused(True)
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def set_sources_paused(self, paused):
+        # Sources buffer more while nothing takes from them, so a hidden tab's run output is not dropped
+        with self.buffer_lock:
+            sources = [text for text, tag in self.buffer if tag is None]
+        for source in sources:
+            if paused:
+                source.pause()
+            else:
+                source.resume()
+
+    def push(self, text, tag="ollama"):
+        # Safe to call from worker threads; never touches Tk
+        if not text:
+            return
+        with self.buffer_lock:
+            self.buffer.append((text, tag))
+            self.pending_chars += len(text)
+
+    def add_source(self, source):
+        with self.buffer_lock:
+            self.buffer.append((source, None))
+            if not self.running:
+                source.pause()
+
+    def clear(self):
+        with self.buffer_lock:
+            self.buffer.clear()
+            self.pending_chars = 0
+            self.catch_up = 0
+
+    def queue_depth(self):
+        return self.pending_chars
+
+    def frame_budget(self):
+        if not self.typewriter:
+            return self.max_frame_chars
+        budget = max(1, int(self.typewriter_cps / self.fps))
+        # Keep the fastest catch-up rate seen until the backlog is empty again
+        if self.pending_chars == 0:
+            self.catch_up = 0
+        self.catch_up = max(self.catch_up, -(-self.pending_chars // max(1, int(self.max_lag * self.fps))))
+        return max(budget, self.catch_up)
+
+    def take_segments(self):
+        # Text and source output in buffer order. A running source does not hold up what was pushed after
+        # it, since that is other output happening meanwhile; a closed one that still has output to show
+        # does, so messages about a finished run come after the rest of its output.
+        budget = self.frame_budget()
+        segments = []
+
+        def add(text, tag):
+            # Merge consecutive runs with the same tag into a single insert
+            if segments and segments[-1][1] == tag:
+                segments[-1][0].append(text)
+            else:
+                segments.append(([text], tag))
+        with self.buffer_lock:
+            index = 0
+            while index < len(self.buffer):
+                text, tag = self.buffer[index]
+                if tag is None:
+                    source = text
+                    for source_text, source_tag in source.take():
+                        add(source_text, source_tag)
+                    if source.finished:
+                        del self.buffer[index]
+                    elif source.closed:
+                        break
+                    else:
+                        index += 1
+                    continue
+                if budget is not None:
+                    if budget <= 0:
+                        break
+                    if len(text) > budget:
+                        self.buffer[index] = (text[budget:], tag)
+                        text = text[:budget]
+                    else:
+                        del self.buffer[index]
+                    budget -= len(text)
+                else:
+                    del self.buffer[index]
+                self.pending_chars -= len(text)
+                add(text, tag)
+        return [("".join(parts), tag) for parts, tag in segments]
+
+    def drain(self):
+        self.after_id = None
+        try:
+            segments = self.take_segments()
+            if segments:
+                self.callbacks += 1
+                self.render(segments)
+        finally:
+            if self.running:
+                self.after_id = self.root.after(self.frame_ms, self.drain)
+
+    def render(self, segments):
+        self.widget.configure(state=tk.NORMAL)
+        for text, tag in segments:
+            start = self.widget.index("end-1c") if self.on_insert else None
+            self.widget.insert(tk.END, text, tag)
+            if self.on_insert:
+                self.on_insert(start, self.widget.index("end-1c"), tag)
+            self.inserts += 1
+            self.chars_rendered += len(text)
+        self.widget.configure(state=tk.DISABLED)
+        self.widget.yview(tk.END)
+
+    def flush(self):
+        # Render everything that is buffered right now, ignoring the typewriter and frame budgets
+        typewriter, max_frame_chars = self.typewriter, self.max_frame_chars
+        self.typewriter, self.max_frame_chars = False, None
+        try:
+            segments = self.take_segments()
+        finally:
+            self.typewriter, self.max_frame_chars = typewriter, max_frame_chars
+        if segments:
+            self.callbacks += 1
+            self.render(segments)
@@ -0,0 +1,219 @@
+import ast
+import importlib
+import importlib.machinery
+import os
+import re
+import subprocess
+import sys
+import sysconfig
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Import names whose package on PyPI is called something else; the config's package_names extends this
+PACKAGE_NAMES = {
+    'bs4': "beautifulsoup4",
+    'cv2': "opencv-python",
+    'dateutil': "python-dateutil",
+    'docx': "python-docx",
+    'dotenv': "python-dotenv",
+    'fitz': "PyMuPDF",
+    'Crypto': "pycryptodome",
+    'jwt': "PyJWT",
+    'magic': "python-magic",
+    'OpenSSL': "pyOpenSSL",
+    'PIL': "Pillow",
+    'serial': "pyserial",
+    'skimage': "scikit-image",
+    'sklearn': "scikit-learn",
+    'telegram': "python-telegram-bot",
+    'usb': "pyusb",
+    'win32api': "pywin32",
+    'yaml': "PyYAML",
+    'zmq': "pyzmq",
+}
+
+# In pip's output when the index could not be reached; pip then also reports "No matching distribution"
+NETWORK_ERRORS = ("Retrying (", "NewConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ProxyError",
+                  "SSLError", "Name or service not known", "Temporary failure in name resolution")
+
+
+def canonical_name(package):
+    # As pip compares project names: case, "-", "_" and "." do not matter
+    return re.sub(r"[-_.]+", "-", package).lower()
+
+
+def is_permanent_failure(output):
+    # The index answered and has no such package (or none for this Python), as opposed to a network failure
+    return "No matching distribution found" in output and not any(error in output for error in NETWORK_ERRORS)
+
+
+def scan_imports(code):
+    # Top-level module names the code imports: import statements anywhere in it, plus __import__("x") and
+    # importlib.import_module("x") with literal names. Relative imports are skipped; so is code that does not parse.
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return set()
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if not node.level and node.module:
+                names.add(node.module.split(".")[0])
+        elif isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Constant) \
+                and isinstance(node.args[0].value, str):
+            function = node.func
+            name = function.id if isinstance(function, ast.Name) else function.attr if isinstance(function, ast.Attribute) else None
+            if name in ("__import__", "import_module") and not node.args[0].value.startswith("."):
+                names.add(node.args[0].value.split(".")[0])
+    return {name for name in names if name}
+
+
+class ToolEnvironment:
+    """A virtualenv, reused across runs and restarts, that packages for executed code are installed into.
+
+    Code still runs on the app's interpreter: the pool workers put the environment's site-packages on
+    their sys.path, so the app's own packages stay available and nothing is installed into them. Missing
+    modules are found before a run by scanning the code's imports; their packages are downloaded into
+    wheel_dir concurrently and then installed from there in one pip call. Downloaded wheels are kept, so a
+    package is fetched once and reinstalls work offline. With offline set, only wheel_dir is used; index_url
+    points pip at a local index instead of PyPI. A package the index does not have is not asked for again;
+    other failures, such as a dropped connection, are retried after retry_after seconds.
+    """
+
+    def __init__(self, path="tool_env", wheel_dir=None, index_url=None, offline=False, workers=4,
+                 package_names=None, timeout=600, retry_after=60):
+        self.path = os.path.abspath(path)
+        self.wheel_dir = os.path.abspath(wheel_dir or os.path.join(path, "wheels"))
+        self.index_url = index_url
+        self.offline = offline
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.package_names = dict(PACKAGE_NAMES, **(package_names or {}))
+        self.site_packages = sysconfig.get_path("purelib", vars={'base': self.path, 'platbase': self.path})
+        self.lock = threading.Lock()  # One install at a time; pip is not safe to run twice on one environment
+        self.installed = set()  # Packages installed since start-up
+        self.unavailable = set()  # Packages the index does not have
+        self.failed_at = {}  # Package -> time of its last failure to install for another reason
+
+    def python(self):
+        if sys.platform == "win32":
+            return os.path.join(self.path, "Scripts", "python.exe")
+        return os.path.join(self.path, "bin", "python")
+
+    def ensure(self):
+        # Without pip or system packages, which keeps creation to a fraction of a second;
+        # the app's pip installs into it with --python
+        if not os.path.exists(self.python()):
+            import venv
+            venv.EnvBuilder(with_pip=False, symlinks=sys.platform != "win32").create(self.path)
+        os.makedirs(self.site_packages, exist_ok=True)
+        os.makedirs(self.wheel_dir, exist_ok=True)
+
+    def package_for(self, module):
+        return self.package_names.get(module, module)
+
+    def is_available(self, module):
+        if module in sys.builtin_module_names or module in getattr(sys, "stdlib_module_names", ()):
+            return True
+        return importlib.machinery.PathFinder.find_spec(module, [self.site_packages] + sys.path) is not None
+
+    def missing_modules(self, code):
+        return sorted(module for module in scan_imports(code) if not self.is_available(module))
+
+    def index_args(self):
+        if self.offline:
+            return ["--no-index", "--find-links", self.wheel_dir]
+        args = ["--find-links", self.wheel_dir]
+        if self.index_url:
+            args += ["--index-url", self.index_url]
+        return args
+
+    def pip(self, *args):
+        return subprocess.run([sys.executable, "-m", "pip", "--disable-pip-version-check", "--python", self.python(), *args],
+                              capture_output=True, text=True, timeout=self.timeout)
+
+    def download(self, package):
+        # Fills the wheel cache with the package and its dependencies; a cached wheel is not fetched again.
+        # Returns (downloaded, whether the failure is permanent).
+        try:
+            completed = subprocess.run([sys.executable, "-m", "pip", "--disable-pip-version-check", "download",
+                                        "--dest", self.wheel_dir, *self.index_args(), package],
+                                       capture_output=True, text=True, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return False, False
+        if completed.returncode == 0:
+            return True, False
+        return False, is_permanent_failure(completed.stdout + completed.stderr)
+
+    def should_try(self, name, now):
+        if name in self.installed or name in self.unavailable:
+            return False
+        return now - self.failed_at.get(name, now - self.retry_after) >= self.retry_after
+
+    def install(self, packages, log=None):
+        # Returns (installed, failed). Packages installed since start-up or missing from the index are
+        # skipped, and so are packages that failed for another reason less than retry_after seconds ago.
+        with self.lock:
+            now = time.monotonic()
+            packages = [package for package in dict.fromkeys(packages) if self.should_try(canonical_name(package), now)]
+            if not packages:
+                return [], []
+            if log:
+                log(f"Installing {', '.join(packages)}...\n")
+            self.ensure()
+            unavailable = set()
+            if self.offline:
+                ready = packages
+            else:
+                with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(packages)))) as executor:
+                    downloaded = list(executor.map(self.download, packages))
+                ready = [package for package, (ok, _) in zip(packages, downloaded) if ok]
+                unavailable = {package for package, (_, permanent) in zip(packages, downloaded) if permanent}
+            installed = []
+            if ready:
+                # Everything is in the wheel cache now, so installing needs no network
+                args = ["install", "--no-index", "--find-links", self.wheel_dir]
+                try:
+                    if self.pip(*args, *ready).returncode == 0:
+                        installed = ready
+                    else:
+                        installed = [package for package in ready if self.pip(*args, package).returncode == 0]
+                except subprocess.TimeoutExpired:
+                    pass
+            importlib.invalidate_caches()
+            failed = [package for package in packages if package not in installed]
+            self.installed.update(canonical_name(package) for package in installed)
+            self.unavailable.update(canonical_name(package) for package in unavailable)
+            for package in packages:
+                if package in installed or package in unavailable:
+                    self.failed_at.pop(canonical_name(package), None)
+                else:
+                    self.failed_at[canonical_name(package)] = time.monotonic()
+            if log and failed:
+                log(f"Could not install {', '.join(failed)}.\n")
+            return installed, failed
+
+    def resolve(self, code, log=None):
+        # Installs the packages for every module the code imports that cannot be found.
+        # Returns the modules that are still missing.
+        missing = self.missing_modules(code)
+        if missing:
+            self.install([self.package_for(module) for module in missing], log)
+        return [module for module in missing if not self.is_available(module)]
+
+
+def create_tool_environment(dependencies_config):
+    # dependencies_config is the "dependencies" config section; returns None when installs go to the app's interpreter
+    if not dependencies_config.get("enabled", True):
+        return None
+    path = dependencies_config.get("environment", "tool_env")
+    return ToolEnvironment(path, wheel_dir=dependencies_config.get("wheel_cache", os.path.join(path, "wheels")),
+                           index_url=dependencies_config.get("index_url"),
+                           offline=dependencies_config.get("offline", False),
+                           workers=dependencies_config.get("install_workers", 4),
+                           package_names=dependencies_config.get("package_names", {}),
+                           retry_after=dependencies_config.get("retry_after", 60))
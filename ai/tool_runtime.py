@@ -0,0 +1,364 @@
+import itertools
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from json import dumps, loads
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class Response:
+    """An HTTP response as tools see it: status, headers and the whole body, read up front."""
+
+    def __init__(self, url, status, reason="", headers=None, body=b"", from_cache=False):
+        self.url = url
+        self.status = status
+        self.status_code = status  # As requests calls it
+        self.reason = reason
+        # Header names in one spelling, so lookups do not depend on how the server wrote them
+        self.headers = {"-".join(word.capitalize() for word in name.split("-")): value
+                        for name, value in dict(headers or {}).items()}
+        self.body = body
+        self.content = body
+        self.from_cache = from_cache
+
+    @property
+    def ok(self):
+        return 200 <= self.status < 400
+
+    @property
+    def text(self):
+        content_type = self.headers.get("Content-Type", "")
+        charset = content_type.split("charset=")[-1].split(";")[0].strip() if "charset=" in content_type else "utf-8"
+        return self.body.decode(charset or "utf-8", errors="replace")
+
+    def json(self):
+        return loads(self.text)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise OSError(f"HTTP {self.status} {self.reason} for {self.url}")
+
+    def as_dict(self):
+        return {'url': self.url, 'status': self.status, 'reason': self.reason, 'headers': self.headers,
+                'body': self.body, 'from_cache': self.from_cache}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class HostRateLimiter:
+    """Spaces requests to each host to `rate` per second on average, allowing bursts of up to `burst`."""
+
+    def __init__(self, rate=5.0, burst=5, rates=None):
+        self.rate = rate
+        self.burst = burst
+        self.rates = dict(rates or {})  # host -> requests per second, overriding rate
+        self.lock = threading.Lock()
+        self.buckets = {}  # host -> [tokens, time of last update]
+
+    def wait(self, host):
+        # Blocks until a request to host is allowed; returns the seconds waited
+        rate = self.rates.get(host, self.rate)
+        if not rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            tokens, updated = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * rate) - 1
+            self.buckets[host] = (tokens, now)  # Below zero reserves a slot for this caller
+        delay = -tokens / rate if tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class ConnectionPool:
+    """Idle keep-alive connections per (scheme, host, port), so repeated requests skip TCP and TLS setup."""
+
+    def __init__(self, max_idle=4, timeout=20):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}  # (scheme, host, port) -> [connection]
+
+    def get(self, key):
+        # Returns (connection, whether it was reused)
+        with self.lock:
+            connections = self.idle.get(key)
+            if connections:
+                return connections.pop(), True
+        import http.client  # Deferred with the ssl module it brings in, like other network imports
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def put(self, key, connection):
+        connection.timeout = self.timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(self.timeout)
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.max_idle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+class ToolRuntime:
+    """HTTP for executed code and utility tools, shared by every worker process through the app.
+
+    GET responses are cached for ttl seconds, and identical GETs that arrive while one is being fetched
+    wait for that fetch instead of making their own, so tools polling the same feed cost one request.
+    Requests go over pooled keep-alive connections and each host is rate-limited. Worker processes reach
+    it through serve(); stats() reports fetches, cache hits and connection reuse. call_timeout is how
+    long a worker's RuntimeClient waits for an answer before raising in the calling code.
+    """
+
+    def __init__(self, ttl=10, max_entries=256, rate=5.0, burst=5, rates=None, max_idle=4, timeout=20,
+                 max_bytes=20 * 1024 * 1024, workers=8, call_timeout=60):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.call_timeout = call_timeout
+        self.limiter = HostRateLimiter(rate, burst, rates)
+        self.connections = ConnectionPool(max_idle, timeout)
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # (url, headers) -> (fetched at, Response), least recently used first
+        self.in_flight = {}  # (url, headers) -> Future of the fetch in progress
+        self.counts = {'requests': 0, 'fetches': 0, 'cache_hits': 0, 'coalesced': 0, 'errors': 0,
+                       'connections_opened': 0, 'connections_reused': 0, 'rate_limited': 0}
+        self.host_fetches = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool-runtime")
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    def request(self, method="GET", url="", headers=None, body=None, ttl=None, timeout=None):
+        ttl = self.ttl if ttl is None else ttl
+        headers = dict(headers or {})
+        self.count('requests')
+        if method.upper() != "GET" or body is not None:
+            return self.fetch(method.upper(), url, headers, body, timeout)
+        key = (url, tuple(sorted(headers.items())))
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and ttl > 0 and time.monotonic() - entry[0] < ttl:
+                self.cache.move_to_end(key)
+                self.counts['cache_hits'] += 1
+                return Response(**dict(entry[1].as_dict(), from_cache=True))
+            future = self.in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_flight[key] = Future()
+            else:
+                self.counts['coalesced'] += 1
+        if not owner:
+            return Response(**dict(future.result().as_dict(), from_cache=True))
+        try:
+            response = self.fetch("GET", url, headers, None, timeout)
+        except Exception as e:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            # Cached in the same step that ends the fetch, so no request slips between the two
+            if 200 <= response.status < 300:
+                self.cache[key] = (time.monotonic(), response)
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.max_entries:
+                    self.cache.popitem(last=False)
+            self.in_flight.pop(key, None)
+        future.set_result(response)
+        return response
+
+    def fetch(self, method, url, headers, body, timeout=None, redirects=5):
+        try:
+            for _ in range(redirects + 1):
+                response = self.fetch_once(method, url, headers, body, timeout)
+                if response.status not in REDIRECT_STATUSES or "Location" not in response.headers:
+                    return response
+                url = urllib.parse.urljoin(url, response.headers["Location"])
+                if response.status == 303 or (response.status in (301, 302) and method == "POST"):
+                    method, body = "GET", None
+            return response
+        except Exception:
+            self.count('errors')
+            raise
+
+    def fetch_once(self, method, url, headers, body, timeout=None):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            raise ValueError(f"Unsupported URL: {url}")
+        key = (parts.scheme, parts.hostname, parts.port)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        if self.limiter.wait(parts.hostname):
+            self.count('rate_limited')
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        for attempt in range(2):
+            connection, reused = self.connections.get(key)
+            self.count('connections_reused' if reused else 'connections_opened')
+            if timeout is not None:
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read(self.max_bytes + 1)
+            except OSError as e:
+                connection.close()
+                # A kept-alive connection the server has since closed fails on first use; retry on a new one
+                if reused and attempt == 0 and not isinstance(e, TimeoutError):
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if len(data) > self.max_bytes:
+                connection.close()
+                raise OSError(f"Response from {url} is larger than {self.max_bytes} bytes")
+            if response.will_close:
+                connection.close()
+            else:
+                self.connections.put(key, connection)
+            with self.lock:
+                self.counts['fetches'] += 1
+                self.host_fetches[parts.hostname] = self.host_fetches.get(parts.hostname, 0) + 1
+            return Response(url, response.status, response.reason, response.getheaders(), data)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts, hosts=dict(self.host_fetches), cached=len(self.cache))
+        gets = stats['fetches'] + stats['cache_hits'] + stats['coalesced']
+        stats['hit_rate'] = (stats['cache_hits'] + stats['coalesced']) / gets if gets else 0.0
+        return stats
+
+    def describe(self):
+        stats = self.stats()
+        return (f"HTTP: {stats['requests']} requests, {stats['fetches']} fetched, "
+                f"{stats['cache_hits'] + stats['coalesced']} shared ({stats['hit_rate']:.0%}), "
+                f"{stats['connections_reused']} on kept-alive connections, {stats['errors']} errors")
+
+    def serve(self, call, send):
+        # Answers a call from a worker process's RuntimeClient on a runtime thread; send(reply) delivers it
+        def answer():
+            try:
+                if call['method'] == 'stats':
+                    result = self.stats()
+                else:
+                    result = self.request(**call['args']).as_dict()
+                reply = {'kind': 'reply', 'id': call['id'], 'ok': True, 'result': result}
+            except Exception as e:
+                reply = {'kind': 'reply', 'id': call['id'], 'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            try:
+                send(reply)
+            except (OSError, EOFError):
+                pass  # The worker was stopped meanwhile
+        self.executor.submit(answer)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.connections.close()
+
+
+class RuntimeClient:
+    """The `runtime` object in executed code's namespace; each call is answered by the app's ToolRuntime.
+
+    runtime.get(url, ttl=None) returns a Response with status, headers, text and json(); runtime.post()
+    sends data or json; runtime.stats() reports the shared fetch counts and cache hit rate. A call the app
+    has not answered within call_timeout seconds (or twice the request's own timeout, if longer) raises
+    TimeoutError, so a hung request cannot hang the calling code.
+    """
+
+    def __init__(self, sender, call_timeout=None):
+        self.sender = sender
+        self.call_timeout = call_timeout
+        self.ids = itertools.count(1)
+        self.condition = threading.Condition()
+        self.replies = {}
+        self.abandoned = set()  # Calls given up on; their replies are dropped when they arrive
+        self.closed = False
+
+    def call(self, name, **args):
+        call_id = next(self.ids)
+        wait = self.call_timeout
+        if wait and args.get('timeout'):
+            wait = max(wait, 2 * args['timeout'])  # Room for the retry on a fresh connection
+        self.sender.send({'kind': 'call', 'id': call_id, 'method': name, 'args': args})
+        with self.condition:
+            answered = self.condition.wait_for(lambda: call_id in self.replies or self.closed, timeout=wait or None)
+            reply = self.replies.pop(call_id, None)
+            if not answered:
+                self.abandoned.add(call_id)
+        if not answered:
+            raise TimeoutError(f"runtime.{name} got no answer from the app within {wait:g}s")
+        if reply is None:
+            raise ConnectionError("The app closed the connection to this process")
+        if not reply['ok']:
+            raise ConnectionError(reply['error'])
+        return reply['result']
+
+    def deliver(self, reply):
+        with self.condition:
+            if reply['id'] in self.abandoned:
+                self.abandoned.discard(reply['id'])
+                return
+            self.replies[reply['id']] = reply
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def request(self, method, url, headers=None, body=None, ttl=None, timeout=None):
+        return Response.from_dict(self.call('request', method=method, url=url, headers=headers, body=body,
+                                            ttl=ttl, timeout=timeout))
+
+    def get(self, url, params=None, headers=None, ttl=None, timeout=None):
+        if params:
+            url += ("&" if urllib.parse.urlsplit(url).query else "?") + urllib.parse.urlencode(params)
+        return self.request("GET", url, headers, ttl=ttl, timeout=timeout)
+
+    def get_json(self, url, params=None, headers=None, ttl=None, timeout=None):
+        return self.get(url, params, headers, ttl, timeout).json()
+
+    def post(self, url, data=None, json=None, headers=None, timeout=None):
+        headers = dict(headers or {})
+        if json is not None:
+            data = dumps(json)
+            headers.setdefault("Content-Type", "application/json")
+        return self.request("POST", url, headers, data, timeout=timeout)
+
+    def stats(self):
+        return self.call('stats')
+
+
+def create_tool_runtime(runtime_config):
+    # runtime_config is the "tool_runtime" config section; returns None when executed code gets no runtime
+    if not runtime_config.get("enabled", True):
+        return None
+    return ToolRuntime(ttl=runtime_config.get("ttl", 10),
+                       max_entries=runtime_config.get("max_entries", 256),
+                       rate=runtime_config.get("rate", 5.0),
+                       burst=runtime_config.get("burst", 5),
+                       rates=runtime_config.get("host_rates", {}),
+                       max_idle=runtime_config.get("max_idle_connections", 4),
+                       timeout=runtime_config.get("timeout", 20),
+                       call_timeout=runtime_config.get("call_timeout", 60))
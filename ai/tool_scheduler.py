@@ -0,0 +1,208 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from code_runner import ExecutionPool
+
+MODES = ("once", "interval", "daemon")
+
+
+class ToolStatus:
+    def __init__(self, name, mode="once", interval=60):
+        self.name = name
+        self.mode = mode
+        self.interval = interval
+        self.state = "idle"  # idle, scheduled, running, stopped, failed
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+        self.runs = 0
+        self.skipped = 0  # Interval ticks skipped because the previous run was still going
+        self.next_run = None
+
+    def describe(self):
+        parts = [f"{self.name} [{self.mode}] {self.state}"]
+        if self.last_run:
+            parts.append(f"last {time.strftime('%H:%M:%S', time.localtime(self.last_run))}")
+        if self.last_duration is not None:
+            parts.append(f"{self.last_duration:.1f}s")
+        if self.next_run and self.state == "scheduled":
+            parts.append(f"next in {max(0, self.next_run - time.time()):.0f}s")
+        if self.last_error:
+            parts.append(f"error: {self.last_error}")
+        return ", ".join(parts)
+
+
+class ToolScheduler:
+    """Runs utility tools off the Tk thread: once, on an interval, or as long-lived daemons.
+
+    Once and interval runs share a small pool of warm worker processes; each daemon gets its
+    own process so it can be stopped without affecting the others.
+    """
+
+    def __init__(self, workers=2, timeout=60, output_factory=None, environment=None, runtime=None):
+        self.workers = workers
+        self.timeout = timeout
+        self.environment = environment  # ToolEnvironment that missing packages are installed into, or None
+        self.site_packages = environment.site_packages if environment is not None else None
+        self.runtime = runtime  # ToolRuntime shared with the chat's code runs, so tools share fetches and connections
+        # name -> object with feed(stream, lines), write(text, tag), close(), or None; called on the scheduler's threads
+        self.output_factory = output_factory
+        self.pool = None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool")
+        self.statuses = {}
+        self.daemons = {}  # name -> dedicated ExecutionPool
+        self.runs = {}  # name -> run id in the shared pool of a once or interval run in progress
+        self.schedule = []  # heap of (due time, sequence, status, code)
+        self.sequence = 0
+        self.lock = threading.Condition()
+        self.running = True
+        self.timer = threading.Thread(target=self.run_timer, name="tool-scheduler", daemon=True)
+        self.timer.start()
+
+    def shared_pool(self):
+        # Created on first use so the app does not pay for tool workers it never needs
+        with self.lock:
+            if self.pool is None:
+                self.pool = ExecutionPool(size=self.workers, timeout=self.timeout, site_packages=self.site_packages,
+                                          runtime=self.runtime)
+            return self.pool
+
+    def status(self, name):
+        return self.statuses.get(name)
+
+    def start(self, name, code, mode="once", interval=60):
+        if mode not in MODES:
+            raise ValueError(f"Unknown tool mode '{mode}'")
+        self.stop(name)
+        with self.lock:
+            status = ToolStatus(name, mode, interval)
+            self.statuses[name] = status
+            if mode == "interval":
+                self.schedule_run(status, code, time.time())
+                return status
+        if mode == "daemon":
+            threading.Thread(target=self.run_daemon, args=(status, code), name=f"tool-{name}", daemon=True).start()
+        else:
+            self.executor.submit(self.run_once, status, code)
+        return status
+
+    def stop(self, name):
+        with self.lock:
+            status = self.statuses.get(name)
+            if status is None:
+                return
+            if status.state in ("scheduled", "running"):
+                status.state = "stopped"
+            status.next_run = None
+            daemon_pool = self.daemons.pop(name, None)
+            run_id = self.runs.pop(name, None)
+            self.lock.notify()
+        if daemon_pool is not None:
+            daemon_pool.shutdown()
+        if run_id is not None:
+            self.pool.kill(run_id)
+
+    def schedule_run(self, status, code, due):
+        if status.state != "running":
+            status.state = "scheduled"
+        status.next_run = due
+        self.sequence += 1
+        heapq.heappush(self.schedule, (due, self.sequence, status, code))
+        self.lock.notify()
+
+    def run_timer(self):
+        while True:
+            with self.lock:
+                while self.running and (not self.schedule or self.schedule[0][0] > time.time()):
+                    self.lock.wait(self.schedule[0][0] - time.time() if self.schedule else None)
+                if not self.running:
+                    return
+                due, _, status, code = heapq.heappop(self.schedule)
+                # Entries left behind by stop() or a restart of the same tool are simply dropped
+                if self.statuses.get(status.name) is not status or status.next_run != due:
+                    continue
+                if status.state == "running":
+                    status.skipped += 1
+                else:
+                    self.executor.submit(self.run_once, status, code)
+                self.schedule_run(status, code, due + status.interval)
+
+    def run_once(self, status, code):
+        # Checked and claimed under the lock, like stop() does its update, so a stop or another run of the
+        # tool that lands meanwhile is not overwritten
+        with self.lock:
+            if status.state == "stopped" or self.statuses.get(status.name) is not status:
+                return
+            if status.state == "running":
+                status.skipped += 1  # An interval run queued behind the previous one, which is still going
+                return
+            status.state = "running"
+        output = self.output_factory(status.name) if self.output_factory else None
+        self.install_imports(code, output)
+        pool = self.shared_pool()
+        run_ids = []
+
+        def started(run_id):
+            # Registered like a daemon's pool, so stop() can kill the run instead of waiting out tool_timeout
+            with self.lock:
+                stopped = status.state == "stopped" or self.statuses.get(status.name) is not status
+                if not stopped:
+                    self.runs[status.name] = run_id
+                    run_ids.append(run_id)
+            if stopped:
+                pool.kill(run_id)
+        result = pool.run(code, on_output=output.feed if output else None, on_start=started)
+        with self.lock:
+            if run_ids and self.runs.get(status.name) == run_ids[0]:
+                del self.runs[status.name]
+        self.record(status, result, output)
+
+    def run_daemon(self, status, code):
+        pool = ExecutionPool(size=1, timeout=0, cpu_seconds=0, site_packages=self.site_packages, runtime=self.runtime)
+        with self.lock:
+            if status.state == "stopped" or self.statuses.get(status.name) is not status:
+                pool.shutdown()
+                return
+            self.daemons[status.name] = pool
+            status.state = "running"
+        output = self.output_factory(status.name) if self.output_factory else None
+        self.install_imports(code, output)
+        result = pool.run(code, on_output=output.feed if output else None)
+        with self.lock:
+            if self.daemons.get(status.name) is pool:
+                del self.daemons[status.name]
+        pool.shutdown()
+        self.record(status, result, output)
+
+    def install_imports(self, code, output):
+        if self.environment is not None:
+            self.environment.resolve(code, log=(lambda text: output.write(text, "result")) if output else None)
+
+    def record(self, status, result, output):
+        with self.lock:
+            status.runs += 1
+            status.last_run = time.time() - result.duration
+            status.last_duration = result.duration
+            status.last_error = None if result.ok or result.killed else result.error_message
+            if status.state == "running":
+                if not result.ok and not result.killed:
+                    status.state = "failed"
+                elif status.mode == "interval" and status.next_run:
+                    status.state = "scheduled"
+                else:
+                    status.state = "idle"
+        if output is not None:
+            if status.last_error:
+                output.write(f"Tool '{status.name}' failed: {status.last_error}\n", "error")
+            output.close()
+
+    def shutdown(self):
+        with self.lock:
+            self.running = False
+            self.lock.notify()
+        for name in list(self.statuses):
+            self.stop(name)
+        self.executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.shutdown()
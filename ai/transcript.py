@@ -0,0 +1,283 @@
+import json
+import re
+import time
+from collections import deque
+
+ROLE_BY_TAG = {"user": "user", "ollama": "assistant", "code": "assistant", "fence": "assistant",
+               "result": "output", "error": "error"}
+WORD_PATTERN = re.compile(r"\w+")
+
+
+class TranscriptEntry:
+    def __init__(self, entry_id, role):
+        self.id = entry_id
+        self.role = role  # user, assistant, output or error
+        self.parts = []  # (text, tag) runs, in display order
+        self.created = time.time()
+        self.lines = 0  # Newlines in the entry, so the view can size it without asking the widget
+        self.loaded = True  # Whether the entry is currently in the widget
+
+    @property
+    def text(self):
+        return "".join(text for text, _ in self.parts)
+
+    @property
+    def mark(self):
+        # Entries loaded from a saved session can have negative ids, and "-" would read as an index offset
+        return f"entry{self.id}" if self.id >= 0 else f"entry_{-self.id}"
+
+    def add(self, text, tag):
+        if self.parts and self.parts[-1][1] == tag:
+            self.parts[-1] = (self.parts[-1][0] + text, tag)
+        else:
+            self.parts.append((text, tag))
+        self.lines += text.count("\n")
+
+
+class Transcript:
+    """Everything shown in the chat, as entries with a role, instead of text to be re-read from the widget.
+
+    Text is appended as (text, tag) runs; a change of role starts a new entry. Finished entries are
+    added to a word index, so search looks up candidate entries instead of scanning the whole session.
+    At most max_entries are kept; the oldest are dropped first.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.entries = deque()
+        self.max_entries = max_entries
+        self.next_id = 0
+        self.words = {}  # word -> set of entry ids
+        self.last_user = None  # The newest user entry, for copying the latest reply
+
+    def append(self, text, tag):
+        role = ROLE_BY_TAG.get(tag, "assistant")
+        entry = self.entries[-1] if self.entries else None
+        if entry is None or entry.role != role:
+            if entry is not None:
+                self.index_entry(entry)
+            entry = TranscriptEntry(self.next_id, role)
+            self.next_id += 1
+            self.entries.append(entry)
+            if role == "user":
+                self.last_user = entry
+            while len(self.entries) > self.max_entries:
+                self.forget(self.entries.popleft())
+        entry.add(text, tag)
+        return entry
+
+    def prepend(self, messages):
+        # Adds earlier messages, [[(text, tag)]] oldest first, in front of everything else, not yet loaded
+        added = []
+        for parts in reversed(messages):
+            if len(self.entries) >= self.max_entries:
+                break
+            entry_id = self.entries[0].id - 1 if self.entries else self.next_id
+            if not self.entries:
+                self.next_id += 1
+            entry = TranscriptEntry(entry_id, ROLE_BY_TAG.get(parts[0][1], "assistant"))
+            for text, tag in parts:
+                entry.add(text, tag)
+            entry.loaded = False
+            self.entries.appendleft(entry)
+            if len(self.entries) > 1:
+                self.index_entry(entry)  # The newest entry is indexed once it is finished, like any other
+            if entry.role == "user" and self.last_user is None:
+                self.last_user = entry
+            added.append(entry)
+        return added[::-1]
+
+    def index_entry(self, entry):
+        for word in set(WORD_PATTERN.findall(entry.text.lower())):
+            self.words.setdefault(word, set()).add(entry.id)
+
+    def forget(self, entry):
+        for word in set(WORD_PATTERN.findall(entry.text.lower())):
+            ids = self.words.get(word)
+            if ids is not None:
+                ids.discard(entry.id)
+                if not ids:
+                    del self.words[word]
+
+    def get(self, entry_id):
+        if not self.entries or entry_id < self.entries[0].id:
+            return None
+        position = entry_id - self.entries[0].id  # Ids are consecutive, so this is a direct lookup
+        return self.entries[position] if position < len(self.entries) else None
+
+    def latest_reply(self):
+        # Everything shown since the last user message: the reply, code output and errors
+        if self.last_user is None or self.get(self.last_user.id) is None:
+            return ""
+        start = self.last_user.id - self.entries[0].id + 1
+        return "".join(self.entries[position].text for position in range(start, len(self.entries)))
+
+    def search(self, query):
+        # Entries containing query (case-insensitive), oldest first
+        query = query.lower()
+        words = list(WORD_PATTERN.finditer(query))
+        if words:
+            candidates = set.intersection(*(self.entries_with(match, len(query)) for match in words))
+        else:
+            candidates = {entry.id for entry in self.entries}
+        # The unfinished newest entry is not indexed yet
+        if self.entries:
+            candidates.add(self.entries[-1].id)
+        matches = [self.get(entry_id) for entry_id in sorted(candidates)]
+        return [entry for entry in matches if entry is not None and query in entry.text.lower()]
+
+    def entries_with(self, match, length):
+        # A word inside the query must appear whole; one at either end may be part of a longer word
+        if match.start() > 0 and match.end() < length:
+            return self.words.get(match.group(), set())
+        fragment = match.group()
+        ids = set()
+        for word, word_ids in self.words.items():
+            if fragment in word:
+                ids |= word_ids
+        return ids
+
+    def export(self, path):
+        # .jsonl writes one entry per line; anything else gets plain Markdown
+        with open(path, "w", encoding="utf-8") as f:
+            for entry in self.entries:
+                if path.endswith(".jsonl"):
+                    f.write(json.dumps({'role': entry.role, 'created': entry.created, 'text': entry.text}) + "\n")
+                elif entry.role == "user":
+                    f.write(f"**{entry.text.strip()}**\n\n")
+                elif entry.role == "assistant":
+                    f.write(f"{entry.text.strip()}\n\n")
+                else:
+                    f.write("```\n" + entry.text.strip() + "\n```\n\n")
+
+    def clear(self):
+        self.entries.clear()
+        self.words.clear()
+        self.last_user = None
+
+
+class TranscriptView:
+    """Keeps only the newest max_lines of the transcript in the Text widget.
+
+    Called from the renderer's on_insert on the Tk thread. Whole entries are deleted from the top once the
+    widget grows past max_lines, and loaded back a batch at a time when the user scrolls to the top. The
+    entries in the widget are always the newest ones, kept in their own deque so trimming never walks
+    the rest of the transcript.
+    """
+
+    def __init__(self, root, widget, transcript, max_lines=3000, highlighter=None, load_batch=20, on_top=None):
+        self.root = root
+        self.on_top = on_top  # Called when scrolled to the top with nothing older in the transcript, e.g. to page in a saved session
+        self.widget = widget
+        self.transcript = transcript
+        self.max_lines = max_lines
+        self.highlighter = highlighter
+        self.load_batch = load_batch
+        self.load_pending = False
+        self.loaded = deque()  # Entries in the widget, oldest first
+        scrollbar = getattr(widget, "vbar", None)
+        # Watch the scroll position through yscrollcommand, still updating the scrollbar
+        widget.configure(yscrollcommand=lambda first, last: self.on_scroll(scrollbar, first, last))
+
+    def on_insert(self, start, end, tag):
+        entry = self.transcript.entries[-1] if self.transcript.entries else None
+        text = self.widget.get(start, end)
+        appended = self.transcript.append(text, tag)
+        if appended is not entry:
+            self.loaded.append(appended)
+            self.widget.mark_set(appended.mark, start)
+            self.widget.mark_gravity(appended.mark, "left")
+        if self.highlighter:
+            self.highlighter.on_insert(start, end, tag)
+        if self.widget_lines() > self.max_lines + max(50, self.max_lines // 10):
+            self.trim()
+
+    def widget_lines(self):
+        return int(self.widget.index("end-1c").split(".")[0])
+
+    def trim(self):
+        # Deleting in whole entries keeps every loaded entry's mark pointing at its start. Each entry is
+        # trimmed once per load, so the work is constant per appended entry.
+        loaded = self.loaded
+        lines = self.widget_lines()
+        cut = []
+        while len(loaded) > 1 and lines - loaded[0].lines > self.max_lines:
+            lines -= loaded[0].lines
+            cut.append(loaded.popleft())
+        if not cut:
+            return
+        state = self.widget.cget("state")
+        self.widget.configure(state="normal")
+        self.widget.delete("1.0", loaded[0].mark)
+        self.widget.configure(state=state)
+        for entry in cut:
+            entry.loaded = False
+            self.widget.mark_unset(entry.mark)
+
+    def on_scroll(self, scrollbar, first, last):
+        if scrollbar is not None:
+            scrollbar.set(first, last)
+        if float(first) <= 0.0 and not self.load_pending:
+            if self.has_older():
+                self.load_pending = True
+                self.root.after_idle(self.load_older)
+            elif self.on_top:
+                self.load_pending = True
+                self.root.after_idle(self.load_earlier)
+
+    def load_earlier(self):
+        self.load_pending = False
+        self.on_top()
+
+    def has_older(self):
+        return bool(self.transcript.entries) and not self.transcript.entries[0].loaded
+
+    def load_older(self):
+        self.load_pending = False
+        entries = self.transcript.entries
+        # Ids are consecutive, so the first loaded entry's position follows from the ids
+        first_loaded = self.loaded[0].id - entries[0].id if self.loaded and entries else len(entries)
+        batch = [entries[position] for position in range(max(0, first_loaded - self.load_batch), first_loaded)]
+        if not batch:
+            return
+        self.widget.mark_set("view_top", "@0,0")  # Right gravity: stays with the text the user is looking at
+        following = self.loaded[0] if self.loaded else None
+        if following:
+            self.widget.mark_gravity(following.mark, "right")  # Its mark is at 1.0 and must move down too
+        state = self.widget.cget("state")
+        self.widget.configure(state="normal")
+        arguments = []
+        for entry in batch:
+            for text, tag in entry.parts:
+                arguments.extend((text, tag))
+        self.widget.insert("1.0", *arguments)
+        self.widget.configure(state=state)
+        if following:
+            self.widget.mark_gravity(following.mark, "left")
+        offset = 0
+        self.loaded.extendleft(reversed(batch))
+        for entry in batch:
+            entry.loaded = True
+            self.widget.mark_set(entry.mark, f"1.0 + {offset} chars")
+            self.widget.mark_gravity(entry.mark, "left")
+            for text, tag in entry.parts:
+                if tag == "code" and self.highlighter:
+                    self.highlighter.highlight_range(self.widget.index(f"1.0 + {offset} chars"),
+                                                     self.widget.index(f"1.0 + {offset + len(text)} chars"))
+                offset += len(text)
+        self.widget.yview("view_top")
+
+    def show(self, entry):
+        # Loads older entries until entry is in the widget, then scrolls to it
+        while not entry.loaded and self.has_older():
+            self.load_older()
+        if entry.loaded:
+            self.widget.see(entry.mark)
+        return entry.loaded
+
+    def clear(self):
+        for entry in self.loaded:
+            self.widget.mark_unset(entry.mark)
+        self.loaded.clear()
+        self.transcript.clear()
+        if self.highlighter:
+            self.highlighter.reset()
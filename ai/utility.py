@@ -1,24 +1,17 @@
-import re
-import io
+import sys
 import subprocess
-import contextlib
+from code_fences import FenceParser
 
 class Utility:
     @staticmethod
     def extract_code_block(message):
-        code_block_match = re.search(r"```python(.*?)```", message, re.DOTALL)
-        return code_block_match.group(1).strip() if code_block_match else None
+        blocks = Utility.extract_code_blocks(message)
+        return blocks[0] if blocks else None
 
     @staticmethod
-    def execute_code(code, globals_dict, cleanup_func):
-        output = io.StringIO()
-        try:
-            with contextlib.redirect_stdout(output):
-                exec(code, globals_dict)
-            return output.getvalue()
-        finally:
-            output.close()
-            cleanup_func()
+    def extract_code_blocks(message):
+        # Python blocks tagged python/py/python3, or untagged ones that parse as Python
+        return [block.code.strip() for block in FenceParser.parse(message) if block.is_python and block.code.strip()]
 
     @staticmethod
     def install_package(package_name):